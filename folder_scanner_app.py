@@ -14,14 +14,223 @@
 
 import os
 import time
-import re
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from tkcalendar import Calendar
 import threading
+import queue
+from bisect import bisect_right
+import scan_engine
+import scan_checkpoint
+import scan_export
+import scan_index
+import scan_shard
+import scan_snapshot
+import scan_watch
 from datetime import datetime, timedelta
 
+class VirtualTable(ttk.Frame):
+    """A sortable Treeview that only materializes the rows currently on screen.
+
+    The records live in a plain list (the record store); the Treeview only
+    ever holds one screenful of items, which are refilled on scroll, so memory
+    and redraw cost stay flat no matter how many records there are.
+    """
+
+    def __init__(self, parent, columns, on_activate=None, record_id=id, **kwargs):
+        """columns: list of (id, heading, width, sort_key, formatter).
+
+        record_id(record) identifies a record across append() / replace(), so
+        the selection stays on the same record while rows move.
+        """
+        super().__init__(parent, **kwargs)
+        self.columns = columns
+        self.on_activate = on_activate
+        self.record_id = record_id
+        self._selected_id = None
+        self.records = []
+        self._headings = {c[0]: c[1] for c in columns}
+        self._view = self.records       # records in display order
+        self._keys = None               # ascending sort keys when sorted
+        self._sort_column = None
+        self._sort_reverse = False
+        self._offset = 0
+        self._rows = 20
+        self._row_records = []
+        self.follow_tail = True
+
+        self.tree = ttk.Treeview(self, columns=[c[0] for c in columns], show="headings", selectmode="browse")
+        for col_id, heading, width, _, _ in columns:
+            self.tree.heading(col_id, text=heading, command=lambda c=col_id: self.sort_by(c))
+            self.tree.column(col_id, width=width, stretch=(col_id == columns[0][0]))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        self.tree.bind("<Next>", lambda e: self.scroll(1, "pages"))
+        self.tree.bind("<Double-1>", self._on_double_click)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+    def set_heading(self, col_id, text):
+        self._headings[col_id] = text
+        self._update_headings()
+
+    def _update_headings(self):
+        for col_id in self._headings:
+            arrow = ""
+            if col_id == self._sort_column:
+                arrow = " ▼" if self._sort_reverse else " ▲"
+            self.tree.heading(col_id, text=self._headings[col_id] + arrow)
+
+    def clear(self):
+        self._selected_id = None
+        self.records = []
+        self._view = self.records
+        self._keys = None
+        self._sort_column = None
+        self._offset = 0
+        self.follow_tail = True
+        self._update_headings()
+        self.refresh()
+
+    def append(self, new_records):
+        self.records.extend(new_records)
+        if self._keys is not None:
+            key = self._column(self._sort_column)[3]
+            for record in new_records:
+                k = key(record)
+                i = bisect_right(self._keys, k)
+                self._keys.insert(i, k)
+                self._view.insert(i, record)
+        if self.follow_tail:
+            self._offset = max(0, len(self._view) - self._rows)
+        self.refresh()
+
+    def replace(self, records):
+        """Swaps in a new record set, keeping the sort order and scroll position."""
+        self.records = list(records)
+        if self._keys is not None:
+            key = self._column(self._sort_column)[3]
+            self._view = sorted(self.records, key=key)
+            self._keys = [key(r) for r in self._view]
+        else:
+            self._view = self.records
+        self.refresh()
+
+    def sort_by(self, col_id):
+        if self._sort_column == col_id:
+            self._sort_reverse = not self._sort_reverse
+        else:
+            self._sort_column = col_id
+            self._sort_reverse = False
+        key = self._column(col_id)[3]
+        self._view = sorted(self.records, key=key)
+        self._keys = [key(r) for r in self._view]
+        self._update_headings()
+        self._offset = 0
+        self.follow_tail = False
+        self.refresh()
+
+    def selected(self):
+        """The selected record, or None (also once it is gone from the records)."""
+        if self._selected_id is None:
+            return None
+        for record in self._row_records:
+            if self.record_id(record) == self._selected_id:
+                return record
+        # Scrolled off screen
+        return next((r for r in self.records if self.record_id(r) == self._selected_id), None)
+
+    def scroll(self, amount, what):
+        step = self._rows if what == "pages" else 1
+        self._set_offset(self._offset + int(amount) * step)
+
+    def refresh(self):
+        """Refills the on-screen rows from the record store."""
+        total = len(self._view)
+        start = min(self._offset, max(0, total - self._rows))
+        end = min(total, start + self._rows)
+        if self._sort_reverse and self._keys is not None:
+            self._row_records = [self._view[total - 1 - i] for i in range(start, end)]
+        else:
+            self._row_records = self._view[start:end]
+
+        items = self.tree.get_children()
+        for i, record in enumerate(self._row_records):
+            values = [fmt(record) for _, _, _, _, fmt in self.columns]
+            iid = str(i)
+            if i < len(items):
+                self.tree.item(iid, values=values)
+            else:
+                self.tree.insert("", tk.END, iid=iid, values=values)
+        if len(items) > len(self._row_records):
+            self.tree.delete(*items[len(self._row_records):])
+        # Items are screen positions: move the highlight with the selected record
+        selected_iid = next((str(i) for i, record in enumerate(self._row_records)
+                             if self.record_id(record) == self._selected_id), None)
+        if selected_iid is not None:
+            if self.tree.selection() != (selected_iid,):
+                self.tree.selection_set(selected_iid)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+
+        if total:
+            self.scrollbar.set(start / total, end / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _column(self, col_id):
+        return next(c for c in self.columns if c[0] == col_id)
+
+    def _set_offset(self, offset):
+        max_offset = max(0, len(self._view) - self._rows)
+        self._offset = max(0, min(offset, max_offset))
+        self.follow_tail = self._offset >= max_offset and self._keys is None
+        self.refresh()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self._set_offset(int(float(args[1]) * len(self._view)))
+        elif args[0] == "scroll":
+            self.scroll(args[1], args[2])
+
+    def _on_resize(self, event):
+        style = ttk.Style()
+        row_height = int(style.lookup("Treeview", "rowheight") or 20)
+        # Leave room for the heading row
+        self._rows = max(1, (event.height - 25) // row_height)
+        self.refresh()
+
+    def _on_select(self, event=None):
+        # Empty when refresh() moved the highlight off screen: the record stays selected
+        selection = self.tree.selection()
+        if selection and int(selection[0]) < len(self._row_records):
+            self._selected_id = self.record_id(self._row_records[int(selection[0])])
+
+    def _on_double_click(self, event):
+        iid = self.tree.identify_row(event.y)
+        if iid and self.on_activate is not None and int(iid) < len(self._row_records):
+            # The row under the pointer now, not whatever was at that position before
+            record = self._row_records[int(iid)]
+            self._selected_id = self.record_id(record)
+            self.on_activate(record)
+
+
 class FolderScannerApp:
+    # "Date Folders By" choices -> scan_engine.scan(activity=...)
+    ACTIVITY_CHOICES = {
+        "Folder's own date": None,
+        "Newest file modified": "mtime",
+        "Newest file changed": "ctime",
+        "Newest file accessed": "atime",
+        "Newest of any date": "any",
+    }
+
     def __init__(self, root):
         self.root = root
         self.root.title("📁 Folder Capacity Scanner")
@@ -33,18 +242,77 @@ class FolderScannerApp:
         self.is_running = False
         self.stop_event = threading.Event()
 
+        # Worker -> GUI channel, drained by poll_ui_queue (see post_log)
+        self.ui_queue = queue.Queue()
+        self._latest_status = None
+
+        self.scan_mode = "dormant"
+        self.scan_size_mb = 0
+        self.scan_horizon = ""
+        self.scan_reference_date = ""
+        self.scan_activity = None
+        # scan_engine.ScanMetrics of the running (or last) scan
+        self.scan_metrics = None
+        # scan_checkpoint.ScanCheckpoint of the running scan (None for Expand)
+        self.scan_checkpoint = None
+        # scan_engine.ScanTable of the last full scan, for instant re-filtering
+        self.scan_table = None
+        # Settings of that scan that change folder sizes (see size_settings);
+        # the table can't be re-filtered for others, and they are saved with a snapshot
+        self.scan_size_settings = {}
+        # Shared with the running scan, so the throttle settings apply live
+        self.scan_throttle = scan_engine.ScanThrottle()
+
         # --- Variables ---
         self.path_var = tk.StringVar()
+        self.live_report_var = tk.StringVar()
+        self.exclude_var = tk.StringVar()
+        self.include_var = tk.StringVar()
+        self.one_file_system_var = tk.BooleanVar(value=False)
         self.mode_var = tk.StringVar(value="dormant")
         self.timeframe_var = tk.StringVar(value="1 Year")
         self.date_var = tk.StringVar(value=datetime.now().strftime("%d-%m-%Y"))
         self.size_dropdown_var = tk.StringVar(value="1 GB")
         self.size_manual_var = tk.StringVar(value="1000")
+        self.workers_var = tk.StringVar(value="4")
+        self.use_processes_var = tk.BooleanVar(value=False)
+        self.fd_relative_var = tk.BooleanVar(value=scan_engine.FD_RELATIVE_SUPPORTED)
+        self.use_index_var = tk.BooleanVar(value=False)
+        self.keep_table_var = tk.BooleanVar(value=True)
+        self.log_cap_var = tk.StringVar(value="5000")
+        self.accounting_var = tk.StringVar(value="Apparent size")
+        self.dedupe_links_var = tk.BooleanVar(value=False)
+        self.outermost_var = tk.BooleanVar(value=False)
+        self.top_n_var = tk.StringVar(value="0")
+        self.top_by_var = tk.StringVar(value="Largest")
+        self.activity_var = tk.StringVar(value="Folder's own date")
+        self.throttle_rate_var = tk.StringVar(value="0")
+        self.throttle_concurrency_var = tk.StringVar(value="0")
+        self.throttle_latency_var = tk.StringVar(value="0")
+        for var in (self.throttle_rate_var, self.throttle_concurrency_var, self.throttle_latency_var):
+            var.trace_add("write", self.on_throttle_change)
+        for var in (self.exclude_var, self.include_var, self.one_file_system_var, self.accounting_var,
+                    self.dedupe_links_var):
+            var.trace_add("write", self.on_size_settings_change)
         self.status_var = tk.StringVar(value="Ready to scan.")
+        self.metrics_var = tk.StringVar(value="")
 
         # --- Menu Bar ---
         self.menu_bar = tk.Menu(root)
         self.root.config(menu=self.menu_bar)
+        self.cache_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.menu_bar.add_cascade(label="Scan Cache", menu=self.cache_menu)
+        self.cache_menu.add_checkbutton(label="Use Incremental Cache", variable=self.use_index_var)
+        self.cache_menu.add_checkbutton(label="Keep Folder Table (Instant Re-filter)", variable=self.keep_table_var)
+        self.cache_menu.add_separator()
+        self.cache_menu.add_command(label="Rebuild Cache for Target & Scan", command=self.rebuild_index)
+        self.cache_menu.add_command(label="Clear Entire Cache", command=self.clear_index)
+        self.cache_menu.add_separator()
+        self.cache_menu.add_command(label="Save Scan Metrics (JSON)...", command=self.save_metrics)
+        self.cache_menu.add_command(label="Open Sharded Scan Results...", command=self.load_shard_results)
+        self.cache_menu.add_separator()
+        self.cache_menu.add_command(label="Save Folder Snapshot...", command=self.save_snapshot)
+        self.cache_menu.add_command(label="Compare Two Snapshots...", command=self.compare_snapshots)
         self.help_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="Help", menu=self.help_menu)
         self.help_menu.add_command(label="How to Use", command=self.show_help)
@@ -59,10 +327,28 @@ class FolderScannerApp:
         target_frame = ttk.LabelFrame(main_frame, text="1. Scan Target", padding="10")
         target_frame.pack(fill=tk.X, pady=5)
         
-        ttk.Label(target_frame, text="Folder:").pack(side=tk.LEFT, padx=5)
-        self.path_entry = ttk.Entry(target_frame, textvariable=self.path_var)
+        folder_row = ttk.Frame(target_frame)
+        folder_row.pack(fill=tk.X)
+        ttk.Label(folder_row, text="Folder:", width=12).pack(side=tk.LEFT, padx=5)
+        self.path_entry = ttk.Entry(folder_row, textvariable=self.path_var)
         self.path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
-        ttk.Button(target_frame, text="Browse...", command=self.browse_folder).pack(side=tk.LEFT, padx=5)
+        ttk.Button(folder_row, text="Browse...", command=self.browse_folder).pack(side=tk.LEFT, padx=5)
+
+        # Optional report written row by row while the scan runs
+        report_row = ttk.Frame(target_frame)
+        report_row.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(report_row, text="Live Report:", width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Entry(report_row, textvariable=self.live_report_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(report_row, text="Browse...", command=self.browse_live_report).pack(side=tk.LEFT, padx=5)
+
+        # Folders that are never walked (patterns separated by ";")
+        exclude_row = ttk.Frame(target_frame)
+        exclude_row.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(exclude_row, text="Exclude:", width=12).pack(side=tk.LEFT, padx=5)
+        ttk.Entry(exclude_row, textvariable=self.exclude_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Label(exclude_row, text="Except:").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(exclude_row, textvariable=self.include_var, width=20).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(exclude_row, text="Stay on this file system", variable=self.one_file_system_var).pack(side=tk.LEFT, padx=5)
 
         # 2. Scan Logic
         logic_frame = ttk.LabelFrame(main_frame, text="2. Scan Logic", padding="10")
@@ -74,9 +360,9 @@ class FolderScannerApp:
         ttk.Label(mode_container, text="Scan Mode:", font=('bold')).pack(side=tk.LEFT, padx=5)
         
         ttk.Radiobutton(mode_container, text="Find Dormant Data (Old, Unused)", 
-                        variable=self.mode_var, value="dormant", command=self.update_date_from_dropdown).pack(side=tk.LEFT, padx=10)
+                        variable=self.mode_var, value="dormant", command=self.on_mode_change).pack(side=tk.LEFT, padx=10)
         ttk.Radiobutton(mode_container, text="Find Recent Additions (New, Fresh)", 
-                        variable=self.mode_var, value="recent", command=self.update_date_from_dropdown).pack(side=tk.LEFT, padx=10)
+                        variable=self.mode_var, value="recent", command=self.on_mode_change).pack(side=tk.LEFT, padx=10)
 
         # Grid for settings
         settings_grid = ttk.Frame(logic_frame)
@@ -92,6 +378,7 @@ class FolderScannerApp:
         ttk.Label(settings_grid, text="Reference Date:").grid(row=0, column=2, sticky=tk.W, padx=5, pady=5)
         self.date_entry = ttk.Entry(settings_grid, textvariable=self.date_var, width=12)
         self.date_entry.grid(row=0, column=3, sticky=tk.W, padx=5, pady=5)
+        self.date_entry.bind("<Return>", self.refilter)
         ttk.Button(settings_grid, text="📅", command=self.pick_date, width=3).grid(row=0, column=4, sticky=tk.W, padx=0, pady=5)
 
         # Row 1: Size
@@ -104,6 +391,57 @@ class FolderScannerApp:
         ttk.Label(settings_grid, text="Size (MB):").grid(row=1, column=2, sticky=tk.W, padx=5, pady=5)
         self.size_entry = ttk.Entry(settings_grid, textvariable=self.size_manual_var, width=12)
         self.size_entry.grid(row=1, column=3, sticky=tk.W, padx=5, pady=5)
+        self.size_entry.bind("<Return>", self.refilter)
+
+        # Row 2: Performance
+        ttk.Label(settings_grid, text="Parallel Workers:").grid(row=2, column=0, sticky=tk.W, padx=5, pady=5)
+        self.workers_spin = ttk.Spinbox(settings_grid, from_=1, to=64, textvariable=self.workers_var, width=13)
+        self.workers_spin.grid(row=2, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Checkbutton(settings_grid, text="Use separate processes", variable=self.use_processes_var).grid(row=2, column=2, columnspan=3, sticky=tk.W, padx=5, pady=5)
+
+        # Row 3: Activity Log cap (oldest lines are dropped first)
+        ttk.Label(settings_grid, text="Log Lines (max):").grid(row=3, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Spinbox(settings_grid, from_=100, to=1000000, increment=1000, textvariable=self.log_cap_var, width=13).grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
+        # Outermost matches only: confirmed folders are not walked again
+        ttk.Checkbutton(settings_grid, text="Report outermost matches only", variable=self.outermost_var).grid(row=3, column=2, columnspan=3, sticky=tk.W, padx=5, pady=5)
+
+        # Row 4: Size accounting (true on-disk usage for snapshots / sparse files)
+        ttk.Label(settings_grid, text="Size Accounting:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=5)
+        accounting_combo = ttk.Combobox(settings_grid, textvariable=self.accounting_var, state="readonly", width=15)
+        accounting_combo['values'] = ("Apparent size", "Allocated on disk")
+        accounting_combo.grid(row=4, column=1, sticky=tk.W, padx=5, pady=5)
+        if not scan_engine.ALLOCATED_SUPPORTED:
+            # Windows: no allocated size to count
+            accounting_combo.config(state=tk.DISABLED)
+        ttk.Checkbutton(settings_grid, text="Count hard links once", variable=self.dedupe_links_var,
+                        state=tk.NORMAL if scan_engine.HARDLINKS_SUPPORTED else tk.DISABLED).grid(row=4, column=2, columnspan=3, sticky=tk.W, padx=5, pady=5)
+
+        # Row 5: Top-N instead of a fixed threshold (0 = off)
+        ttk.Label(settings_grid, text="Top N (0 = off):").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Spinbox(settings_grid, from_=0, to=100000, increment=10, textvariable=self.top_n_var, width=13, command=self.refilter).grid(row=5, column=1, sticky=tk.W, padx=5, pady=5)
+        top_by_combo = ttk.Combobox(settings_grid, textvariable=self.top_by_var, state="readonly", width=12)
+        top_by_combo['values'] = ("Largest", "Oldest")
+        top_by_combo.grid(row=5, column=2, sticky=tk.W, padx=5, pady=5)
+        top_by_combo.bind("<<ComboboxSelected>>", self.refilter)
+
+        # Row 6: Date a folder by its newest file instead of its own timestamp
+        ttk.Label(settings_grid, text="Date Folders By:").grid(row=6, column=0, sticky=tk.W, padx=5, pady=5)
+        activity_combo = ttk.Combobox(settings_grid, textvariable=self.activity_var, state="readonly", width=22)
+        activity_combo['values'] = tuple(self.ACTIVITY_CHOICES)
+        activity_combo.grid(row=6, column=1, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        # Folders are opened once and their files stat'ed relative to them (not on Windows)
+        ttk.Checkbutton(settings_grid, text="Open folders by handle (faster on deep trees / NFS)",
+                        variable=self.fd_relative_var,
+                        state=tk.NORMAL if scan_engine.FD_RELATIVE_SUPPORTED else tk.DISABLED).grid(row=6, column=3, columnspan=2, sticky=tk.W, padx=5, pady=5)
+
+        # Rows 7-8: Throttle for shared storage (0 = off), applied live while a scan runs
+        ttk.Label(settings_grid, text="Throttle (ops/s):").grid(row=7, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Spinbox(settings_grid, from_=0, to=1000000, increment=500, textvariable=self.throttle_rate_var, width=13).grid(row=7, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(settings_grid, text="Max Folders at Once:").grid(row=7, column=2, sticky=tk.W, padx=5, pady=5)
+        ttk.Spinbox(settings_grid, from_=0, to=256, increment=1, textvariable=self.throttle_concurrency_var, width=8).grid(row=7, column=3, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(settings_grid, text="Stat Latency Target (ms):").grid(row=8, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Spinbox(settings_grid, from_=0, to=1000, increment=1, textvariable=self.throttle_latency_var, width=13).grid(row=8, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(settings_grid, text="(backs off while the storage is slower; 0 = off)").grid(row=8, column=2, columnspan=3, sticky=tk.W, padx=5, pady=5)
 
         # --- Control Frame ---
         control_frame = ttk.Frame(main_frame)
@@ -111,6 +449,10 @@ class FolderScannerApp:
 
         self.start_button = ttk.Button(control_frame, text="🚀 Start Scan", command=self.start_scan)
         self.start_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        self.resume_button = ttk.Button(control_frame, text="⏯ Resume Last Scan", command=self.resume_scan)
+        self.resume_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        self.watch_button = ttk.Button(control_frame, text="👁 Watch Target", command=self.watch_target)
+        self.watch_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         self.stop_button = ttk.Button(control_frame, text="🛑 Stop Scan", command=self.stop_scan, state=tk.DISABLED)
         self.stop_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
 
@@ -130,33 +472,88 @@ class FolderScannerApp:
         right_frame = ttk.LabelFrame(paned_window, text="Found Items (Matches Criteria)", padding="5")
         paned_window.add(right_frame)
 
-        self.found_text = scrolledtext.ScrolledText(right_frame, wrap=tk.WORD, height=15, state=tk.DISABLED, font=("Consolas", 9))
-        self.found_text.pack(fill=tk.BOTH, expand=True)
+        # Virtualized, sortable view over self.results (click a heading to sort)
+        self.found_table = VirtualTable(right_frame, [
+            ("path", "Folder Path", 420, lambda r: r.path, lambda r: r.path),
+            ("date", "Date", 90, lambda r: r.timestamp, scan_engine.format_date),
+            ("size", "Size", 130, lambda r: r.size, lambda r: scan_engine.format_size(r, self.scan_size_mb)),
+        ], on_activate=self.copy_result_path, record_id=lambda r: r.path)
+        self.found_table.pack(fill=tk.BOTH, expand=True)
+        # Found folders as scan_engine.ScanResult records (the table's record
+        # store, in arrival order); reports are built from these
+        self.results = self.found_table.records
 
         # Export Buttons
         btn_frame = ttk.Frame(right_frame)
         btn_frame.pack(fill=tk.X, pady=5)
         
-        self.save_txt_btn = ttk.Button(btn_frame, text="💾 Save Text Report", command=self.save_results)
+        self.save_txt_btn = ttk.Button(btn_frame, text="💾 Save Report (TXT/CSV/JSONL)", command=self.save_results)
         self.save_txt_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
         
         self.save_html_btn = ttk.Button(btn_frame, text="🌐 Save HTML Report", command=self.save_html_results)
         self.save_html_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 0))
+
+        self.expand_btn = ttk.Button(btn_frame, text="🔎 Expand Selected", command=self.expand_selected)
+        self.expand_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(4, 0))
+
+        self.profile_btn = ttk.Button(btn_frame, text="📊 Age Profile", command=self.show_age_profile)
+        self.profile_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(4, 0))
         
         # --- Status Bar ---
-        self.status_bar = ttk.Label(root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W, padding=5)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        # Current folder on the left, live rates / ETA (from scan_metrics) on the right
+        status_frame = ttk.Frame(root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W, padding=5)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.metrics_bar = ttk.Label(status_frame, textvariable=self.metrics_var, relief=tk.SUNKEN, anchor=tk.E, padding=5)
+        self.metrics_bar.pack(side=tk.RIGHT)
         
         # Initialize calculations
         self.update_date_from_dropdown()
+        self.poll_ui_queue()
 
     # --- Logic Helpers ---
 
+    def on_throttle_change(self, *args):
+        """Applies the throttle fields to the running (and next) scan; a half-typed number counts as off."""
+        values = []
+        for var in (self.throttle_rate_var, self.throttle_concurrency_var, self.throttle_latency_var):
+            try:
+                values.append(max(0.0, float(var.get())))
+            except ValueError:
+                values.append(0.0)
+        rate, concurrency, latency_ms = values
+        self.scan_throttle.configure(rate, int(concurrency), latency_ms)
+
+    def size_settings(self):
+        """The settings in the form that change which folders are counted and how big they are."""
+        return scan_snapshot.snapshot_meta({
+            "allocated": self.accounting_var.get() == "Allocated on disk",
+            "dedupe_hardlinks": self.dedupe_links_var.get(),
+            "exclude": self._split_patterns(self.exclude_var.get()),
+            "include": self._split_patterns(self.include_var.get()),
+            "one_file_system": self.one_file_system_var.get()})
+
+    def _table_is_stale(self):
+        # The kept table only holds the sizes of the settings it was scanned with
+        table = self.scan_table
+        return (table is not None and table.complete and self.path_var.get() == table.root
+                and self.size_settings() != self.scan_size_settings)
+
+    def on_size_settings_change(self, *_):
+        if not self.is_running and self._table_is_stale():
+            self.status_var.set("Exclude / size settings changed: press Start Scan to apply them.")
+
     def on_timeframe_change(self, event=None):
         val = self.timeframe_var.get()
         if val == "Custom":
             return
         self.update_date_from_dropdown()
+        self.refilter()
+
+    def on_mode_change(self):
+        self.update_date_from_dropdown()
+        self.refilter()
 
     def update_date_from_dropdown(self):
         val = self.timeframe_var.get()
@@ -191,18 +588,78 @@ class FolderScannerApp:
             size_mb = number * 1024
             
         self.size_manual_var.set(str(size_mb))
+        self.refilter()
+
+    def refilter(self, event=None):
+        """Applies the current date / size / mode / Top N to the last scan's folder table.
+
+        Nothing is read from disk. Does nothing while a scan runs, without a
+        complete table (see Keep Folder Table) or for a different target, and
+        asks for a rescan if the exclude or size settings have changed.
+        """
+        table = self.scan_table
+        if self.is_running or table is None or not table.complete or self.path_var.get() != table.root:
+            return
+        if self.ACTIVITY_CHOICES[self.activity_var.get()] != self.scan_activity:
+            return  # the table's dates are the last scan's
+        if self._table_is_stale():
+            self.update_log("Exclude, Except, size accounting or file system settings changed since the last"
+                            " scan; re-filtering can't apply them. Press Start Scan to rescan.")
+            self.status_var.set("Exclude / size settings changed: press Start Scan to apply them.")
+            return
+        try:
+            reference_epoch = scan_engine.parse_date(self.date_var.get())
+            size_mb = int(self.size_manual_var.get())
+            top_n = int(self.top_n_var.get())
+        except ValueError:
+            return  # half-typed input; the user is still editing
+        if size_mb < 0 or top_n < 0:
+            return
+        mode = self.mode_var.get()
+
+        started = time.perf_counter()
+        results = table.filter(mode, reference_epoch, size_mb * 1024 * 1024)
+        if top_n:
+            top = scan_engine.TopK(top_n, "age" if self.top_by_var.get() == "Oldest" else "size")
+            for result in results:
+                top.add(result)
+            results = top.results()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.found_table.clear()
+        self.results = self.found_table.records
+        self.found_table.set_heading("date", f"Date ({scan_engine.date_label(mode, self.scan_activity)})")
+        self.scan_mode = mode
+        self.scan_size_mb = size_mb
+        self.scan_horizon = self.timeframe_var.get()
+        self.scan_reference_date = self.date_var.get()
+        self.found_table.append(results)
+        self.update_log(f"Re-filtered the last scan ({len(table):,} folders): {len(results):,} match"
+                        f" in {elapsed_ms:.0f} ms, no rescan")
+        self.status_var.set(f"Re-filtered: {len(results):,} folder(s) found.")
 
     def browse_folder(self):
         folder_path = filedialog.askdirectory()
         if folder_path:
             self.path_var.set(folder_path)
 
+    def browse_live_report(self):
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV Files", "*.csv"), ("JSON Lines", "*.jsonl"), ("HTML Files", "*.html"),
+                       ("Text Files", "*.txt"), ("All Files", "*.*")],
+            title="Write Live Report To"
+        )
+        if file_path:
+            self.live_report_var.set(file_path)
+
     def pick_date(self):
         def on_date_select():
             cal_val = cal.get_date()
             self.date_var.set(cal_val)
             self.timeframe_var.set("Custom")
             top.destroy()
+            self.refilter()
 
         top = tk.Toplevel(self.root)
         top.title("Select Date")
@@ -218,19 +675,97 @@ class FolderScannerApp:
 
     def update_log(self, message):
         """Updates the Left Pane (Activity Log)"""
+        self._append_log_lines([message])
+
+    def update_found(self, results):
+        """Updates the Right Pane (Found Items) with a batch of ScanResult records"""
+        self.found_table.append(results)
+
+    def copy_result_path(self, result):
+        self.root.clipboard_clear()
+        self.root.clipboard_append(result.path)
+        self.status_var.set(f"Copied: {result.path}")
+
+    def _log_cap(self):
+        try:
+            return max(100, int(self.log_cap_var.get()))
+        except ValueError:
+            return 5000
+
+    def _append_log_lines(self, lines):
+        # The log is a ring buffer: only the newest _log_cap() lines are kept
+        cap = self._log_cap()
+        lines = lines[-cap:]
         self.log_text.configure(state=tk.NORMAL)
-        self.log_text.insert(tk.END, message + "\n")
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(self.log_text.index("end-1c").split(".")[0]) - 1
+        if line_count > cap:
+            self.log_text.delete("1.0", f"{line_count - cap + 1}.0")
         self.log_text.see(tk.END)
         self.log_text.configure(state=tk.DISABLED)
 
-    def update_found(self, message):
-        """Updates the Right Pane (Found Items)"""
-        self.found_text.configure(state=tk.NORMAL)
-        self.found_text.insert(tk.END, message + "\n")
-        self.found_text.see(tk.END)
-        self.found_text.configure(state=tk.DISABLED)
+    # --- Worker -> GUI Channel ---
+    # The scan thread never touches Tk directly. It drops messages into
+    # self.ui_queue and one periodic after() poll on the main thread applies
+    # them in bulk, so scan speed no longer depends on how fast Tk redraws.
+
+    UI_POLL_MS = 100           # ~10 Hz
+    UI_MAX_MESSAGES = 5000     # per poll, keeps the GUI responsive on bursts
+
+    def post_status(self, text):
+        """Status bar text from the worker; only the latest value is shown."""
+        self._latest_status = text
+
+    def post_log(self, message):
+        self.ui_queue.put(("log", message))
+
+    def post_found(self, result):
+        self.ui_queue.put(("found", result))
+
+    def post_call(self, func, *args):
+        """Runs func on the main thread after everything posted before it."""
+        self.ui_queue.put(("call", (func, args)))
+
+    def poll_ui_queue(self):
+        status, self._latest_status = self._latest_status, None
+        if status is not None:
+            self.status_var.set(status)
+        if self.is_running and self.scan_metrics is not None:
+            line = self.scan_metrics.status_line()
+            if self.scan_throttle.active:
+                line += " | " + self.scan_throttle.status()
+            self.metrics_var.set(line)
+
+        log_lines = []
+        found_results = []
+
+        def flush():
+            if log_lines:
+                self._append_log_lines(log_lines)
+                log_lines.clear()
+            if found_results:
+                self.update_found(found_results)
+                found_results.clear()
+
+        for _ in range(self.UI_MAX_MESSAGES):
+            try:
+                kind, payload = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                log_lines.append(payload)
+            elif kind == "found":
+                found_results.append(payload)
+            else:
+                flush()
+                func, args = payload
+                func(*args)
+        flush()
+
+        self.root.after(self.UI_POLL_MS, self.poll_ui_queue)
 
-    def start_scan(self):
+    def start_scan(self, checkpoint=None):
+        """Starts a scan with the current settings; checkpoint is a loaded one to resume (see resume_scan)."""
         if self.is_running:
             messagebox.showwarning("Busy", "A scan is already in progress!")
             return
@@ -243,12 +778,47 @@ class FolderScannerApp:
         if not os.path.isdir(folder_path):
             messagebox.showerror("Error", "Please select a valid folder path.")
             return
+        try:
+            top_n = int(self.top_n_var.get())
+            if top_n < 0: raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid number for Top N (0 = off).")
+            return
+        top_n = top_n or None
+        top_by = "age" if self.top_by_var.get() == "Oldest" else "size"
         try:
             size_mb = int(size_str)
-            if size_mb <= 0: raise ValueError
+            # With Top N the size is only a floor, and may be 0
+            if size_mb < 0 or (size_mb == 0 and not top_n): raise ValueError
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid, positive number for the size.")
             return
+        try:
+            workers = int(self.workers_var.get())
+            if workers <= 0: raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid, positive number of workers.")
+            return
+        use_processes = self.use_processes_var.get()
+        fd_relative = self.fd_relative_var.get()
+        # A throttle runs the workers as threads; with processes it is only used if already set
+        throttle = self.scan_throttle if self.scan_throttle.active or not use_processes else None
+        index_path = scan_index.DEFAULT_INDEX_PATH if self.use_index_var.get() else None
+        allocated = self.accounting_var.get() == "Allocated on disk" and scan_engine.ALLOCATED_SUPPORTED
+        dedupe_hardlinks = self.dedupe_links_var.get() and scan_engine.HARDLINKS_SUPPORTED
+        outermost = self.outermost_var.get()
+        if top_n and outermost:
+            messagebox.showerror("Error", "Top N needs exact sizes; turn off \"Report outermost matches only\".")
+            return
+        activity = self.ACTIVITY_CHOICES[self.activity_var.get()]
+        if activity and outermost:
+            messagebox.showerror("Error", "Dating folders by their newest file needs the whole tree;"
+                                 " turn off \"Report outermost matches only\".")
+            return
+        exclude = self._split_patterns(self.exclude_var.get())
+        include = self._split_patterns(self.include_var.get())
+        one_file_system = self.one_file_system_var.get()
+        self.scan_size_settings = self.size_settings()
 
         self.is_running = True
         self.stop_event.clear()
@@ -258,123 +828,471 @@ class FolderScannerApp:
         self.log_text.delete('1.0', tk.END)
         self.log_text.configure(state=tk.DISABLED)
         
-        self.found_text.configure(state=tk.NORMAL)
-        self.found_text.delete('1.0', tk.END)
-        self.found_text.configure(state=tk.DISABLED)
+        self.found_table.clear()
+        self.results = self.found_table.records
+        self.found_table.set_heading("date", f"Date ({scan_engine.date_label(mode, activity)})")
+        self.scan_mode = mode
+        self.scan_size_mb = size_mb
+        self.scan_horizon = self.timeframe_var.get()
+        self.scan_reference_date = date_str
+        self.scan_activity = activity
+        self.scan_metrics = scan_engine.ScanMetrics()
+        # Every folder's totals and age histogram, for refilter() and Age Profile
+        self.scan_table = scan_engine.ScanTable() if self.keep_table_var.get() and not outermost else None
+        if checkpoint is None:
+            # Progress is saved every few seconds and on Stop; a new scan
+            # replaces the last interrupted one
+            checkpoint = scan_checkpoint.ScanCheckpoint()
+            checkpoint.discard()
+            checkpoint.params.update(size_mb=size_mb, date=date_str, horizon=self.scan_horizon)
+        self.scan_checkpoint = checkpoint
+
+        live_exporter = None
+        live_report_path = self.live_report_var.get().strip()
+        if live_report_path:
+            try:
+                live_exporter = self._open_exporter(live_report_path, scan_export.exporter_for(live_report_path))
+            except OSError as e:
+                self.is_running = False
+                messagebox.showerror("Error", f"Cannot write live report: {e}")
+                return
         
         self.start_button.config(state=tk.DISABLED)
+        self.resume_button.config(state=tk.DISABLED)
+        self.watch_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         self.status_var.set("Initializing scan...")
         self.update_log(f"--- Scan Started: {datetime.now().strftime('%H:%M:%S')} ---")
+        if checkpoint.state is not None:
+            self.update_log("Resuming the interrupted scan from its last checkpoint.")
+        self.update_log(f"Target: {folder_path}")
+        self.update_log(f"Mode: {mode.upper()}")
+        if allocated or dedupe_hardlinks:
+            self.update_log(f"Size accounting: {self.accounting_var.get()}"
+                            + (", hard links counted once (serial walk)" if dedupe_hardlinks else ""))
+            if index_path:
+                self.update_log("Incremental cache is not used with this size accounting.")
+        elif index_path and not outermost:
+            self.update_log(f"Incremental cache: {index_path}")
+        if outermost:
+            self.update_log("Reporting outermost matches only (use Expand Selected to look inside).")
+        if exclude:
+            self.update_log(f"Excluding: {'; '.join(exclude)}"
+                            + (f" (except {'; '.join(include)})" if include else ""))
+        if one_file_system:
+            self.update_log("Staying on the target's file system.")
+        if activity:
+            self.update_log(f"Dating folders by: {self.activity_var.get().lower()} inside them.")
+            if index_path:
+                self.update_log("Incremental cache is not used when dating folders by their files.")
+        if top_n:
+            self.update_log(f"Keeping the {top_n} {self.top_by_var.get().lower()} matches; they are listed when the scan ends.")
+        if (exclude or include or one_file_system) and index_path:
+            self.update_log("Incremental cache is not used with exclude rules.")
+        if live_exporter:
+            self.update_log(f"Live report: {live_report_path}")
+        if throttle is not None and throttle.active:
+            self.update_log(throttle.status() + (" (workers run as threads)" if use_processes else ""))
+
+        scan_thread = threading.Thread(
+            target=self.process_folders_thread,
+            args=(folder_path, date_str, size_mb, mode, workers, use_processes, index_path, live_exporter,
+                  allocated, dedupe_hardlinks, outermost, self.scan_metrics, checkpoint,
+                  exclude, include, one_file_system, top_n, top_by, self.scan_table, activity, fd_relative,
+                  throttle)
+        )
+        scan_thread.start()
+
+    def resume_scan(self):
+        """Restores the settings of the last interrupted scan and continues it."""
+        if self.is_running:
+            messagebox.showwarning("Busy", "A scan is already in progress!")
+            return
+        if not scan_checkpoint.ScanCheckpoint.exists():
+            messagebox.showinfo("Nothing to Resume", "There is no interrupted scan to resume.")
+            return
+        try:
+            checkpoint = scan_checkpoint.ScanCheckpoint.load()
+            params = checkpoint.params
+            self.path_var.set(params["root"])
+            self.mode_var.set(params["mode"])
+            # The saved date, not one recomputed from the horizon
+            self.timeframe_var.set(params["horizon"])
+            self.date_var.set(params["date"])
+            self.size_dropdown_var.set("Custom")
+            self.size_manual_var.set(str(params["size_mb"]))
+            self.workers_var.set(str(params["workers"]))
+            self.use_processes_var.set(params["use_processes"])
+            self.use_index_var.set(bool(params["index_path"]))
+            self.accounting_var.set("Allocated on disk" if params["allocated"] else "Apparent size")
+            self.dedupe_links_var.set(params["dedupe_hardlinks"])
+            self.outermost_var.set(params["outermost"])
+            self.exclude_var.set("; ".join(params["exclude"]))
+            self.include_var.set("; ".join(params["include"]))
+            self.one_file_system_var.set(params["one_file_system"])
+            self.top_n_var.set(str(params["top_n"] or 0))
+            self.top_by_var.set("Oldest" if params["top_by"] == "age" else "Largest")
+            self.activity_var.set(next(label for label, value in self.ACTIVITY_CHOICES.items()
+                                       if value == params["activity"]))
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Cannot resume the last scan: {e}")
+            return
+        self.start_scan(checkpoint)
+
+    # Seconds between two refreshes of a watched target
+    WATCH_INTERVAL_S = 2.0
+
+    def watch_target(self):
+        """Scans the target once, then keeps Found Items current as files change, until Stop."""
+        if self.is_running:
+            messagebox.showwarning("Busy", "A scan is already in progress!")
+            return
+        folder_path = self.path_var.get()
+        date_str = self.date_var.get()
+        mode = self.mode_var.get()
+        if not os.path.isdir(folder_path):
+            messagebox.showerror("Error", "Please select a valid folder path.")
+            return
+        try:
+            size_mb = int(self.size_manual_var.get())
+            if size_mb <= 0: raise ValueError
+            reference_epoch = scan_engine.parse_date(date_str)
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid, positive size and a dd-mm-yyyy date.")
+            return
+        if (self.outermost_var.get() or self.dedupe_links_var.get() or self.top_n_var.get() not in ("", "0")
+                or self.ACTIVITY_CHOICES[self.activity_var.get()]):
+            messagebox.showerror("Error", "Watching keeps every folder's total current, so it works without"
+                                 " outermost matches, Top N, counting hard links once and dating by files.")
+            return
+
+        self.is_running = True
+        self.stop_event.clear()
+        self.log_text.configure(state=tk.NORMAL)
+        self.log_text.delete('1.0', tk.END)
+        self.log_text.configure(state=tk.DISABLED)
+        self.found_table.clear()
+        self.results = self.found_table.records
+        self.found_table.set_heading("date", f"Date ({scan_engine.date_label(mode)})")
+        self.scan_mode = mode
+        self.scan_size_mb = size_mb
+        self.scan_horizon = self.timeframe_var.get()
+        self.scan_reference_date = date_str
+        self.scan_activity = None
+        self.scan_metrics = None
+        self.scan_checkpoint = None
+        self.scan_table = None
+
+        self.start_button.config(state=tk.DISABLED)
+        self.resume_button.config(state=tk.DISABLED)
+        self.watch_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
+        self.status_var.set(f"Scanning: {folder_path}")
+        self.update_log(f"--- Watch Started: {datetime.now().strftime('%H:%M:%S')} ---")
         self.update_log(f"Target: {folder_path}")
         self.update_log(f"Mode: {mode.upper()}")
 
+        try:
+            watcher = scan_watch.FolderWatcher(folder_path, mode, reference_epoch, size_mb * 1024 * 1024,
+                                               self._on_walk_error, self.accounting_var.get() == "Allocated on disk",
+                                               self._split_patterns(self.exclude_var.get()),
+                                               self._split_patterns(self.include_var.get()),
+                                               self.one_file_system_var.get(), throttle=self.scan_throttle)
+        except Exception as e:
+            messagebox.showerror("Error", f"Cannot watch the target: {e}")
+            self.scan_finished(True)
+            return
+        threading.Thread(target=self.watch_thread, args=(watcher,)).start()
+
+    def watch_thread(self, watcher):
+        failed = False
+        try:
+            results = watcher.start(self.stop_event)
+            if results is not None:
+                self.post_call(self.update_found, results)
+                self.post_log(f"{len(results)} folder(s) found. Watching {watcher.folder_count:,} folders"
+                              f" ({watcher.backend}); press Stop to end.")
+                self.post_status(f"Watching: {watcher.root}")
+                for changes in watcher.changes(self.stop_event, self.WATCH_INTERVAL_S):
+                    stamp = datetime.now().strftime('%H:%M:%S')
+                    for result in changes.added:
+                        self.post_log(f"{stamp} Now matches: {result.path}")
+                    for path in changes.removed:
+                        self.post_log(f"{stamp} No longer matches: {path}")
+                    self.post_call(self.show_watch_results, watcher.results())
+                    self.post_status(f"Watching: {watcher.root} (last change {stamp})")
+        except Exception as e:
+            failed = True
+            self.post_log(f"Error: watching failed: {e!r}")
+            self.post_call(messagebox.showerror, "Error", f"Cannot watch the target: {e}")
+        finally:
+            watcher.close()
+            self.post_call(self.scan_finished, failed)
+
+    def show_watch_results(self, results):
+        self.found_table.replace(results)
+        self.results = self.found_table.records
+
+    def expand_selected(self):
+        """Scans inside the selected result and adds its outermost matching sub-folders."""
+        if self.is_running:
+            messagebox.showwarning("Busy", "A scan is already in progress!")
+            return
+        result = self.found_table.selected()
+        if result is None:
+            messagebox.showinfo("Expand", "Select a found folder first.")
+            return
+        try:
+            workers = max(1, int(self.workers_var.get()))
+        except ValueError:
+            workers = 1
+
+        self.is_running = True
+        self.stop_event.clear()
+        self.start_button.config(state=tk.DISABLED)
+        self.resume_button.config(state=tk.DISABLED)
+        self.watch_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
+        self.update_log(f"--- Expanding: {result.path} ---")
+        self.scan_metrics = scan_engine.ScanMetrics()
+        self.scan_checkpoint = None
+
+        # Same criteria as the scan that found it; results are appended
         scan_thread = threading.Thread(
             target=self.process_folders_thread,
-            args=(folder_path, date_str, size_mb, mode)
+            args=(result.path, self.scan_reference_date, self.scan_size_mb, self.scan_mode, workers,
+                  self.use_processes_var.get(), None, None,
+                  self.accounting_var.get() == "Allocated on disk", self.dedupe_links_var.get(), True,
+                  self.scan_metrics, None, self._split_patterns(self.exclude_var.get()),
+                  self._split_patterns(self.include_var.get()), self.one_file_system_var.get()),
+            kwargs={"throttle": self.scan_throttle if not self.use_processes_var.get() or self.scan_throttle.active
+                    else None}
         )
         scan_thread.start()
 
+    def show_age_profile(self):
+        """Shows how old the data in the selected folder is, from the last scan's folder table."""
+        result = self.found_table.selected()
+        if result is None:
+            messagebox.showinfo("Age Profile", "Select a found folder first.")
+            return
+        profile = self.scan_table.age_profile(result.path) if self.scan_table is not None else None
+        if profile is None:
+            messagebox.showinfo("Age Profile", "Age profiles are kept for the last complete scan"
+                                " (Scan Cache → Keep Folder Table, not with outermost matches).")
+            return
+        row = self.scan_table.find(result.path)
+        lines = [f"{label:>16}: {nbytes / (1024*1024):,.2f} MB" for label, nbytes in profile]
+        messagebox.showinfo("Age Profile", f"{result.path}\n{len(self.scan_table.subtree(row)):,} folders,"
+                            f" {self.scan_table.files[row]:,} files\n\nData by file age (last modified):\n\n"
+                            + "\n".join(lines))
+
     def stop_scan(self):
         if self.is_running:
             self.stop_event.set()
             self.status_var.set("Stopping scan...")
             self.update_log(">>> STOP SIGNAL RECEIVED <<<")
 
-    def scan_finished(self):
+    def rebuild_index(self):
+        if self.is_running:
+            messagebox.showwarning("Busy", "A scan is already in progress!")
+            return
+        folder_path = self.path_var.get()
+        if not os.path.isdir(folder_path):
+            messagebox.showerror("Error", "Please select a valid folder path.")
+            return
+        index = scan_index.ScanIndex()
+        index.invalidate(folder_path)
+        index.close()
+        self.use_index_var.set(True)
+        self.start_scan()
+
+    def clear_index(self):
+        if self.is_running:
+            messagebox.showwarning("Busy", "A scan is already in progress!")
+            return
+        if not messagebox.askyesno("Clear Cache", "Delete all cached scan data?"):
+            return
+        index = scan_index.ScanIndex()
+        index.invalidate()
+        index.close()
+        self.status_var.set("Scan cache cleared.")
+
+    def scan_finished(self, failed=False):
         self.is_running = False
+        self._latest_status = None
         self.start_button.config(state=tk.NORMAL)
+        self.resume_button.config(state=tk.NORMAL)
+        self.watch_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
-        if self.stop_event.is_set():
+        if failed:
+            self.status_var.set("Scan failed.")
+            self.update_log("\n--- SCAN FAILED ---")
+        elif self.stop_event.is_set():
             self.status_var.set("Scan stopped by user.")
             self.update_log("\n--- SCAN STOPPED ---")
+            if self.scan_checkpoint is not None and os.path.exists(self.scan_checkpoint.path):
+                self.update_log("Progress saved. Use \"Resume Last Scan\" to continue.")
         else:
             self.status_var.set("Scan complete!")
             self.update_log("\n--- SCAN COMPLETE ---")
+        if self.scan_metrics is not None:
+            data = self.scan_metrics.snapshot()
+            self.metrics_var.set(self.scan_metrics.status_line())
+            self.update_log(f"{data['dirs_listed'] + data['dirs_cached']:,} folders, {data['files_seen']:,} files"
+                            f" in {data['elapsed_s']:.1f}s ({sum(data['errors'].values())} skipped,"
+                            f" {data['dirs_excluded']:,} excluded)")
+
+    def load_shard_results(self):
+        """Shows the merged results of a sharded scan (python -m scan_shard) in Found Items."""
+        if self.is_running:
+            messagebox.showwarning("Busy", "A scan is already in progress!")
+            return
+        workdir = filedialog.askdirectory(title="Select the Shard Work Folder")
+        if not workdir:
+            return
+        try:
+            shard_plan = scan_shard.ShardPlan.load(workdir)
+            results = list(scan_shard.merge(workdir))
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Cannot merge the shards: {e}")
+            return
+        params = shard_plan.params
+        self.found_table.clear()
+        self.results = self.found_table.records
+        self.found_table.set_heading("date", f"Date ({scan_engine.date_label(params['mode'], params['activity'])})")
+        self.scan_mode = params["mode"]
+        self.scan_size_mb = params.get("size_mb", params["limit_bytes"] // (1024 * 1024))
+        self.scan_horizon = "Custom"
+        self.scan_reference_date = params.get("date", "")
+        self.scan_activity = params["activity"]
+        self.scan_table = None
+        self.update_found(results)
+        self.update_log(f"--- Merged {len(shard_plan.shards)} shard(s) of {shard_plan.root}:"
+                        f" {len(results)} folder(s) found ---")
+        self.status_var.set(f"Sharded scan results: {workdir}")
+
+    def save_snapshot(self):
+        """Saves every folder of the last complete scan, to compare with a later one."""
+        table = self.scan_table
+        if self.is_running or table is None or not table.complete:
+            messagebox.showinfo("Nothing to Save", "Snapshots need a complete scan with \"Keep Folder Table\""
+                                " ticked and \"Report outermost matches only\" off.")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".snap",
+            filetypes=[("Folder Snapshots", "*.snap"), ("All Files", "*.*")],
+            initialfile=f"snapshot_{datetime.now().strftime('%d_%m_%Y_%H%M')}.snap",
+            title="Save Folder Snapshot"
+        )
+        if file_path:
+            try:
+                scan_snapshot.write_snapshot(file_path, table, self.scan_size_settings)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save file: {e}")
+                return
+            self.update_log(f"Snapshot of {len(table):,} folders saved to {file_path}")
+
+    def compare_snapshots(self):
+        """Shows what grew, shrank, appeared and disappeared between two snapshots in the log."""
+        filetypes = [("Folder Snapshots", "*.snap"), ("All Files", "*.*")]
+        old_path = filedialog.askopenfilename(filetypes=filetypes, title="Select the OLDER Snapshot")
+        if not old_path:
+            return
+        new_path = filedialog.askopenfilename(filetypes=filetypes, title="Select the NEWER Snapshot")
+        if not new_path:
+            return
+        try:
+            with scan_snapshot.Snapshot(old_path) as old, scan_snapshot.Snapshot(new_path) as new:
+                lines = scan_snapshot.format_diff(scan_snapshot.diff(old, new), old, new)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Cannot compare the snapshots: {e}")
+            return
+        self._append_log_lines(["---"] + lines + ["---"])
+
+    def save_metrics(self):
+        # On demand: works during a scan too (a snapshot so far)
+        if self.scan_metrics is None:
+            messagebox.showinfo("Nothing to Save", "No scan has been run yet.")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON Files", "*.json"), ("All Files", "*.*")],
+            initialfile=f"scan_metrics_{datetime.now().strftime('%d_%m_%Y_%H%M')}.json",
+            title="Save Scan Metrics"
+        )
+        if file_path:
+            try:
+                self.scan_metrics.dump(file_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save file: {e}")
 
-    def process_folders_thread(self, folder_path, date_str, size_mb, mode):
+    def process_folders_thread(self, folder_path, date_str, size_mb, mode, workers=1, use_processes=False,
+                               index_path=None, live_exporter=None, allocated=False, dedupe_hardlinks=False,
+                               outermost=False, metrics=None, checkpoint=None, exclude=(), include=(),
+                               one_file_system=False, top_n=None, top_by="size", table=None, activity=None,
+                               fd_relative=False, throttle=None):
         try:
-            reference_epoch = time.mktime(time.strptime(date_str, "%d-%m-%Y"))
+            reference_epoch = scan_engine.parse_date(date_str)
             limit_bytes = size_mb * 1024 * 1024
         except ValueError:
-            self.root.after(0, lambda: messagebox.showerror("Error", "Invalid date format. Please use dd-mm-yyyy."))
-            self.root.after(0, self.scan_finished)
-            return
-
-        for root, dirs, _ in os.walk(folder_path):
-            for dir_name in dirs:
-                if self.stop_event.is_set():
-                    self.root.after(0, self.scan_finished)
-                    return
-                
-                dir_path = os.path.join(root, dir_name)
-                
-                # Update Status Bar (Rapid)
-                self.root.after(0, self.status_var.set, f"Scanning: {dir_path}")
-                
-                try:
-                    is_match = False
-                    folder_timestamp = 0
-                    
-                    if mode == "dormant":
-                        folder_timestamp = os.path.getmtime(dir_path)
-                        if folder_timestamp < reference_epoch:
-                            is_match = True
-                            
-                    elif mode == "recent":
-                        folder_timestamp = os.path.getctime(dir_path)
-                        if folder_timestamp > reference_epoch:
-                            is_match = True
-
-                    if is_match:
-                        # Log that we are calculating size (might take a moment)
-                        self.root.after(0, self.update_log, f"Candidate found: {dir_name}...")
-                        
-                        folder_size, is_truncated = self.get_folder_size(dir_path, limit_bytes)
-                        
-                        if is_truncated or folder_size > limit_bytes:
-                            folder_date_str = time.strftime("%d-%m-%Y", time.localtime(folder_timestamp))
-                            
-                            size_display = f"{folder_size / (1024*1024):.2f} MB"
-                            if is_truncated:
-                                size_display = f"> {size_mb} MB (Limit Reached)"
-                            
-                            type_str = "Modified" if mode == "dormant" else "Created"
-                            
-                            result_line = f"FOUND! {dir_path} | {type_str}: {folder_date_str} | Size: {size_display}"
-                            
-                            # Add to Right Pane (Results)
-                            self.root.after(0, self.update_found, result_line)
-                            # Add brief note to Left Pane (Log)
-                            self.root.after(0, self.update_log, f"--> CONFIRMED: {size_display}")
-
-                except FileNotFoundError:
-                    self.root.after(0, self.update_log, f"Skipped (Not Found): {dir_path}")
-                except PermissionError:
-                    self.root.after(0, self.update_log, f"Skipped (Permission): {dir_path}")
-                except Exception as e:
-                    self.root.after(0, self.update_log, f"Error: {e}")
-        
-        self.root.after(0, self.scan_finished)
-        
-    def get_folder_size(self, folder_path, limit_bytes=None):
-        total_size = 0
+            if live_exporter:
+                live_exporter.close()
+            self.post_call(messagebox.showerror, "Error", "Invalid date format. Please use dd-mm-yyyy.")
+            self.post_call(self.scan_finished, True)
+            return
+
+        def on_progress(dir_path):
+            # Update Status Bar (latest wins, see poll_ui_queue)
+            self.post_status(f"Scanning: {dir_path}")
+
+        # The engine walks the tree once, bottom-up, summing independent
+        # sub-trees in parallel (see scan_engine.parallel_aggregate).
+        failed = False
         try:
-            for dirpath, _, filenames in os.walk(folder_path):
-                if self.stop_event.is_set(): return 0, False
-                for f in filenames:
-                    if self.stop_event.is_set(): return 0, False
-                    fp = os.path.join(dirpath, f)
-                    if not os.path.islink(fp):
-                        try:
-                            total_size += os.path.getsize(fp)
-                            if limit_bytes and total_size > limit_bytes:
-                                return total_size, True
-                        except (FileNotFoundError, PermissionError):
-                             pass
-        except Exception:
-             pass
-        return total_size, False
+            for result in scan_engine.scan(folder_path, mode, reference_epoch, limit_bytes,
+                                           self.stop_event, self._on_walk_error, on_progress,
+                                           workers=workers, use_processes=use_processes,
+                                           index_path=index_path, allocated=allocated,
+                                           dedupe_hardlinks=dedupe_hardlinks, outermost=outermost,
+                                           metrics=metrics, checkpoint=checkpoint, exclude=exclude,
+                                           include=include, one_file_system=one_file_system,
+                                           top_n=top_n, top_by=top_by, table=table, activity=activity,
+                                           fd_relative=fd_relative, throttle=throttle):
+                self.report_match(result, size_mb, mode)
+                if live_exporter:
+                    live_exporter.write(result)
+        except Exception as e:
+            # A corrupt cache, a checkpoint that doesn't fit, a worker crash...:
+            # report it, and always hand the controls back below
+            failed = True
+            self.post_log(f"Error: the scan failed: {e!r}")
+            self.post_call(messagebox.showerror, "Error", f"The scan failed: {e}")
+        finally:
+            if live_exporter:
+                live_exporter.close()
+            self.post_call(self.scan_finished, failed)
+
+    @staticmethod
+    def _split_patterns(text):
+        return [pattern.strip() for pattern in text.split(";") if pattern.strip()]
+
+    def _on_walk_error(self, error):
+        if isinstance(error, PermissionError):
+            self.post_log(f"Skipped (Permission): {error.filename}")
+        elif isinstance(error, FileNotFoundError):
+            self.post_log(f"Skipped (Not Found): {error.filename}")
+        else:
+            self.post_log(f"Error: {error}")
+
+    def report_match(self, result, size_mb, mode):
+        """Formats a confirmed folder for the Found Items pane"""
+        self.post_log(f"Candidate found: {os.path.basename(result.path)}...")
+
+        # Add to Right Pane (Results), formatted on the main thread
+        self.post_found(result)
+        # Add brief note to Left Pane (Log)
+        self.post_log(f"--> CONFIRMED: {scan_engine.format_size(result, size_mb)}")
 
     def _generate_report_filename(self, ext="txt"):
         timeframe_raw = self.timeframe_var.get()
@@ -413,9 +1331,8 @@ class FolderScannerApp:
         return f"{timeframe_part}_{mode_part}_{size_part}_folders_from_{today_date}.{ext}"
 
     def save_results(self):
-        # Text Export
-        results_content = self.found_text.get("1.0", tk.END).strip()
-        if not results_content:
+        # Text / CSV / JSON Lines Export
+        if not self.results:
             messagebox.showinfo("Nothing to Save", "No found items to export.")
             return
 
@@ -423,48 +1340,19 @@ class FolderScannerApp:
 
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
-            filetypes=[("Text Files", "*.txt"), ("All Files", "*.*")],
+            filetypes=[("Text Files", "*.txt"), ("CSV Files", "*.csv"), ("JSON Lines", "*.jsonl"), ("All Files", "*.*")],
             initialfile=initial_filename,
-            title="Export Text Report"
+            title="Export Report"
         )
         if file_path:
-            try:
-                with open(file_path, "w", encoding='utf-8') as f:
-                    # Write a header
-                    f.write(f"Folder Capacity Report - {datetime.now().strftime('%d-%m-%Y %H:%M')}\n")
-                    f.write(f"Scan Mode: {self.mode_var.get().upper()}\n")
-                    f.write(f"Time Horizon: {self.timeframe_var.get()} (Reference Date: {self.date_var.get()})\n")
-                    f.write(f"Minimum Size: {self.size_manual_var.get()} MB\n")
-                    f.write("-" * 50 + "\n")
-                    f.write(results_content)
-                messagebox.showinfo("Success", f"Report saved to {file_path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {e}")
+            self._export_results(file_path, scan_export.exporter_for(file_path))
 
     def save_html_results(self):
-        # HTML Export
-        results_content = self.found_text.get("1.0", tk.END).strip()
-        if not results_content:
+        # HTML Export, straight from the result records (no text re-parsing)
+        if not self.results:
             messagebox.showinfo("Nothing to Save", "No found items to export.")
             return
 
-        # Parse text results into list of dicts
-        # Line format: FOUND! {dir_path} | {type_str}: {folder_date_str} | Size: {size_display}
-        rows = []
-        lines = results_content.splitlines()
-        regex = r"FOUND! (.*?) \| (.*?): (.*?) \| Size: (.*)"
-        
-        for line in lines:
-            match = re.match(regex, line)
-            if match:
-                path, type_label, date_val, size_val = match.groups()
-                rows.append({
-                    "path": path,
-                    "type": type_label,
-                    "date": date_val,
-                    "size": size_val
-                })
-
         initial_filename = self._generate_report_filename("html")
 
         file_path = filedialog.asksaveasfilename(
@@ -473,104 +1361,21 @@ class FolderScannerApp:
             initialfile=initial_filename,
             title="Export HTML Report"
         )
-        
+
         if file_path:
-            try:
-                html_content = self._generate_html_content(rows)
-                with open(file_path, "w", encoding='utf-8') as f:
-                    f.write(html_content)
-                messagebox.showinfo("Success", f"HTML Report saved to {file_path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save file: {e}")
+            self._export_results(file_path, scan_export.HtmlExporter)
 
-    def _generate_html_content(self, rows):
-        # Generate HTML table rows dynamically
-        table_rows = ""
-        for row in rows:
-            # Escape single quotes and backslashes in path for JavaScript string literal
-            # Double backslash for regex replacement in JS, and single quote for string literal
-            clean_path = row['path'].replace("\\", "/").replace("'", "\\'") 
-            table_rows += f'''
-            <tr>
-                <td class="path-cell">
-                    <div class="path-text">{row['path']}</div>
-                    <button onclick="copyPath('{clean_path}')" class="copy-btn">Copy Path</button>
-                </td>
-                <td>{row['date']}</td>
-                <td>{row['size']}</td>
-            </tr>
-            '''
-        
-        # JavaScript for copyPath function. Defined as a raw string literal to avoid
-        # Python's backslash escaping rules confusing JS regex.
-        js_script_block = r'''
-            <script>
-                function copyPath(path) {
-                    // Fix slashes for Windows clipboard: replace forward slash with backslash
-                    // The regex /\//g matches all forward slashes.
-                    // The replacement '\\' provides a single backslash.
-                    const windowsPath = path.replace(/\//g, '\\');
-                    navigator.clipboard.writeText(windowsPath).then(() => {
-                        alert("Path copied to clipboard:\n" + windowsPath);
-                    }).catch(err => {
-                        console.error('Failed to copy: ', err);
-                    });
-                }
-            </script>
-        '''
+    def _open_exporter(self, file_path, exporter_cls):
+        return exporter_cls(file_path, self.scan_mode, self.scan_size_mb,
+                            self.scan_horizon, self.scan_reference_date, self.scan_activity)
 
-        # Main HTML content string. Using f-string with triple single quotes.
-        # This allows embedded double quotes in HTML attributes/CSS without escaping.
-        html_content = f'''<!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Folder Capacity Report</title>
-            <style>
-                body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 20px; background-color: #f4f4f9; }}
-                .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }}
-                h1 {{ color: #333; }}
-                .meta {{ margin-bottom: 20px; padding: 10px; background: #e9ecef; border-left: 5px solid #007bff; }}
-                table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
-                th, td {{ padding: 12px 15px; text-align: left; border-bottom: 1px solid #ddd; }}
-                th {{ background-color: #007bff; color: white; }}
-                tr:hover {{ background-color: #f1f1f1; }}
-                .path-cell {{ display: flex; justify-content: space-between; align-items: center; }}
-                .path-text {{ word-break: break-all; margin-right: 10px; font-family: Consolas, monospace; }}
-                .copy-btn {{
-                    background-color: #28a745; color: white; border: none; padding: 5px 10px; 
-                    border-radius: 4px; cursor: pointer; font-size: 0.85em;
-                }}
-                .copy-btn:hover {{ background-color: #218838; }}
-                .copy-btn:active {{ transform: scale(0.98); }}
-            </style>
-            {js_script_block}
-        </head>
-        <body>
-            <div class="container">
-                <h1>Folder Capacity Report</h1>
-                <div class="meta">
-                    <p><strong>Generated:</strong> {datetime.now().strftime('%d-%m-%Y %H:%M')}</p>
-                    <p><strong>Mode:</strong> {self.mode_var.get().upper()}</p>
-                    <p><strong>Criteria:</strong> {self.timeframe_var.get()} | Min Size: {self.size_manual_var.get()} MB</p>
-                </div>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Folder Path</th>
-                            <th>Date ({self.mode_var.get() == 'dormant' and 'Modified' or 'Created'})</th>
-                            <th>Size</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {table_rows}
-                    </tbody>
-                </table>
-            </div>
-        </body>
-        </html>'''
-        return html_content
+    def _export_results(self, file_path, exporter_cls):
+        try:
+            with self._open_exporter(file_path, exporter_cls) as exporter:
+                exporter.write_all(self.results)
+            messagebox.showinfo("Success", f"Report saved to {file_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save file: {e}")
 
     def show_help(self):
         help_text = '''
@@ -588,13 +1393,25 @@ class FolderScannerApp:
         2. The Split View (Center):
            - LEFT PANE (Activity Log): Shows the scanner working, errors, and access warnings.
            - RIGHT PANE (Found Items): Lists ONLY the folders that match your search. This is your "Hit List."
+             Click a column heading to sort, double-click a row to copy its path.
+             With "Report outermost matches only", select a row and click "Expand Selected" to list the matches inside it.
+           - Resume Last Scan: continues a scan that was stopped (or cut short by a crash) from its last saved progress.
 
         3. Saving:
            - Save Text Report: A simple list of found folders.
            - Save HTML Report: An interactive web file with "Copy Path" buttons.
 
         --- TIPS ---
-        - The scan stops counting a folder's size once it hits your limit. A result like "> 1000 MB" means it's at least that big.
+        - After a complete scan, changing the Time Horizon, Minimum Size, Scan Mode or Top N re-filters the results instantly, without scanning again (press Enter after typing a date or size). "Age Profile" shows how much of a found folder's data is how old.
+        - Date Folders By: a folder's own date only changes when files are added or removed, so a folder whose files are edited every day can still look old. "Newest file modified" dates each folder by the newest file anywhere inside it instead (same single scan, no extra walks).
+        - "Open folders by handle" (Linux/macOS) reads each folder once and checks its files relative to it, which is faster on deep trees and network shares, and copes with folders renamed while the scan runs.
+        - Watch Target: scans once, then keeps Found Items up to date as files are added, grown or deleted (checked every 2 seconds) until you press Stop. Only the changed folders are read again, so it is cheap to leave running.
+        - Sharded scans: to split one big share over several machines, run "python -m scan_shard plan", then "run" on each machine, then open the work folder with Scan Cache → Open Sharded Scan Results.
+        - Snapshots: after a complete scan, Scan Cache → Save Folder Snapshot keeps every folder's exact size. Compare Two Snapshots then lists what grew, shrank, appeared or was deleted in between.
+        - Throttle: on shared storage during business hours, cap the scan at a number of folder reads and file checks per second, and/or at a number of folders read at once. A Stat Latency Target makes the scan slow down by itself while the storage answers slowly, and speed back up afterwards. All three can be changed while a scan runs.
+        - Top N: lists only the N largest (or oldest) matching folders, with exact sizes, instead of every folder over the size limit.
+        - Exclude: folder names, globs or paths separated by ";" (e.g. ".git; node_modules; .snapshot; .zfs") are never walked or counted. "Except" lists folders to walk anyway, and "Stay on this file system" skips mounted drives.
+        - Sizes are exact. A result like "> 1000 MB (Limit Reached)" means the scanner stopped counting early and the folder is at least that big.
         - The bottom Status Bar shows the current folder being scanned in real-time.
         '''
         messagebox.showinfo("How to Use", help_text)
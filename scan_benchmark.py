@@ -0,0 +1,403 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Reproducible benchmarks for the scan engine.
+# Builds synthetic directory trees in a temp folder, scans them headless with
+# several traversal strategies and prints the numbers as JSON, so that runs
+# can be compared before and after a change.
+#
+# Usage: python -m scan_benchmark [--shapes deep_narrow,wide_shallow] [--scale 2] [-o bench.json]
+#        python -m scan_benchmark --baseline bench.json   (exit code 1 on a regression)
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from statistics import median
+
+import scan_engine
+
+try:
+    import resource
+except ImportError:
+    # Windows: no getrusage, peak RSS is reported as null
+    resource = None
+
+# Every file and folder gets this mtime (01-01-2020), so a dormant scan with
+# today's date as reference matches everything and sizes every folder.
+# ctime can't be set from user space; it is the build time.
+FIXED_MTIME = 1577836800.0
+
+
+# --- Tree Shapes ---
+# Each builder fills root and returns (dir_count, file_count) below root.
+# Counts are multiplied by --scale.
+
+def _write(path, size=0):
+    with open(path, "wb") as f:
+        if size:
+            f.write(b"\0" * size)
+
+
+def build_deep_narrow(root, scale):
+    """One long chain of folders with a few files at each level."""
+    depth = int(200 * scale)
+    path = root
+    for level in range(depth):
+        path = os.path.join(path, f"d{level}")
+        os.mkdir(path)
+        for i in range(5):
+            _write(os.path.join(path, f"f{i}.dat"), 4096)
+    return depth, depth * 5
+
+
+def build_wide_shallow(root, scale):
+    """Thousands of sibling folders, each with a handful of files."""
+    width = int(2000 * scale)
+    for i in range(width):
+        path = os.path.join(root, f"d{i:06d}")
+        os.mkdir(path)
+        for j in range(10):
+            _write(os.path.join(path, f"f{j}.dat"), 1024)
+    return width, width * 10
+
+
+def build_tiny_files(root, scale):
+    """Lots of empty files; stat cost dominates (--scale 50 is a million)."""
+    per_dir = 1000
+    dirs = max(1, int(20 * scale))
+    for i in range(dirs):
+        path = os.path.join(root, f"d{i:05d}")
+        os.mkdir(path)
+        for j in range(per_dir):
+            _write(os.path.join(path, f"f{j:04d}"))
+    return dirs, dirs * per_dir
+
+
+def build_sparse_files(root, scale):
+    """A few huge sparse files (apparent size far above allocated size)."""
+    count = max(1, int(4 * scale))
+    path = os.path.join(root, "images")
+    os.mkdir(path)
+    for i in range(count):
+        with open(os.path.join(path, f"disk{i}.img"), "wb") as f:
+            f.truncate(4 * 1024 ** 3)
+            f.write(b"\1" * 4096)
+    return 1, count
+
+
+def build_hardlink_farm(root, scale):
+    """rsync --link-dest style snapshots: every snapshot links the same files."""
+    files = int(500 * scale)
+    snapshots = 10
+    base = os.path.join(root, "snap000")
+    os.mkdir(base)
+    for i in range(files):
+        _write(os.path.join(base, f"f{i:05d}.dat"), 8192)
+    for s in range(1, snapshots):
+        path = os.path.join(root, f"snap{s:03d}")
+        os.mkdir(path)
+        for i in range(files):
+            name = f"f{i:05d}.dat"
+            os.link(os.path.join(base, name), os.path.join(path, name))
+    return snapshots, files * snapshots
+
+
+SHAPES = {
+    "deep_narrow": build_deep_narrow,
+    "wide_shallow": build_wide_shallow,
+    "tiny_files": build_tiny_files,
+    "sparse_files": build_sparse_files,
+    "hardlink_farm": build_hardlink_farm,
+}
+
+
+def build_tree(shape, root, scale):
+    """Builds one shape and pins every timestamp; returns (dir_count, file_count)."""
+    os.makedirs(root)
+    dir_count, file_count = SHAPES[shape](root, scale)
+    # Bottom-up, so setting a file's time doesn't bump its folder's mtime again
+    for dir_path, dir_names, file_names in os.walk(root, topdown=False):
+        for name in file_names:
+            os.utime(os.path.join(dir_path, name), (FIXED_MTIME, FIXED_MTIME))
+        os.utime(dir_path, (FIXED_MTIME, FIXED_MTIME))
+    return dir_count, file_count
+
+
+# --- Strategies ---
+# Keyword arguments for scan_engine.scan(). "index_cold" starts every run
+# from an empty scan index, "index_warm" from one filled by a previous run.
+# The *_fd variants walk through directory descriptors (POSIX only).
+
+STRATEGIES = {
+    "serial": {"workers": 1},
+    "threads4": {"workers": 4},
+    "threads16": {"workers": 16},
+    "processes4": {"workers": 4, "use_processes": True},
+    "serial_fd": {"workers": 1, "fd_relative": True},
+    "threads4_fd": {"workers": 4, "fd_relative": True},
+    "outermost": {"workers": 4, "outermost": True},
+    "du": {"workers": 4, "allocated": True, "dedupe_hardlinks": True},
+    "index_cold": {"workers": 4, "index": True},
+    "index_warm": {"workers": 4, "index": True},
+}
+
+
+class _CountingEntry:
+    """Proxy around os.DirEntry that counts the first stat() (the one that hits the disk)."""
+
+    __slots__ = ("_entry", "_counter", "_stated")
+
+    def __init__(self, entry, counter):
+        self._entry = entry
+        self._counter = counter
+        self._stated = False
+
+    def stat(self, *, follow_symlinks=True):
+        if not self._stated:
+            self._stated = True
+            self._counter.add()
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def __lt__(self, other):
+        return self._entry.path < other._entry.path
+
+
+class _CountingScandir:
+    def __init__(self, iterator, counter):
+        self._it = iterator
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._it.close()
+
+    def __iter__(self):
+        for entry in self._it:
+            yield _CountingEntry(entry, self._counter)
+
+
+class _Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.value += 1
+
+
+def count_stat_calls(root, options, limit_bytes):
+    """Runs one scan with os.scandir/os.stat/os.lstat wrapped and returns the stat count.
+
+    Separate from the timed runs because the wrappers slow the scan down.
+    Only valid for thread workers (process workers don't see the wrappers).
+    """
+    counter = _Counter()
+    real_scandir, real_stat, real_lstat = os.scandir, os.stat, os.lstat
+
+    def scandir(path="."):
+        return _CountingScandir(real_scandir(path), counter)
+
+    def counted(func):
+        def wrapper(*args, **kwargs):
+            counter.add()
+            return func(*args, **kwargs)
+        return wrapper
+
+    os.scandir, os.stat, os.lstat = scandir, counted(real_stat), counted(real_lstat)
+    try:
+        for _ in scan_engine.scan(root, "dormant", time.time(), limit_bytes, **options):
+            pass
+    finally:
+        os.scandir, os.stat, os.lstat = real_scandir, real_stat, real_lstat
+    return counter.value
+
+
+def _peak_rss_kb():
+    # ru_maxrss survives exec() on Linux, so a child would report the peak of
+    # the process that spawned it; VmHWM is reset on exec
+    peak = 0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1])
+    except OSError:
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if resource is not None:
+        # Process pool workers
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_one(root, strategy, index_path, limit_bytes):
+    """Times one scan in this process; meant to run in a fresh interpreter."""
+    options = dict(STRATEGIES[strategy])
+    if options.pop("index", False):
+        options["index_path"] = index_path
+    found = 0
+    started = time.perf_counter()
+    for _ in scan_engine.scan(root, "dormant", time.time(), int(limit_bytes), **options):
+        found += 1
+    wall = time.perf_counter() - started
+    return {"wall_s": wall, "found": found, "peak_rss_kb": _peak_rss_kb()}
+
+
+def _run_isolated(root, strategy, index_path, limit_bytes):
+    # A fresh interpreter per run, so peak RSS belongs to that run alone
+    out = subprocess.run(
+        [sys.executable, "-m", "scan_benchmark", "--run-one", root, strategy, index_path, str(limit_bytes)],
+        check=True, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(out)
+
+
+def benchmark_shape(shape, workdir, scale, strategies, repeat, limit_bytes):
+    root = os.path.join(workdir, shape)
+    started = time.perf_counter()
+    try:
+        dir_count, file_count = build_tree(shape, root, scale)
+    except (OSError, NotImplementedError) as e:
+        # e.g. no hard links on this file system
+        return {"skipped": str(e)}
+    result = {
+        "dirs": dir_count,
+        "files": file_count,
+        "build_s": round(time.perf_counter() - started, 3),
+        "strategies": {},
+    }
+    for strategy in strategies:
+        index_path = os.path.join(workdir, f"{shape}.sqlite3")
+        runs = []
+        for _ in range(repeat):
+            if strategy == "index_cold" and os.path.exists(index_path):
+                os.remove(index_path)
+            elif strategy == "index_warm" and not os.path.exists(index_path):
+                _run_isolated(root, strategy, index_path, limit_bytes)
+            runs.append(_run_isolated(root, strategy, index_path, limit_bytes))
+        wall = median(r["wall_s"] for r in runs)
+        options = {k: v for k, v in STRATEGIES[strategy].items() if k != "index"}
+        stats = None
+        if not options.get("use_processes") and "index" not in STRATEGIES[strategy]:
+            stats = count_stat_calls(root, options, limit_bytes)
+        result["strategies"][strategy] = {
+            "wall_s": round(wall, 4),
+            "wall_s_runs": [round(r["wall_s"], 4) for r in runs],
+            "dirs_per_s": round(dir_count / wall, 1) if wall else None,
+            "files_per_s": round(file_count / wall, 1) if wall else None,
+            "stat_calls": stats,
+            "stat_per_file": round(stats / file_count, 3) if stats is not None and file_count else None,
+            "peak_rss_kb": max((r["peak_rss_kb"] or 0) for r in runs) or None,
+            "found": runs[-1]["found"],
+        }
+    return result
+
+
+def compare(report, baseline, tolerance):
+    """Lists (shape, strategy, old, new) for runs more than tolerance slower than baseline."""
+    regressions = []
+    for shape, data in report["shapes"].items():
+        old_shape = baseline.get("shapes", {}).get(shape, {})
+        for strategy, numbers in data.get("strategies", {}).items():
+            old = old_shape.get("strategies", {}).get(strategy)
+            if old and numbers["wall_s"] > old["wall_s"] * (1 + tolerance):
+                regressions.append((shape, strategy, old["wall_s"], numbers["wall_s"]))
+    return regressions
+
+
+# --- Command Line ---
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--run-one"]:
+        print(json.dumps(run_one(*argv[1:5])))
+        return 0
+
+    parser = argparse.ArgumentParser(
+        prog="python -m scan_benchmark",
+        description="Benchmark the scan engine on synthetic directory trees.")
+    parser.add_argument("--shapes", default=",".join(SHAPES),
+                        help=f"comma-separated tree shapes (default: all of {', '.join(SHAPES)})")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+                        help=f"comma-separated scan strategies (default: all of {', '.join(STRATEGIES)})")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every tree size (default: 1)")
+    parser.add_argument("--size-mb", type=float, default=1.0,
+                        help="scan size limit in MB, decides how much the outermost strategy sums (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per strategy, median is kept (default: 3)")
+    parser.add_argument("--workdir", help="build trees here instead of a new temp folder")
+    parser.add_argument("--keep", action="store_true", help="don't delete the trees afterwards")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against; exit code 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against --baseline, as a fraction (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    shapes = [s for s in args.shapes.split(",") if s]
+    strategies = [s for s in args.strategies.split(",") if s]
+    for name in shapes:
+        if name not in SHAPES:
+            parser.error(f"unknown shape: {name}")
+    for name in strategies:
+        if name not in STRATEGIES:
+            parser.error(f"unknown strategy: {name}")
+    if args.scale <= 0 or args.repeat <= 0:
+        parser.error("--scale and --repeat must be positive")
+
+    workdir = tempfile.mkdtemp(prefix="scan_bench_", dir=args.workdir)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "size_mb": args.size_mb,
+        "repeat": args.repeat,
+        "shapes": {},
+    }
+    try:
+        for shape in shapes:
+            print(f"Benchmarking {shape}...", file=sys.stderr)
+            report["shapes"][shape] = benchmark_shape(shape, workdir, args.scale, strategies, args.repeat,
+                                                     int(args.size_mb * 1024 * 1024))
+    finally:
+        if args.keep:
+            print(f"Trees kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for shape, strategy, old, new in regressions:
+            print(f"REGRESSION {shape}/{strategy}: {old:.3f}s -> {new:.3f}s", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Checkpoints that let an interrupted scan (Stop, crash, reboot) resume
+# where it left off instead of starting over.
+
+import os
+import json
+import time
+
+import scan_engine
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.expanduser("~"), ".folder_scanner", "last_scan.checkpoint.json")
+
+FORMAT_VERSION = 1
+
+# The scan_engine.scan() arguments a checkpoint is tied to
+SCAN_ARGS = ("root", "mode", "reference_epoch", "limit_bytes", "workers", "use_processes",
+             "index_path", "allocated", "dedupe_hardlinks", "outermost", "exclude", "include",
+             "one_file_system", "top_n", "top_by", "activity")
+
+
+class ScanCheckpoint:
+    """Periodically saved state of one running scan.
+
+    params: the scan() arguments, filled in by scan_engine.scan (callers may
+    add their own keys, e.g. the GUI's display settings).
+    state: the engine's traversal frontier and partial totals (see the
+    *_aggregate functions), None for a fresh scan.
+    results: matches already reported, re-emitted first on resume.
+
+    The state is rewritten atomically (temp file + os.replace), and results
+    are appended to a side file, so a crash never leaves a torn checkpoint.
+    """
+
+    INTERVAL_S = 30.0
+    INTERVAL_DIRS = 10000
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH, interval_s=INTERVAL_S, interval_dirs=INTERVAL_DIRS):
+        self.path = path
+        self.interval_s = interval_s
+        self.interval_dirs = interval_dirs
+        self.params = {}
+        self.state = None
+        self.results = []
+        self._saved_results = None  # results already in the side file, None before the first save
+        self._top = None            # scan_engine.TopK of a top-N scan
+        self._dirs = 0
+        self._last_save = time.monotonic()
+
+    @property
+    def results_path(self):
+        return self.path + ".results"
+
+    @classmethod
+    def load(cls, path=DEFAULT_CHECKPOINT_PATH):
+        """Reads a saved checkpoint; OSError if there is none, ValueError if it is unusable."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported checkpoint version: {data.get('version')}")
+        checkpoint = cls(path)
+        checkpoint.params = data["params"]
+        checkpoint.state = data["state"]
+        count = data["results"]
+        if count:
+            with open(checkpoint.results_path, encoding="utf-8") as f:
+                for line in f:
+                    if len(checkpoint.results) == count:
+                        break
+                    checkpoint.results.append(scan_engine.ScanResult(*json.loads(line)))
+            if len(checkpoint.results) < count:
+                raise ValueError("checkpoint results are incomplete")
+        return checkpoint
+
+    @staticmethod
+    def exists(path=DEFAULT_CHECKPOINT_PATH):
+        return os.path.isfile(path)
+
+    def scan_args(self):
+        """Keyword arguments for scan_engine.scan() that continue this scan."""
+        return {name: self.params[name] for name in SCAN_ARGS}
+
+    def due(self):
+        """Counts one folder; True when the next checkpoint should be written."""
+        self._dirs += 1
+        return self._dirs >= self.interval_dirs or time.monotonic() - self._last_save >= self.interval_s
+
+    def keep_top(self, k, by):
+        """Top-N scans: only the k best results are kept and saved, so memory stays O(k)."""
+        self._top = scan_engine.TopK(k, by)
+        for result in self.results:
+            self._top.add(result)
+
+    def add_result(self, result):
+        if self._top is not None:
+            self._top.add(result)
+        else:
+            self.results.append(result)
+
+    def save(self, state):
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        # Results first: the state must never refer to results not on disk
+        if self._top is not None:
+            # Rewritten whole, it is only the k best
+            self.results = self._top.results()
+            _replace_file(self.results_path, "".join(json.dumps(list(result)) + "\n" for result in self.results))
+        else:
+            if self._saved_results is None:
+                mode, new_results = "w", self.results
+            else:
+                mode, new_results = "a", self.results[self._saved_results:]
+            with open(self.results_path, mode, encoding="utf-8") as f:
+                for result in new_results:
+                    f.write(json.dumps(list(result)) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._saved_results = len(self.results)
+
+        _replace_file(self.path, json.dumps({
+            "version": FORMAT_VERSION,
+            "saved": time.time(),
+            "params": self.params,
+            "state": state,
+            "results": len(self.results),
+        }))
+        self._dirs = 0
+        self._last_save = time.monotonic()
+
+    def discard(self):
+        """Deletes the checkpoint files once the scan has completed."""
+        for path in (self.path, self.results_path, self.path + ".tmp", self.results_path + ".tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _replace_file(path, text):
+    # Atomic rewrite: a crash leaves either the old or the new file
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
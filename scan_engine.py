@@ -0,0 +1,2044 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Headless scan engine for the Folder Capacity Scanner.
+# This module must not import tkinter: it is what cron jobs, servers and
+# benchmarks run. The GUI in folder_scanner_app.py is a thin consumer of it.
+#
+# Usage: python -m scan_engine ROOT [--mode dormant|recent] [--date dd-mm-yyyy] [--size-mb N]
+
+import os
+import re
+import sys
+import glob
+import json
+import heapq
+import fnmatch
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import NamedTuple
+
+try:
+    import resource
+except ImportError:
+    # Windows: no fd-relative traversal, so no fd limit to respect either
+    resource = None
+
+import scan_index
+
+
+class ScanResult(NamedTuple):
+    """One folder that matched the scan criteria.
+
+    A NamedTuple keeps records compact (no per-instance __dict__) so large
+    result sets can be held and streamed to exporters cheaply.
+    """
+    path: str
+    timestamp: float         # st_mtime (dormant) or st_ctime (recent), or the subtree's newest activity
+    size: int                # subtree bytes
+    truncated: bool = False  # True if size is only a lower bound
+
+
+# --- Size Accounting ---
+# By default a folder's size is the sum of its files' apparent sizes
+# (st_size). Hard-linked files (rsync --link-dest snapshots, package stores)
+# are then counted once per link, and sparse files at their logical size, so
+# old snapshot folders look far larger than the space deleting them frees.
+
+class InodeSet:
+    """Set of inode numbers stored in a flat array('Q') hash table.
+
+    About 13 bytes per inode at the 0.6 load factor, versus ~70 bytes for a
+    Python set of ints, which matters at tens of millions of linked files.
+    """
+
+    def __init__(self, capacity=1024):
+        self._slots = array("Q", bytes(8 * capacity))
+        self._mask = capacity - 1
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, ino):
+        """Adds ino; returns True if it was not in the set yet."""
+        if ino == 0:
+            # 0 marks an empty slot and is never a real inode number
+            return True
+        slots = self._slots
+        mask = self._mask
+        i = ((ino * 0x9E3779B97F4A7C15) >> 17) & mask
+        while True:
+            current = slots[i]
+            if current == 0:
+                break
+            if current == ino:
+                return False
+            i = (i + 1) & mask
+        slots[i] = ino
+        self._count += 1
+        if self._count * 5 > len(slots) * 3:
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self._slots
+        self._slots = array("Q", bytes(16 * len(old)))
+        self._mask = len(self._slots) - 1
+        self._count = 0
+        for ino in old:
+            if ino:
+                self.add(ino)
+
+
+# Windows has no st_blocks, and the stats of scandir() entries there report
+# st_ino and st_nlink as 0, so neither accounting mode can work
+ALLOCATED_SUPPORTED = hasattr(os.stat_result, "st_blocks")
+HARDLINKS_SUPPORTED = os.name != "nt"
+
+
+class SizeAccounting:
+    """Decides how many bytes a file contributes to its folder.
+
+    allocated: count st_blocks * 512 (space actually used on disk, so sparse
+    files count at their real size) instead of st_size.
+    dedupe_hardlinks: count a file with several links only the first time
+    one of its (st_dev, st_ino) pairs is seen, like du. Only files with
+    st_nlink > 1 are tracked, so ordinary files cost no memory. scan()
+    then walks serially, so the first folder (in sorted walk order) is
+    charged on every run.
+    One instance is shared by all worker threads of a scan.
+    """
+
+    def __init__(self, allocated=False, dedupe_hardlinks=False):
+        self.allocated = allocated and ALLOCATED_SUPPORTED
+        self.dedupe_hardlinks = dedupe_hardlinks and HARDLINKS_SUPPORTED
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Process workers get their own (empty) seen set
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_seen"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def file_bytes(self, st):
+        if self.dedupe_hardlinks and st.st_nlink > 1:
+            with self._lock:
+                seen = self._seen.get(st.st_dev)
+                if seen is None:
+                    seen = self._seen[st.st_dev] = InodeSet()
+                if not seen.add(st.st_ino):
+                    return 0
+        if self.allocated:
+            return st.st_blocks * 512
+        return st.st_size
+
+
+# --- Scan Filters ---
+# Folders such as .git, node_modules or NetApp/ZFS snapshot directories
+# (.snapshot, .zfs) can hold many times the data of the tree they sit in.
+# Excluded folders are dropped while their parent is listed, before they are
+# stat'ed, so nothing below them costs a syscall.
+
+def _compile_patterns(root, patterns):
+    # -> (literal names, name regex or None, path regex or None)
+    flags = re.IGNORECASE if os.name == "nt" else 0
+    names = set()
+    name_globs = []
+    path_globs = []
+    abs_root = os.path.abspath(root)
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        if "/" not in pattern and os.sep not in pattern:
+            if any(c in pattern for c in "*?["):
+                name_globs.append(fnmatch.translate(pattern))
+            else:
+                names.add(os.path.normcase(pattern))
+            continue
+        # Path patterns are spelled like the walk's own paths (root + relative part)
+        if os.path.isabs(pattern):
+            pattern = os.path.relpath(pattern, abs_root)
+            if pattern.split(os.sep)[0] == os.pardir:
+                continue  # outside the scan root
+        pattern = os.path.normpath(pattern)
+        path_globs.append(fnmatch.translate(os.path.join(glob.escape(root), pattern)))
+    name_re = re.compile("|".join(name_globs), flags) if name_globs else None
+    path_re = re.compile("|".join(path_globs), flags) if path_globs else None
+    return frozenset(names), name_re, path_re
+
+
+def _matches(compiled, name, path):
+    names, name_re, path_re = compiled
+    return ((names and os.path.normcase(name) in names)
+            or (name_re is not None and name_re.match(name) is not None)
+            or (path_re is not None and path_re.match(path) is not None))
+
+
+class ScanFilter:
+    """Exclude/include rules for the folders of one scan.
+
+    Patterns without a path separator match a folder name anywhere (".git",
+    "node_modules", "*.cache"); patterns with one match the folder's path,
+    either absolute or relative to the scan root ("/srv/share/tmp",
+    "projects/*/build"). Globs follow fnmatch. A folder that matches an
+    include pattern is never excluded, so includes carve exceptions out of
+    broad excludes (exclude ".*", include ".config").
+    root_dev: if set, folders on another device (mount points) are skipped,
+    like du -x.
+
+    The patterns are compiled once: literal names into a set and globs into
+    one regex per kind, so a folder costs a set lookup and a few matches.
+    """
+
+    def __init__(self, root, exclude=(), include=(), root_dev=None):
+        self.exclude = _compile_patterns(root, exclude)
+        self.include = _compile_patterns(root, include)
+        self.root_dev = root_dev
+
+    def excludes(self, name, path):
+        """True if the folder must not be walked; needs no stat."""
+        return _matches(self.exclude, name, path) and not _matches(self.include, name, path)
+
+    def crosses_device(self, st):
+        return self.root_dev is not None and st.st_dev != self.root_dev
+
+
+# --- Scan Metrics ---
+
+class ScanMetrics:
+    """Counters and timings filled in by the engine while a scan runs.
+
+    Updated once per listed folder under a lock, so the cost doesn't depend
+    on the number of files. Times are summed over all worker threads; for
+    process workers each sub-tree's numbers arrive when it finishes.
+    Read it from any thread with snapshot() or status_line().
+    """
+
+    TIMERS = ("list_s", "stat_s", "size_s", "wait_s", "report_s", "throttle_s")
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.dirs_listed = 0
+        self.dirs_cached = 0      # taken from the scan index, not listed
+        self.dirs_excluded = 0    # skipped by the ScanFilter
+        self.files_seen = 0
+        self.stat_calls = 0
+        self.bytes_summed = 0
+        self.errors = {}          # exception type name -> count
+        self.candidates = 0       # folders that passed the date test
+        self.confirmations = 0    # ... and the size test
+        self.units_total = 0      # progress estimate: independent sub-trees
+        self.units_done = 0
+        for name in self.TIMERS:
+            setattr(self, name, 0.0)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add_listing(self, file_count, stat_calls, nbytes, list_s, stat_s, cached=False, excluded=0):
+        with self._lock:
+            if cached:
+                self.dirs_cached += 1
+            else:
+                self.dirs_listed += 1
+            self.dirs_excluded += excluded
+            self.files_seen += file_count
+            self.stat_calls += stat_calls
+            self.bytes_summed += nbytes
+            self.list_s += list_s
+            self.stat_s += stat_s
+
+    def add_error(self, error):
+        name = type(error).__name__
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def add_candidate(self, confirmed):
+        with self._lock:
+            self.candidates += 1
+            if confirmed:
+                self.confirmations += 1
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + seconds)
+
+    def add_units(self, total=0, done=0):
+        with self._lock:
+            self.units_total += total
+            self.units_done += done
+
+    def merge(self, other):
+        """Adds the counters of a process worker's metrics."""
+        with self._lock:
+            for name in ("dirs_listed", "dirs_cached", "dirs_excluded", "files_seen", "stat_calls", "bytes_summed",
+                         "candidates", "confirmations") + self.TIMERS:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+            for name, count in other.errors.items():
+                self.errors[name] = self.errors.get(name, 0) + count
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def progress(self):
+        """Fraction of the independent sub-trees done, or None if unknown."""
+        if not self.units_total:
+            return None
+        return min(1.0, self.units_done / self.units_total)
+
+    def eta(self):
+        """Seconds left, extrapolated from progress(), or None."""
+        done = self.progress()
+        if not done or self.finished:
+            return None
+        return self.elapsed() * (1 - done) / done
+
+    def snapshot(self):
+        with self._lock:
+            data = {name: value for name, value in self.__dict__.items() if not name.startswith("_")}
+            data["errors"] = dict(self.errors)
+        elapsed = self.elapsed()
+        data["elapsed_s"] = elapsed
+        data["dirs_per_s"] = (data["dirs_listed"] + data["dirs_cached"]) / elapsed if elapsed else 0.0
+        data["files_per_s"] = data["files_seen"] / elapsed if elapsed else 0.0
+        data["bytes_per_s"] = data["bytes_summed"] / elapsed if elapsed else 0.0
+        data["progress"] = self.progress()
+        data["eta_s"] = self.eta()
+        return data
+
+    def status_line(self):
+        """One line of rates and progress for a status bar."""
+        data = self.snapshot()
+        line = (f"{data['dirs_per_s']:,.0f} dirs/s | {data['files_per_s']:,.0f} files/s"
+                f" | {data['bytes_per_s'] / (1024*1024):,.1f} MB/s")
+        errors = sum(data["errors"].values())
+        if errors:
+            line += f" | {errors} errors"
+        if data["progress"] is not None:
+            line += f" | {data['progress']:.0%}"
+            if data["eta_s"] is not None:
+                line += f", ETA {timedelta(seconds=int(data['eta_s']))}"
+        return line
+
+    def dump(self, path):
+        """Writes snapshot() as JSON."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+            f.write("\n")
+
+
+# --- Throttling ---
+# A full-speed walk can saturate the metadata operations of a shared NAS and
+# slow down everything else using it. A ScanThrottle paces the walk: a token
+# bucket on directory reads and stat calls, a cap on the folders listed at
+# the same time, and a stat latency target that lowers the rate while the
+# storage is slow and raises it again once it recovers.
+
+class ScanThrottle:
+    """Rate and concurrency limits shared by all threads of a scan.
+
+    rate: directory reads plus stat calls per second (None: unlimited).
+    max_concurrency: folders listed at the same time (None: unlimited).
+    target_latency_ms: while the average stat takes longer, the rate in
+    force (limit) is halved once per ADJUST_S, down to MIN_RATE; below the
+    target it grows back by a tenth per ADJUST_S, up to rate. Without a
+    rate, backing off starts from the rate observed so far.
+    configure() changes the settings while a scan runs. It can't be shared
+    with worker processes: scan() uses threads when it is given one.
+    """
+
+    MIN_RATE = 10.0
+    ADJUST_S = 1.0
+    BURST_S = 0.1       # tokens that may pile up, in seconds of the rate
+    SMOOTHING = 0.2     # weight of each folder's stats in the latency average
+
+    def __init__(self, rate=None, max_concurrency=None, target_latency_ms=None):
+        self._cond = threading.Condition()
+        self._tokens = 0.0
+        self._refilled = time.monotonic()
+        self._active = 0
+        self._window_ops = 0
+        self._window_start = time.monotonic()
+        self.latency_s = None     # smoothed duration of one stat call
+        self.configure(rate, max_concurrency, target_latency_ms)
+
+    def configure(self, rate=None, max_concurrency=None, target_latency_ms=None):
+        """Replaces the settings (0 or None turns a limit off); waiting threads pick them up at once."""
+        with self._cond:
+            self.rate = float(rate) if rate else None
+            self.max_concurrency = int(max_concurrency) if max_concurrency else None
+            self.target_s = target_latency_ms / 1000.0 if target_latency_ms else None
+            self.limit = self.rate
+            self._cond.notify_all()
+
+    @property
+    def active(self):
+        """True when any limit is set."""
+        return self.rate is not None or self.max_concurrency is not None or self.target_s is not None
+
+    def take(self):
+        """Waits for the token of one directory read or stat call; returns the seconds waited."""
+        if self.limit is None:
+            return 0.0
+        started = time.monotonic()
+        with self._cond:
+            while self.limit is not None:
+                now = time.monotonic()
+                burst = max(1.0, self.limit * self.BURST_S)
+                self._tokens = min(burst, self._tokens + (now - self._refilled) * self.limit)
+                self._refilled = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    break
+                self._cond.wait((1.0 - self._tokens) / self.limit)
+        return time.monotonic() - started
+
+    def begin(self):
+        """Before listing a folder: waits for a free slot and the read's token.
+
+        Returns (seconds waited, whether a slot was taken); pass the latter to end().
+        """
+        if not self.active:
+            # No lock while nothing is limited, so idle throttles don't serialize workers
+            return 0.0, False
+        started = time.monotonic()
+        with self._cond:
+            while self.max_concurrency is not None and self._active >= self.max_concurrency:
+                self._cond.wait()
+            # Slots are only counted under a concurrency limit
+            slot = self.max_concurrency is not None
+            if slot:
+                self._active += 1
+        return time.monotonic() - started + self.take(), slot
+
+    def end(self, slot, stat_s=0.0, stat_calls=0):
+        """After listing a folder: frees its slot (if begin() took one) and records how long its stat calls took."""
+        if not slot and not self.active:
+            return
+        with self._cond:
+            if slot:
+                self._active -= 1
+                self._cond.notify_all()
+            self._window_ops += stat_calls + 1
+            if stat_calls:
+                sample = stat_s / stat_calls
+                if self.latency_s is None:
+                    self.latency_s = sample
+                else:
+                    self.latency_s += self.SMOOTHING * (sample - self.latency_s)
+            now = time.monotonic()
+            if now - self._window_start >= self.ADJUST_S:
+                self._adjust(now)
+
+    def _adjust(self, now):
+        observed = self._window_ops / (now - self._window_start)
+        self._window_ops = 0
+        self._window_start = now
+        if self.target_s is None or self.latency_s is None:
+            return
+        if self.latency_s > self.target_s:
+            # The storage is struggling: back off hard
+            self.limit = max(self.MIN_RATE, (self.limit or observed) / 2)
+        elif self.limit is not None and self.limit != self.rate:
+            # Recovered: creep back up
+            self.limit *= 1.1
+            if self.rate is not None and self.limit >= self.rate:
+                self.limit = self.rate
+            elif self.rate is None and self.limit > 2 * observed:
+                # No longer what holds the scan back
+                self.limit = None
+            self._cond.notify_all()
+
+    def status(self):
+        """One line for a status bar, "" when nothing is limited."""
+        parts = []
+        if self.limit is not None:
+            backed_off = self.rate is None or self.limit < self.rate
+            parts.append(f"{self.limit:,.0f} ops/s" + (" (backed off)" if backed_off else ""))
+        if self.max_concurrency is not None:
+            parts.append(f"{self.max_concurrency} at a time")
+        if self.target_s is not None and self.latency_s is not None:
+            parts.append(f"stat {self.latency_s * 1000:.1f} ms (target {self.target_s * 1000:g})")
+        return "Throttle: " + ", ".join(parts) if parts else ""
+
+
+# --- Traversal Layer ---
+# Each directory is listed exactly once with os.scandir. The DirEntry type
+# bits come for free with the listing, and entry.stat(follow_symlinks=False)
+# is a single lstat on POSIX (and no syscall at all on Windows), so one stat
+# per entry feeds both the date filter and the size accumulation.
+
+def _stat_timed(entry, timer):
+    # entry.stat() with its duration added to timer[0]
+    started = time.perf_counter()
+    try:
+        return entry.stat(follow_symlinks=False)
+    finally:
+        timer[0] += time.perf_counter() - started
+
+
+def scan_directory(path, stop_event=None, accounting=None, metrics=None, scan_filter=None, age_edges=None,
+                   age_bytes=None, activity=None, newest=None, dir_fd=None, throttle=None):
+    """Lists one folder. Returns (own_bytes, file_count, subdirs) with subdirs as (path, lstat) pairs.
+
+    Sub-folders rejected by scan_filter (a ScanFilter) are left out.
+    age_bytes (a list, see ScanTable) gets each file's bytes added to its
+    mtime's bucket among age_edges.
+    newest (a one-item list) is raised to the newest activity timestamp of
+    the folder's files (see ACTIVITY_KEYS).
+    dir_fd is an open descriptor of path (see _open_dir): the folder is then
+    listed and its entries stat'ed relative to it, and path is only used to
+    name the sub-folders.
+    throttle is an optional ScanThrottle that paces the listing and each stat.
+    """
+    own_bytes = 0
+    file_count = 0
+    subdirs = []
+    excluded = 0
+    if newest is not None:
+        stamp_of = ACTIVITY_KEYS[activity]
+        latest = newest[0]
+    stat_timer = None
+    # Stats are timed for the metrics, and for a throttle with a latency target
+    timed = throttle is not None and throttle.target_s is not None
+    if metrics is not None or timed:
+        started = time.perf_counter()
+        stat_timer = [0.0]
+    if throttle is not None:
+        waited, slot = throttle.begin()
+    try:
+        with os.scandir(path if dir_fd is None else dir_fd) as it:
+            for entry in it:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        # Entries of an fd listing only know their name
+                        entry_path = entry.path if dir_fd is None else os.path.join(path, entry.name)
+                        if scan_filter is not None and scan_filter.excludes(entry.name, entry_path):
+                            excluded += 1
+                            continue
+                        if throttle is not None:
+                            waited += throttle.take()
+                        if stat_timer is None:
+                            st = entry.stat(follow_symlinks=False)
+                        else:
+                            st = _stat_timed(entry, stat_timer)
+                        if scan_filter is not None and scan_filter.crosses_device(st):
+                            excluded += 1
+                            continue
+                        subdirs.append((entry_path, st))
+                    elif not entry.is_symlink():
+                        if throttle is not None:
+                            waited += throttle.take()
+                        if stat_timer is None:
+                            st = entry.stat(follow_symlinks=False)
+                        else:
+                            st = _stat_timed(entry, stat_timer)
+                        nbytes = st.st_size if accounting is None else accounting.file_bytes(st)
+                        own_bytes += nbytes
+                        if age_bytes is not None:
+                            age_bytes[bisect_right(age_edges, st.st_mtime)] += nbytes
+                        if newest is not None:
+                            stamp = stamp_of(st)
+                            if stamp > latest:
+                                latest = stamp
+                        file_count += 1
+                except (FileNotFoundError, PermissionError):
+                    pass
+    finally:
+        if throttle is not None:
+            if timed:
+                throttle.end(slot, stat_timer[0], file_count + len(subdirs))
+            else:
+                throttle.end(slot)
+    if newest is not None:
+        newest[0] = latest
+    # Sorted so that results come out in the same order on every run
+    subdirs.sort()
+    if metrics is not None:
+        stat_s = stat_timer[0]
+        list_s = time.perf_counter() - started - stat_s
+        if throttle is not None and waited:
+            list_s -= waited
+            metrics.add_time("throttle_s", waited)
+        metrics.add_listing(file_count, file_count + len(subdirs), own_bytes, list_s, stat_s, excluded=excluded)
+    return own_bytes, file_count, subdirs
+
+
+def list_subdirs(path, stop_event=None, metrics=None, scan_filter=None, throttle=None):
+    """Like scan_directory, but only the sorted (path, lstat) sub-folders; files are not stat'ed."""
+    subdirs = []
+    excluded = 0
+    started = time.perf_counter()
+    waited, slot = throttle.begin() if throttle is not None else (0.0, False)
+    timed = throttle is not None and throttle.target_s is not None
+    stat_timer = [0.0]
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if scan_filter is not None and scan_filter.excludes(entry.name, entry.path):
+                            excluded += 1
+                            continue
+                        if throttle is not None:
+                            waited += throttle.take()
+                        if timed:
+                            st = _stat_timed(entry, stat_timer)
+                        else:
+                            st = entry.stat(follow_symlinks=False)
+                        if scan_filter is not None and scan_filter.crosses_device(st):
+                            excluded += 1
+                            continue
+                        subdirs.append((entry.path, st))
+                except (FileNotFoundError, PermissionError):
+                    pass
+    finally:
+        if throttle is not None:
+            throttle.end(slot, stat_timer[0], len(subdirs) if timed else 0)
+    subdirs.sort()
+    if metrics is not None:
+        if waited:
+            metrics.add_time("throttle_s", waited)
+        metrics.add_listing(0, len(subdirs), 0, time.perf_counter() - started - waited, 0.0, excluded=excluded)
+    return subdirs
+
+
+def list_directory(path, dir_stat, stop_event=None, index=None, accounting=None, metrics=None,
+                   scan_filter=None, age_edges=None, age_bytes=None, activity=None, newest=None, dir_fd=None,
+                   throttle=None):
+    """scan_directory with the incremental scan index (if any) in front of it."""
+    if index is not None and dir_stat is not None:
+        started = time.perf_counter()
+        cached = index.lookup(path, dir_stat)
+        if cached is not None:
+            if metrics is not None:
+                # The lookup lstat's each child folder
+                metrics.add_listing(cached[1], len(cached[2]), cached[0],
+                                    time.perf_counter() - started, 0.0, cached=True)
+            return cached
+    return scan_directory(path, stop_event, accounting, metrics, scan_filter, age_edges, age_bytes, activity, newest,
+                          dir_fd, throttle)
+
+
+# --- Directory Descriptors ---
+# scandir(path) stats each entry through its full path, so the kernel
+# resolves every component of it again, for every file: slow on deep trees
+# and on NFS, where each lookup can be a round trip. With fd_relative the
+# walk opens each folder once, relative to its parent's descriptor, and
+# lists and stats it through that descriptor (scandir(fd) stats with
+# fstatat). The open folders are the walk stack, which is also why a
+# folder renamed or moved mid-scan is still summed as a whole. Only the
+# top fd_depth folders of a stack are kept open; deeper ones are opened by
+# path, so a walk never holds more descriptors than that.
+
+FD_RELATIVE_SUPPORTED = (hasattr(os, "O_DIRECTORY") and os.scandir in os.supports_fd
+                         and os.open in os.supports_dir_fd and os.stat in os.supports_dir_fd)
+
+# Folders kept open per walk, at most
+FD_DEPTH = 64
+
+_DIR_OPEN_FLAGS = (os.O_RDONLY | getattr(os, "O_DIRECTORY", 0) | getattr(os, "O_NOFOLLOW", 0)
+                   | getattr(os, "O_CLOEXEC", 0))
+
+
+def _open_dir(path, dir_fd=None):
+    """Opens folder path for listing: by its name relative to dir_fd (its parent), or by path.
+
+    O_NOFOLLOW: a folder swapped for a symlink since it was listed is not followed.
+    """
+    try:
+        if dir_fd is None:
+            return os.open(path, _DIR_OPEN_FLAGS)
+        return os.open(os.path.basename(path), _DIR_OPEN_FLAGS, dir_fd=dir_fd)
+    except OSError as e:
+        # Report the full path, not just the name
+        e.filename = path
+        raise
+
+
+def _fd_budget(walks=1):
+    """How many folders each of walks concurrent walks may keep open: a quarter of the fd limit, shared."""
+    limit = FD_DEPTH
+    if resource is not None:
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        if soft != resource.RLIM_INFINITY:
+            limit = min(limit, soft // 4 // max(1, walks))
+    return max(1, limit)
+
+
+def _resume_stack(top, top_stat, saved_frames, on_error=None, scan_filter=None, throttle=None):
+    """Rebuilds walk_aggregate's stack from a checkpoint.
+
+    Only the folders on the saved stack are listed again (sub-folders only,
+    no file stats); their own totals come from the checkpoint, and children
+    up to the last finished one are skipped.
+    """
+    stack = []
+    for path, total, own_bytes, file_count, last_child, *newest in saved_frames:
+        try:
+            dir_stat = top_stat if not stack else os.lstat(path)
+            subdirs = list_subdirs(path, scan_filter=scan_filter, throttle=throttle)
+        except OSError as e:
+            # Gone since the checkpoint: the folders below it are gone too
+            if on_error is not None:
+                on_error(e)
+            break
+        remaining = [child for child in subdirs if last_child is None or child[0] > last_child]
+        # Checkpoints from before activity dating have no newest timestamp
+        newest = newest if newest and newest[0] is not None else None
+        stack.append([path, dir_stat, total, iter(remaining), own_bytes, file_count, subdirs, last_child, None,
+                      newest, None])
+    return stack
+
+
+def _stack_state(stack):
+    return {"stack": [[frame[0], frame[2], frame[4], frame[5], frame[7], frame[9] and frame[9][0]]
+                      for frame in stack]}
+
+
+def walk_aggregate(top, stop_event=None, on_error=None, index=None, accounting=None, metrics=None,
+                   checkpoint=None, scan_filter=None, table=None, activity=None, fd_depth=0, throttle=None,
+                   progress=False):
+    """Post-order walk of top that rolls every subtree total into its parent.
+
+    Yields (path, lstat, total) for each folder once its whole subtree has
+    been summed; the last item is top itself (its lstat is None without an
+    index). Nothing more is yielded once stop_event is set.
+    With an index, unchanged folders are taken from the cache and every
+    finished folder is written back to it.
+    accounting is an optional SizeAccounting (default: apparent st_size).
+    metrics is an optional ScanMetrics to count into.
+    checkpoint is an optional scan_checkpoint.ScanCheckpoint: the stack is
+    saved to it periodically and on stop, and a loaded one is resumed from.
+    scan_filter is an optional ScanFilter; excluded folders are not walked.
+    table is an optional ScanTable that gets a row per finished folder (top
+    too, stat'ed with lstat). It can't be used with an index or a resume.
+    activity (a key of ACTIVITY_KEYS) dates each folder by the newest
+    timestamp in its subtree: the lstat yielded is then an Activity. It
+    can't be used with an index.
+    fd_depth > 0 lists folders through descriptors opened relative to their
+    parent's, keeping at most fd_depth of them open (see _open_dir).
+    throttle is an optional ScanThrottle that paces the listings.
+    progress counts top's sub-folders as metrics units: the total from the
+    walk's own listing of top, one done as each sub-tree is finished.
+    """
+    top_stat = os.stat(top) if index is not None else None
+    if table is not None or activity is not None:
+        top_stat = os.lstat(top)
+    edges = table.edges if table is not None else None
+    stamp_of = ACTIVITY_KEYS[activity] if activity is not None else None
+    if checkpoint is not None and checkpoint.state is not None:
+        stack = _resume_stack(top, top_stat, checkpoint.state["stack"], on_error, scan_filter, throttle)
+    else:
+        ages = table.new_ages() if table is not None else None
+        newest = [stamp_of(top_stat)] if stamp_of is not None else None
+        top_fd = _open_dir(top) if fd_depth else None
+        try:
+            own_bytes, file_count, subdirs = list_directory(top, top_stat, stop_event, index, accounting, metrics,
+                                                            scan_filter, edges, ages, activity, newest, top_fd,
+                                                            throttle)
+        except OSError:
+            if top_fd is not None:
+                os.close(top_fd)
+            raise
+        # Frame: [path, lstat, running total, iterator over sub-folders, own_bytes, file_count, subdirs,
+        #         last child taken (finished or on the stack), subtree bytes by age (with a table),
+        #         [newest activity in the subtree] (with activity), open descriptor (with fd_depth)]
+        stack = [[top, top_stat, own_bytes, iter(subdirs), own_bytes, file_count, subdirs, None, ages, newest,
+                  top_fd]]
+    if progress and metrics is not None and stack:
+        done = 0
+        if stack[0][7] is not None:
+            # Resumed: the sub-trees up to the last child taken were finished,
+            # unless that one is still on the stack
+            done = sum(1 for path, _ in stack[0][6] if path <= stack[0][7]) - (len(stack) > 1)
+        metrics.add_units(total=len(stack[0][6]), done=done)
+    try:
+        while stack:
+            if stop_event is not None and stop_event.is_set():
+                if checkpoint is not None:
+                    checkpoint.save(_stack_state(stack))
+                return
+            if checkpoint is not None and checkpoint.due():
+                checkpoint.save(_stack_state(stack))
+            frame = stack[-1]
+            child = next(frame[3], None)
+            if child is not None:
+                child_path, child_stat = child
+                ages = table.new_ages() if table is not None else None
+                newest = [stamp_of(child_stat)] if stamp_of is not None else None
+                child_fd = None
+                try:
+                    if fd_depth:
+                        child_fd = _open_dir(child_path, frame[10])
+                    own_bytes, file_count, subdirs = list_directory(child_path, child_stat, stop_event, index,
+                                                                    accounting, metrics, scan_filter, edges, ages,
+                                                                    activity, newest, child_fd, throttle)
+                except OSError as e:
+                    if child_fd is not None:
+                        os.close(child_fd)
+                    if on_error is not None:
+                        on_error(e)
+                    frame[7] = child_path
+                    continue
+                if child_fd is not None and (not subdirs or len(stack) >= fd_depth):
+                    # Only needed to open sub-folders, and only this high up the stack
+                    os.close(child_fd)
+                    child_fd = None
+                if stop_event is not None and stop_event.is_set():
+                    # The listing may be cut short: leave the child for the resumed scan
+                    if child_fd is not None:
+                        os.close(child_fd)
+                    continue
+                frame[7] = child_path
+                stack.append([child_path, child_stat, own_bytes, iter(subdirs), own_bytes, file_count, subdirs, None,
+                              ages, newest, child_fd])
+                continue
+
+            stack.pop()
+            if frame[10] is not None:
+                os.close(frame[10])
+                frame[10] = None
+            dir_stat = frame[1]
+            if stamp_of is not None:
+                dir_stat = Activity(frame[9][0], frame[9][0])
+            if index is not None:
+                index.store(frame[0], frame[1], frame[4], frame[5], frame[2], frame[6])
+            if table is not None:
+                table.add(frame[0], dir_stat, frame[2], frame[8], frame[5])
+            if stack:
+                stack[-1][2] += frame[2]
+                if progress and metrics is not None and len(stack) == 1:
+                    metrics.add_units(done=1)
+                if table is not None:
+                    parent_ages = stack[-1][8]
+                    for i, nbytes in enumerate(frame[8]):
+                        parent_ages[i] += nbytes
+                if stamp_of is not None and frame[9][0] > stack[-1][9][0]:
+                    stack[-1][9][0] = frame[9][0]
+            yield frame[0], dir_stat, frame[2]
+    finally:
+        # Stopped, failed or abandoned: close what is still open
+        for frame in stack:
+            if frame[10] is not None:
+                os.close(frame[10])
+
+
+# --- Subtree Activity ---
+# A folder's own mtime only changes when entries are added, removed or
+# renamed, so a folder whose files are edited every day still looks
+# dormant. With activity, each folder is dated instead by the newest
+# timestamp anywhere in its subtree (itself, its files and sub-folders),
+# taken from the stats the walk makes anyway and rolled up with the sizes.
+
+# Which timestamps count as activity
+ACTIVITY_KEYS = {
+    "mtime": attrgetter("st_mtime"),  # content written
+    "ctime": attrgetter("st_ctime"),  # content or metadata (chmod, chown, rename) changed
+    "atime": attrgetter("st_atime"),  # also read (not recorded on noatime mounts)
+    "any": lambda st: max(st.st_mtime, st.st_ctime, st.st_atime),
+}
+
+
+class Activity(NamedTuple):
+    """Stands in for a folder's lstat in match_date: both dates are its subtree's newest activity."""
+    st_mtime: float
+    st_ctime: float
+
+
+def match_date(dir_stat, mode, reference_epoch):
+    """Returns the folder's timestamp if it passes the date test, otherwise None."""
+    # Timestamps come from the parent's scandir listing, no extra stat needed
+    if mode == "dormant":
+        folder_timestamp = dir_stat.st_mtime
+        is_match = folder_timestamp < reference_epoch
+    elif mode == "recent":
+        folder_timestamp = dir_stat.st_ctime
+        is_match = folder_timestamp > reference_epoch
+    else:
+        return None
+    return folder_timestamp if is_match else None
+
+
+def match_folder(dir_stat, folder_size, mode, reference_epoch, limit_bytes):
+    """Returns the folder's timestamp if it matches the scan criteria, otherwise None."""
+    if folder_size > limit_bytes:
+        return match_date(dir_stat, mode, reference_epoch)
+    return None
+
+
+def _check_folder(path, dir_stat, folder_size, criteria, metrics=None):
+    """match_folder as a ScanResult (or None), counting candidates into metrics."""
+    if metrics is None:
+        folder_timestamp = match_folder(dir_stat, folder_size, *criteria)
+        if folder_timestamp is None:
+            return None
+        return ScanResult(path, folder_timestamp, folder_size)
+    mode, reference_epoch, limit_bytes = criteria
+    folder_timestamp = match_date(dir_stat, mode, reference_epoch)
+    if folder_timestamp is None:
+        return None
+    metrics.add_candidate(folder_size > limit_bytes)
+    if folder_size > limit_bytes:
+        return ScanResult(path, folder_timestamp, folder_size)
+    return None
+
+
+# --- Top-N ---
+# Instead of a size threshold, keep the N largest (or oldest) matching
+# folders of one full aggregation pass. Every folder is summed to the end
+# anyway, so the sizes are exact; only the heap of the N best is kept.
+
+class TopK:
+    """The k best ScanResults seen so far, in a bounded min-heap.
+
+    by="size" keeps the largest folders, by="age" the oldest (smallest
+    timestamp). Memory is O(k) however many folders qualify. Ties are
+    broken by path, so the outcome doesn't depend on arrival order.
+    """
+
+    BY = ("size", "age")
+
+    def __init__(self, k, by="size"):
+        if by not in self.BY:
+            raise ValueError(f"unknown top-N order: {by}")
+        self.k = k
+        self.by = by
+        self._heap = []  # (key, path, result); the root is the weakest one kept
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, result):
+        key = result.size if self.by == "size" else -result.timestamp
+        item = (key, result.path, result)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def results(self):
+        """The kept results, best first."""
+        return [item[2] for item in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+
+def _top_results(results, top):
+    # Drains a result generator into top, then yields the best first
+    try:
+        for result in results:
+            top.add(result)
+    finally:
+        results.close()
+    yield from top.results()
+
+
+# --- Folder Table ---
+# A full (non-outermost) scan sums every folder anyway. Keeping each
+# folder's timestamps and subtree total lets any other date / size / mode
+# be answered from memory instead of by walking the disk again. Each row
+# also has a histogram of the subtree's bytes by file age.
+# At tens of millions of folders a dict or list of path strings alone
+# takes gigabytes, so the table is a tree: every row stores its parent's
+# row and only its own name, and paths are rebuilt for the rows asked for.
+
+# Histogram bucket edges, in days before the scan (the GUI's horizons)
+AGE_BUCKET_DAYS = (1825, 1095, 730, 365, 180, 90, 30, 14, 7)
+
+
+class ScanTable:
+    """Compact tree of every folder one scan summed, one row per folder in post-order.
+
+    Rows live in array() columns: parent row, first row of the subtree
+    (int32), name offset, dir mtime and ctime, subtree bytes and file count,
+    and 1 + len(edges) + 1 int64s of ages: the subtree's bytes by file
+    mtime, bucket 0 older than the first edge, the last one newer than the
+    last edge. Names are the folders' base names, UTF-8 in one bytearray,
+    so a folder costs about 140 bytes plus its name.
+    Post-order makes every subtree a contiguous range of rows ending at its
+    root (subtree()), and a folder's last child the row just before it.
+    complete is set by scan() once the walk has finished; a stopped or
+    resumed scan leaves it False.
+    """
+
+    def __init__(self, now=None, edges=None):
+        # edges is only passed by fragment(); labels assume AGE_BUCKET_DAYS
+        if edges is None:
+            now = time.time() if now is None else now
+            edges = [now - days * 86400 for days in AGE_BUCKET_DAYS]
+        self.edges = list(edges)  # ascending epochs
+        self.root = None
+        self.complete = False
+        self.parents = array("i")    # -1 until the parent folder is added
+        self.starts = array("i")
+        self.name_ends = array("q")  # row's name is names[name_ends[row - 1]:name_ends[row]]
+        self.names = bytearray()
+        self.mtimes = array("d")
+        self.ctimes = array("d")
+        self.totals = array("q")
+        self.files = array("q")
+        self.ages = array("q")
+        # Rows without a parent yet, as [path, row, parent path + separator]:
+        # the scan root at the end, more while the walk is on its way up
+        self._orphans = []
+
+    def __len__(self):
+        return len(self.parents)
+
+    def fragment(self):
+        """An empty table with the same buckets, for a worker to fill."""
+        return ScanTable(edges=self.edges)
+
+    def new_ages(self):
+        return [0] * (len(self.edges) + 1)
+
+    def add(self, path, dir_stat, total, ages, file_count=0):
+        """Appends a finished folder; file_count is its own files, the subtree's are added up here."""
+        row = len(self.parents)
+        start = row
+        orphans = self._orphans
+        # Post-order: the folder's children are the last rows still waiting for a parent
+        prefix = os.path.join(path, "")
+        while orphans and orphans[-1][2] == prefix:
+            child = orphans.pop()[1]
+            self.parents[child] = row
+            start = self.starts[child]
+            file_count += self.files[child]
+        name = os.path.basename(path)
+        orphans.append([path, row, path[:len(path) - len(name)]])
+        self.parents.append(-1)
+        self.starts.append(start)
+        self.names += os.fsencode(name)
+        self.name_ends.append(len(self.names))
+        self.mtimes.append(dir_stat.st_mtime)
+        self.ctimes.append(dir_stat.st_ctime)
+        self.totals.append(total)
+        self.files.append(file_count)
+        self.ages.extend(ages)
+
+    def extend(self, other):
+        """Appends a worker's fragment; its top folders wait for their parent like any other row."""
+        offset = len(self.parents)
+        name_offset = len(self.names)
+        self.parents.extend(array("i", (parent + offset if parent >= 0 else -1 for parent in other.parents)))
+        self.starts.extend(array("i", (start + offset for start in other.starts)))
+        self.name_ends.extend(array("q", (end + name_offset for end in other.name_ends)))
+        self.names += other.names
+        self.mtimes.extend(other.mtimes)
+        self.ctimes.extend(other.ctimes)
+        self.totals.extend(other.totals)
+        self.files.extend(other.files)
+        self.ages.extend(other.ages)
+        self._orphans.extend([path, row + offset, prefix] for path, row, prefix in other._orphans)
+
+    def last_row(self, path):
+        """Row of path if it is the folder added last, else None (e.g. it was unreadable)."""
+        if self._orphans and self._orphans[-1][0] == path:
+            return self._orphans[-1][1]
+        return None
+
+    def row_ages(self, row):
+        width = len(self.edges) + 1
+        return self.ages[row * width:(row + 1) * width]
+
+    def name(self, row):
+        return os.fsdecode(bytes(self.names[self.name_ends[row - 1] if row else 0:self.name_ends[row]]))
+
+    def path(self, row, _known=None):
+        """Rebuilds row's path from the names up to its top folder.
+
+        _known is an optional {row: path} cache shared by several calls.
+        """
+        first = row
+        names = []
+        while self.parents[row] >= 0 and (_known is None or row not in _known):
+            names.append(self.name(row))
+            row = self.parents[row]
+        if _known is not None and row in _known:
+            path = _known[row]
+        else:
+            path = next(orphan[0] for orphan in self._orphans if orphan[1] == row)
+        for name in reversed(names):
+            path = os.path.join(path, name)
+        if _known is not None:
+            _known[first] = path
+        return path
+
+    def children(self, row):
+        """Rows of row's sub-folders, last first (each one ends where the next one's subtree starts)."""
+        child = row - 1
+        while child >= self.starts[row]:
+            yield child
+            child = self.starts[child] - 1
+
+    def subtree(self, row):
+        """range of the rows in row's subtree, row itself last."""
+        return range(self.starts[row], row + 1)
+
+    def find(self, path):
+        """Row of path, or None. Walks down from the top folder containing it, one child list per level."""
+        for top_path, row, _ in self._orphans:
+            if path == top_path:
+                return row
+            try:
+                relative = os.path.relpath(path, top_path)
+            except ValueError:
+                continue  # another drive
+            if relative == os.curdir:
+                return row
+            if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+                continue
+            for name in relative.split(os.sep):
+                row = next((child for child in self.children(row) if self.name(child) == name), None)
+                if row is None:
+                    break
+            return row
+        return None
+
+    def filter(self, mode, reference_epoch, limit_bytes):
+        """The ScanResults a scan with these criteria would yield, in the same order."""
+        stamps = self.mtimes if mode == "dormant" else self.ctimes
+        dormant = mode == "dormant"
+        parents = self.parents
+        known = {}
+        results = []
+        for row, total in enumerate(self.totals):
+            # The scan root (a row without parent) is never reported
+            if total > limit_bytes and parents[row] >= 0:
+                stamp = stamps[row]
+                if (stamp < reference_epoch) if dormant else (stamp > reference_epoch):
+                    path = self.path(parents[row], known)
+                    results.append(ScanResult(os.path.join(path, self.name(row)), stamp, total))
+        return results
+
+    def age_profile(self, path):
+        """[(label, bytes)] of path's subtree by file age, oldest first; None if path isn't in the table."""
+        row = self.find(path)
+        if row is None:
+            return None
+        days = AGE_BUCKET_DAYS
+        labels = ([f"older than {_days_label(days[0])}"]
+                  + [f"{_days_label(older)} - {_days_label(newer)}" for older, newer in zip(days, days[1:])]
+                  + [f"newer than {_days_label(days[-1])}"])
+        return list(zip(labels, self.row_ages(row)))
+
+
+def _days_label(days):
+    if days % 365 == 0:
+        return f"{days // 365} yr"
+    if days % 30 == 0:
+        return f"{days // 30} mth"
+    if days % 7 == 0:
+        return f"{days // 7} wk"
+    return f"{days} d"
+
+
+# --- Parallel Sizing ---
+# Independent sub-trees are summed on a bounded worker pool. The top of the
+# tree is expanded breadth-first until there is enough work for every worker,
+# then the expanded part is folded back post-order while waiting on each
+# sub-tree's future in turn, so matches are emitted in exactly the same order
+# as a serial walk.
+
+# Sub-trees a checkpointed parallel scan is split into (at least)
+CHECKPOINT_SUBTREES = 256
+
+# Set by the process pool initializer, processes can't share threading.Event
+_worker_stop_event = None
+
+
+def _init_process_worker(stop_event):
+    global _worker_stop_event
+    _worker_stop_event = stop_event
+
+
+def _aggregate_subtree(path, criteria, stop_event=None, on_progress=None, index_path=None, accounting=None,
+                       metrics=None, scan_filter=None, top=None, table=None, activity=None, fd_depth=0,
+                       throttle=None):
+    """Worker entry point: returns (total, matches, errors, metrics, table, newest) for one sub-tree.
+
+    top: (k, by) for a top-N scan; only the sub-tree's k best matches are kept.
+    table: an empty ScanTable fragment to fill with the sub-tree's folders.
+    newest is the sub-tree's newest activity timestamp, None without activity.
+    """
+    if stop_event is None:
+        stop_event = _worker_stop_event
+    index = scan_index.open_for_thread(index_path) if index_path else None
+    total = None  # stays None if the walk was stopped before the sub-tree was done
+    newest = None
+    matches = []
+    best = TopK(*top) if top is not None else None
+    errors = []
+    try:
+        for dir_path, dir_stat, folder_size in walk_aggregate(path, stop_event, errors.append, index,
+                                                              accounting, metrics, scan_filter=scan_filter,
+                                                              table=table, activity=activity, fd_depth=fd_depth,
+                                                              throttle=throttle):
+            if dir_path == path:
+                # The sub-tree root is matched by the caller, which has its lstat
+                total = folder_size
+                if activity is not None:
+                    newest = dir_stat.st_mtime
+                break
+            if on_progress is not None:
+                on_progress(dir_path)
+            result = _check_folder(dir_path, dir_stat, folder_size, criteria, metrics)
+            if result is not None:
+                if best is not None:
+                    best.add(result)
+                else:
+                    matches.append(result)
+    except OSError as e:
+        return 0, [], [e], metrics, table, None
+    finally:
+        if index is not None:
+            index.flush()
+    if best is not None:
+        matches = best.results()
+    return total, matches, errors, metrics, table, newest
+
+
+def parallel_aggregate(top, criteria, stop_event, on_error=None,
+                       on_progress=None, workers=4, use_processes=False, index_path=None,
+                       accounting=None, metrics=None, checkpoint=None, scan_filter=None, keep_top=None,
+                       table=None, activity=None, fd_relative=False, throttle=None):
+    """Sizes the tree under top on a worker pool, yielding a ScanResult per match.
+
+    criteria is (mode, reference_epoch, limit_bytes). Results come out in
+    serial post-order. index_path enables the incremental scan index
+    (see scan_index.ScanIndex).
+    checkpoint (a scan_checkpoint.ScanCheckpoint) saves progress: the walk
+    stack for a serial scan, the finished sub-trees for a parallel one.
+    keep_top: (k, by) for a top-N scan; workers only pass on the k best
+    matches of their sub-tree, in no particular order.
+    table: an optional ScanTable to fill (not with a resumed checkpoint).
+    activity: date folders by their subtree's newest activity (see
+    ACTIVITY_KEYS) instead of their own lstat.
+    fd_relative: walk through directory descriptors (see _open_dir).
+    throttle: an optional ScanThrottle, shared by all workers (threads only).
+    """
+    if scan_filter is not None or table is not None or activity is not None:
+        # Cached folders list all their children, excluded or not, and skip
+        # the file stats that age histograms and activity are taken from
+        index_path = None
+    if accounting is not None:
+        # The index caches apparent sizes per folder and skips the per-file
+        # visits that allocated/hard-link accounting depends on
+        index_path = None
+        if accounting.dedupe_hardlinks:
+            # A shared file is charged to the first folder that sees it. Only
+            # the serial walk (sorted, depth-first) makes that the same
+            # folder on every run, so the output stays diffable
+            workers = 1
+    if throttle is not None:
+        # The throttle can only be shared between threads
+        use_processes = False
+    index = scan_index.open_for_thread(index_path) if index_path else None
+    # Thread workers share this process's descriptors
+    fd_depth = _fd_budget(1 if workers <= 1 or use_processes else workers) if fd_relative else 0
+
+    def report_errors(errors):
+        if on_error is not None:
+            for e in errors:
+                on_error(e)
+
+    def report(path, dir_stat, folder_size):
+        return _check_folder(path, dir_stat, folder_size, criteria, metrics)
+
+    resuming = checkpoint is not None and checkpoint.state is not None
+    if workers <= 1:
+        if resuming:
+            # Everything reported before the interruption, then the rest
+            yield from checkpoint.results
+        try:
+            # Progress is counted in finished top-level folders
+            for dir_path, dir_stat, folder_size in walk_aggregate(top, stop_event, on_error, index,
+                                                                  accounting, metrics, checkpoint, scan_filter,
+                                                                  table, activity, fd_depth, throttle,
+                                                                  progress=True):
+                # The scan root itself is never reported, only its sub-folders
+                if dir_path == top:
+                    if checkpoint is not None:
+                        checkpoint.discard()
+                    break
+                if on_progress is not None:
+                    on_progress(dir_path)
+                result = report(dir_path, dir_stat, folder_size)
+                if result is not None:
+                    if checkpoint is not None:
+                        checkpoint.add_result(result)
+                    yield result
+        except OSError as e:
+            report_errors([e])
+        finally:
+            if index is not None:
+                index.flush()
+        return
+
+    # 1. Expand breadth-first until there are a few sub-trees per worker.
+    # A checkpointed scan uses more, smaller sub-trees so that less work is
+    # lost on an interruption; the frontier must come out the same on resume.
+    target = workers * 4 if checkpoint is None else max(workers * 4, CHECKPOINT_SUBTREES)
+    resumed = checkpoint.state["done"] if resuming else {}
+    expanded = {}
+    try:
+        top_stat = os.stat(top) if index is not None else None
+        if table is not None or activity is not None:
+            top_stat = os.lstat(top)
+    except OSError as e:
+        report_errors([e])
+        return
+    queue = deque([(top, top_stat)])
+    while queue and len(queue) < target:
+        if stop_event.is_set():
+            return
+        path, dir_stat = queue.popleft()
+        ages = table.new_ages() if table is not None else None
+        newest = [ACTIVITY_KEYS[activity](dir_stat)] if activity is not None else None
+        try:
+            own_bytes, file_count, subdirs = list_directory(path, dir_stat, stop_event, index, accounting, metrics,
+                                                            scan_filter, table.edges if table is not None else None,
+                                                            ages, activity, newest, throttle=throttle)
+        except OSError as e:
+            report_errors([e])
+            # Not cached: an unreadable folder must not be stored as empty
+            expanded[path] = (dir_stat, 0, 0, [], False, ages, None)
+            continue
+        expanded[path] = (dir_stat, own_bytes, file_count, subdirs, True, ages, newest)
+        queue.extend(subdirs)
+
+    # 2. Hand the remaining frontier to the pool. Workers get their own stop
+    # event so that abandoning this generator also stops them.
+    if use_processes:
+        worker_stop = multiprocessing.Event()
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_process_worker,
+                                   initargs=(worker_stop,))
+        progress = None
+    else:
+        worker_stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=workers)
+        progress = on_progress
+
+    futures = {}
+    completed = False
+    try:
+        # Process workers count into their own ScanMetrics, merged on completion
+        futures = {path: pool.submit(_aggregate_subtree, path, criteria, None if use_processes else worker_stop,
+                                     progress, index_path, accounting,
+                                     ScanMetrics() if use_processes and metrics is not None else metrics,
+                                     scan_filter, keep_top, table.fragment() if table is not None else None,
+                                     activity, fd_depth, throttle)
+                   for path, _ in sorted(queue) if path not in resumed}
+        if metrics is not None:
+            metrics.add_units(total=len(futures))
+
+        def save_checkpoint():
+            # Only sub-trees that were summed to the end are kept
+            done = dict(resumed)
+            for path, future in futures.items():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    total, matches, _, _, _, newest = future.result()
+                    if total is not None:
+                        done[path] = [total, matches, newest]
+            checkpoint.save({"done": done})
+
+        def result_of(path):
+            if path in resumed:
+                total, matches, *newest = resumed[path]
+                return total, [ScanResult(*match) for match in matches], [], newest[0] if newest else None
+            future = futures[path]
+            started = time.perf_counter()
+            while True:
+                if stop_event.is_set():
+                    return None
+                if wait([future], timeout=0.05).done:
+                    break
+                if checkpoint is not None and checkpoint.due():
+                    save_checkpoint()
+            if checkpoint is not None and checkpoint.due():
+                save_checkpoint()
+            total, matches, errors, worker_metrics, fragment, newest = future.result()
+            if metrics is not None:
+                metrics.add_time("wait_s", time.perf_counter() - started)
+                metrics.add_units(done=1)
+                if use_processes:
+                    metrics.merge(worker_metrics)
+            if table is not None:
+                table.extend(fragment)
+            return total, matches, errors, newest
+
+        # 3. Fold the expanded top back together, post-order. Returns
+        # (total, newest activity), total None once stopped.
+        def fold(path):
+            dir_stat, own_bytes, file_count, subdirs, listed, ages, newest = expanded[path]
+            total = own_bytes
+            for child_path, child_stat in subdirs:
+                if child_path in expanded:
+                    child_total, child_newest = yield from fold(child_path)
+                else:
+                    result = result_of(child_path)
+                    if result is None:
+                        return None, None
+                    child_total, matches, errors, child_newest = result
+                    report_errors(errors)
+                    yield from matches
+                if child_total is None:
+                    return None, None
+                if on_progress is not None:
+                    on_progress(child_path)
+                if child_newest is not None:
+                    # Unreadable children have none and don't count
+                    child_stat = Activity(child_newest, child_newest)
+                    if child_newest > newest[0]:
+                        newest[0] = child_newest
+                result = report(child_path, child_stat, child_total)
+                if result is not None:
+                    yield result
+                total += child_total
+                # A finished child is the table's last row (post-order), unless it was unreadable
+                child_row = table.last_row(child_path) if table is not None else None
+                if child_row is not None:
+                    for i, nbytes in enumerate(table.row_ages(child_row)):
+                        ages[i] += nbytes
+            if index is not None and listed:
+                index.store(path, dir_stat, own_bytes, file_count, total, subdirs)
+            if newest is not None:
+                dir_stat = Activity(newest[0], newest[0])
+            if table is not None and listed:
+                table.add(path, dir_stat, total, ages, file_count)
+            return total, newest and newest[0]
+
+        completed = (yield from fold(top))[0] is not None
+        if checkpoint is not None and completed:
+            checkpoint.discard()
+    finally:
+        if index is not None:
+            index.flush()
+        if checkpoint is not None and stop_event.is_set() and not completed:
+            save_checkpoint()
+        worker_stop.set()
+        for future in futures.values():
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+# --- Outermost-Match Pruning ---
+# A folder is never bigger than its parent, so once a folder passes the
+# date test its sub-folders never need a walk of their own: if the folder is
+# too small, none of them can be big enough, and if it is big enough it is
+# reported as one outermost match instead of /a, /a/b, /a/b/c. The walk goes
+# top-down and only lists folders that fail the date test; each candidate is
+# summed just until it crosses the size limit. Run the scan again with a
+# reported folder as the root to expand it.
+
+def size_subtree(path, limit_bytes=None, stop_event=None, on_error=None, accounting=None, metrics=None,
+                 scan_filter=None, throttle=None):
+    """Sums path's subtree, stopping once it exceeds limit_bytes.
+
+    Returns (size, truncated); truncated means size is only a lower bound.
+    """
+    total = 0
+    stack = [path]
+    while stack:
+        if stop_event is not None and stop_event.is_set():
+            break
+        dir_path = stack.pop()
+        try:
+            own_bytes, _, subdirs = scan_directory(dir_path, stop_event, accounting, metrics, scan_filter,
+                                                   throttle=throttle)
+        except OSError as e:
+            if on_error is not None:
+                on_error(e)
+            continue
+        total += own_bytes
+        stack.extend(child_path for child_path, _ in reversed(subdirs))
+        if limit_bytes is not None and total > limit_bytes:
+            break
+    return total, bool(stack)
+
+
+def _size_candidate(path, limit_bytes, stop_event=None, accounting=None, metrics=None, scan_filter=None,
+                    throttle=None):
+    """Worker entry point: returns (size, truncated, errors, metrics) for one candidate."""
+    if stop_event is None:
+        stop_event = _worker_stop_event
+    errors = []
+    started = time.perf_counter()
+    size, truncated = size_subtree(path, limit_bytes, stop_event, errors.append, accounting, metrics,
+                                   scan_filter, throttle)
+    if metrics is not None:
+        metrics.add_time("size_s", time.perf_counter() - started)
+    return size, truncated, errors, metrics
+
+
+def outermost_aggregate(top, criteria, stop_event, on_error=None, on_progress=None,
+                        workers=4, use_processes=False, accounting=None, metrics=None, checkpoint=None,
+                        scan_filter=None, throttle=None):
+    """Yields a ScanResult for every outermost folder below top that matches.
+
+    Nothing below a reported folder is reported. Sizes are lower bounds
+    (truncated=True) when summing stopped at the limit. Results come out in
+    pre-order; with workers > 1 candidates are summed on a pool.
+    checkpoint (a scan_checkpoint.ScanCheckpoint) saves the work stack.
+    """
+    mode, reference_epoch, limit_bytes = criteria
+    if accounting is not None and accounting.dedupe_hardlinks:
+        # Deterministic charging of shared files, see parallel_aggregate
+        workers = 1
+    if throttle is not None:
+        use_processes = False
+
+    def report_errors(errors):
+        if on_error is not None:
+            for e in errors:
+                on_error(e)
+
+    def report(path, folder_timestamp, size, truncated):
+        if metrics is not None:
+            metrics.add_candidate(size > limit_bytes)
+            if path in top_children:
+                metrics.add_units(done=1)
+        if size > limit_bytes:
+            result = ScanResult(path, folder_timestamp, size, truncated)
+            if checkpoint is not None:
+                checkpoint.add_result(result)
+            return result
+        return None
+
+    # Progress is counted in top-level folders
+    top_children = set()
+
+    pool = None
+    if workers > 1:
+        if use_processes:
+            worker_stop = multiprocessing.Event()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_process_worker,
+                                       initargs=(worker_stop,))
+        else:
+            worker_stop = threading.Event()
+            pool = ThreadPoolExecutor(max_workers=workers)
+    # Candidates in walk order: (path, timestamp, future); drained from the
+    # front so results keep their order while later ones are still summing
+    pending = deque()
+
+    def drain(block):
+        while pending and (block or pending[0][2].done()):
+            path, folder_timestamp, future = pending[0]
+            started = time.perf_counter()
+            while not wait([future], timeout=0.05).done:
+                if stop_event.is_set():
+                    return
+            pending.popleft()
+            size, truncated, errors, worker_metrics = future.result()
+            if metrics is not None:
+                metrics.add_time("wait_s", time.perf_counter() - started)
+                if use_processes:
+                    metrics.merge(worker_metrics)
+            report_errors(errors)
+            result = report(path, folder_timestamp, size, truncated)
+            if result is not None:
+                yield result
+
+    def state():
+        # Candidates still summing go back on the stack, to be popped first
+        return {"stack": stack + [[path, folder_timestamp] for path, folder_timestamp, _ in reversed(pending)]}
+
+    try:
+        # Work stack of (path, timestamp): folders to list have no timestamp,
+        # candidates (passed the date test) carry theirs and are summed
+        if checkpoint is not None and checkpoint.state is not None:
+            yield from checkpoint.results
+            stack = [tuple(item) for item in checkpoint.state["stack"]]
+        else:
+            stack = [(top, None)]
+        while stack:
+            if stop_event.is_set():
+                if checkpoint is not None:
+                    checkpoint.save(state())
+                return
+            if checkpoint is not None and checkpoint.due():
+                checkpoint.save(state())
+            path, folder_timestamp = stack.pop()
+            if folder_timestamp is not None:
+                if pool is None:
+                    size, truncated, errors, _ = _size_candidate(path, limit_bytes, stop_event,
+                                                                 accounting, metrics, scan_filter, throttle)
+                    report_errors(errors)
+                    if stop_event.is_set():
+                        stack.append((path, folder_timestamp))
+                        continue
+                    result = report(path, folder_timestamp, size, truncated)
+                    if result is not None:
+                        yield result
+                else:
+                    future = pool.submit(_size_candidate, path, limit_bytes,
+                                         None if use_processes else worker_stop, accounting,
+                                         ScanMetrics() if use_processes and metrics is not None else metrics,
+                                         scan_filter, throttle)
+                    pending.append((path, folder_timestamp, future))
+                    yield from drain(len(pending) >= workers * 4)
+                continue
+
+            try:
+                # Folders that failed the date test only need their sub-folders
+                subdirs = list_subdirs(path, stop_event, metrics, scan_filter, throttle)
+            except OSError as e:
+                report_errors([e])
+                continue
+            if stop_event.is_set():
+                stack.append((path, None))
+                continue
+            if on_progress is not None:
+                on_progress(path)
+            if metrics is not None:
+                if path == top:
+                    top_children.update(child_path for child_path, _ in subdirs)
+                    metrics.add_units(total=len(top_children))
+                elif path in top_children:
+                    metrics.add_units(done=1)
+            for child_path, child_stat in reversed(subdirs):
+                stack.append((child_path, match_date(child_stat, mode, reference_epoch)))
+            if pool is not None:
+                yield from drain(False)
+        yield from drain(True)
+        if checkpoint is not None:
+            if pending:
+                checkpoint.save(state())
+            else:
+                checkpoint.discard()
+    finally:
+        if pool is not None:
+            worker_stop.set()
+            for _, _, future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+def scan(root, mode, reference_epoch, limit_bytes, stop_event=None, on_error=None,
+         on_progress=None, workers=1, use_processes=False, index_path=None,
+         allocated=False, dedupe_hardlinks=False, outermost=False, metrics=None, checkpoint=None,
+         exclude=(), include=(), one_file_system=False, top_n=None, top_by="size", table=None, activity=None,
+         fd_relative=False, throttle=None):
+    """Yields a ScanResult for every folder below root that matches.
+
+    mode is "dormant" (modified before reference_epoch) or "recent" (created
+    after it); only folders larger than limit_bytes are reported.
+    on_error(OSError) and on_progress(path) are optional callbacks; with
+    thread workers on_progress is called from the worker threads.
+    allocated / dedupe_hardlinks select true on-disk usage (see SizeAccounting);
+    either one disables the scan index.
+    outermost reports only the outermost matching folders and prunes the walk
+    below them (see outermost_aggregate); it does not use the scan index.
+    metrics is an optional ScanMetrics, filled in as the scan runs.
+    checkpoint is an optional scan_checkpoint.ScanCheckpoint. Progress is
+    saved to it every few seconds and when the scan is stopped, and deleted
+    once the walk is complete. Pass a loaded checkpoint together with its
+    own arguments (ScanCheckpoint.scan_args()) to resume.
+    exclude / include are folder patterns and one_file_system keeps the walk
+    on root's device (see ScanFilter); any of them disables the scan index.
+    top_n: yield only the top_n largest (top_by="size") or oldest ("age")
+    matches, best first, once the walk is done (see TopK). limit_bytes is
+    then just a floor; it can't be combined with outermost.
+    table is an optional ScanTable that records every folder, so that other
+    criteria can be applied later without a rescan (ScanTable.filter). It
+    disables the scan index, and stays incomplete when the scan is stopped
+    or resumed from a checkpoint.
+    activity ("mtime", "ctime", "atime" or "any", see ACTIVITY_KEYS) dates
+    each folder by the newest such timestamp in its whole subtree, for both
+    modes, instead of by its own mtime / ctime. It disables the scan index
+    and can't be combined with outermost.
+    fd_relative opens each folder once, relative to its parent, and stats
+    its entries through that descriptor instead of by full path (POSIX, see
+    FD_RELATIVE_SUPPORTED; ignored elsewhere and by outermost).
+    throttle is an optional ScanThrottle that limits the rate of directory
+    reads and stat calls and the number of folders listed at once; it can
+    be reconfigured while the scan runs. Workers are then always threads.
+    """
+    top = None
+    if top_n is not None:
+        if outermost:
+            raise ValueError("top_n needs exact sizes and can't be combined with outermost")
+        top = TopK(top_n, top_by)
+    if activity is not None:
+        if activity not in ACTIVITY_KEYS:
+            raise ValueError(f"unknown activity: {activity}")
+        if outermost:
+            raise ValueError("activity needs the full walk and can't be combined with outermost")
+    if table is not None:
+        if outermost:
+            raise ValueError("a folder table needs the full walk and can't be combined with outermost")
+        table.root = root
+        if checkpoint is not None and checkpoint.state is not None:
+            # The folders summed before the interruption are not in it
+            table = None
+    if stop_event is None:
+        stop_event = threading.Event()
+    if checkpoint is not None:
+        params = {"root": root, "mode": mode, "reference_epoch": reference_epoch, "limit_bytes": limit_bytes,
+                  "workers": workers, "use_processes": use_processes, "index_path": index_path,
+                  "allocated": allocated, "dedupe_hardlinks": dedupe_hardlinks, "outermost": outermost,
+                  "exclude": list(exclude), "include": list(include), "one_file_system": one_file_system,
+                  "top_n": top_n, "top_by": top_by, "activity": activity}
+        if checkpoint.state is not None:
+            changed = [name for name, value in params.items() if checkpoint.params.get(name) != value]
+            if changed:
+                raise ValueError(f"the checkpoint is for a different scan ({', '.join(changed)})")
+        checkpoint.params.update(params)
+        if top_n is not None:
+            checkpoint.keep_top(top_n, top_by)
+    accounting = None
+    # Unsupported modes would change nothing but still cost the index (and the pool)
+    allocated = allocated and ALLOCATED_SUPPORTED
+    dedupe_hardlinks = dedupe_hardlinks and HARDLINKS_SUPPORTED
+    if allocated or dedupe_hardlinks:
+        accounting = SizeAccounting(allocated, dedupe_hardlinks)
+    criteria = (mode, reference_epoch, limit_bytes)
+    if metrics is not None:
+        user_on_error = on_error
+
+        def on_error(error):
+            metrics.add_error(error)
+            if user_on_error is not None:
+                user_on_error(error)
+
+    scan_filter = None
+    if exclude or include or one_file_system:
+        root_dev = None
+        if one_file_system:
+            try:
+                root_dev = os.stat(root).st_dev
+            except OSError as e:
+                if on_error is not None:
+                    on_error(e)
+                return
+        scan_filter = ScanFilter(root, exclude, include, root_dev)
+
+    if outermost:
+        results = outermost_aggregate(root, criteria, stop_event, on_error, on_progress, workers=workers,
+                                      use_processes=use_processes, accounting=accounting, metrics=metrics,
+                                      checkpoint=checkpoint, scan_filter=scan_filter, throttle=throttle)
+    else:
+        results = parallel_aggregate(root, criteria, stop_event, on_error, on_progress, workers=workers,
+                                     use_processes=use_processes, index_path=index_path,
+                                     accounting=accounting, metrics=metrics, checkpoint=checkpoint,
+                                     scan_filter=scan_filter,
+                                     keep_top=(top_n, top_by) if top_n is not None else None, table=table,
+                                     activity=activity, fd_relative=fd_relative and FD_RELATIVE_SUPPORTED,
+                                     throttle=throttle)
+    if top is not None:
+        results = _top_results(results, top)
+    try:
+        for result in results:
+            started = time.perf_counter()
+            yield result
+            if metrics is not None:
+                # Time the consumer (GUI, exporter) spent on this result
+                metrics.add_time("report_s", time.perf_counter() - started)
+        if table is not None and not stop_event.is_set():
+            table.complete = True
+    finally:
+        results.close()
+        if metrics is not None:
+            metrics.finished = time.time()
+
+
+def parse_date(date_str):
+    """dd-mm-yyyy -> epoch seconds (local midnight), ValueError on bad input."""
+    return time.mktime(time.strptime(date_str, "%d-%m-%Y"))
+
+
+def format_date(result):
+    return time.strftime("%d-%m-%Y", time.localtime(result.timestamp))
+
+
+def format_size(result, size_mb):
+    if result.truncated:
+        return f"> {size_mb} MB (Limit Reached)"
+    return f"{result.size / (1024*1024):.2f} MB"
+
+
+def date_label(mode, activity=None):
+    if activity is not None:
+        return "Last Active"
+    return "Modified" if mode == "dormant" else "Created"
+
+
+def format_result_line(result, mode, size_mb, activity=None):
+    """The classic one-line report format, shared by the GUI and the CLI."""
+    return (f"FOUND! {result.path} | {date_label(mode, activity)}: {format_date(result)}"
+            f" | Size: {format_size(result, size_mb)}")
+
+
+# --- Command Line ---
+
+def _watch(args, scan_args, exporter, on_error, throttle=None):
+    """--watch: reports the first scan, then prints each change until Ctrl+C."""
+    # Imported here: only needed in watch mode
+    import scan_watch
+
+    watcher = scan_watch.FolderWatcher(scan_args["root"], scan_args["mode"], scan_args["reference_epoch"],
+                                       scan_args["limit_bytes"], on_error, args.allocated, args.exclude,
+                                       args.include, args.one_file_system, throttle=throttle)
+    stop_event = threading.Event()
+    started = time.perf_counter()
+    try:
+        try:
+            for result in watcher.start(stop_event):
+                exporter.write(result)
+        finally:
+            exporter.close()
+        print(f"{exporter.count} folder(s) found in {time.perf_counter() - started:.2f}s, "
+              f"watching {watcher.folder_count} folders ({watcher.backend}); Ctrl+C to stop", file=sys.stderr)
+        for changes in watcher.changes(stop_event, args.watch):
+            stamp = datetime.now().strftime("%H:%M:%S")
+            for result in changes.added:
+                print(f"{stamp} ADDED   {format_result_line(result, args.mode, args.size_mb)}", flush=True)
+            for result in changes.changed:
+                print(f"{stamp} CHANGED {format_result_line(result, args.mode, args.size_mb)}", flush=True)
+            for path in changes.removed:
+                print(f"{stamp} REMOVED {path}", flush=True)
+    except KeyboardInterrupt:
+        stop_event.set()
+    finally:
+        watcher.close()
+    return 0
+
+
+def main(argv=None):
+    # Imported here: scan_checkpoint imports this module
+    import scan_checkpoint
+
+    default_date = (datetime.now() - timedelta(days=365)).strftime("%d-%m-%Y")
+    parser = argparse.ArgumentParser(
+        prog="python -m scan_engine",
+        description="Find large folders that are old (dormant) or new (recent), without the GUI.")
+    parser.add_argument("root", nargs="?", help="folder to scan (not needed with --resume)")
+    parser.add_argument("--mode", choices=("dormant", "recent"), default="dormant",
+                        help="dormant: modified before DATE; recent: created after DATE (default: dormant)")
+    parser.add_argument("--date", default=default_date,
+                        help="reference date as dd-mm-yyyy (default: one year ago)")
+    parser.add_argument("--size-mb", type=int, default=None,
+                        help="report folders larger than this many MB (default: 1024, or 0 with --top)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="parallel sizing workers, 1 for a serial walk (default: 4)")
+    parser.add_argument("--processes", action="store_true",
+                        help="use worker processes instead of threads")
+    parser.add_argument("--allocated", action="store_true",
+                        help="count allocated disk space (st_blocks) instead of apparent file size")
+    parser.add_argument("--dedupe-hardlinks", action="store_true",
+                        help="count hard-linked files once, like du (walks serially, so each file is "
+                             "charged to the same folder on every run)")
+    parser.add_argument("--outermost", action="store_true",
+                        help="report only the outermost matching folders and don't walk below them")
+    parser.add_argument("--activity", nargs="?", const="mtime", choices=tuple(ACTIVITY_KEYS), metavar="STAMP",
+                        help="date each folder by the newest STAMP (mtime, ctime, atime or any; default: mtime) "
+                             "of anything inside it, instead of by the folder's own date")
+    parser.add_argument("--top", type=int, metavar="N",
+                        help="report only the N largest matching folders (or oldest, see --top-by), "
+                             "with exact sizes")
+    parser.add_argument("--top-by", choices=TopK.BY, default="size",
+                        help="order for --top: size (largest first) or age (oldest first)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="don't walk folders matching PATTERN: a name or glob (.git, node_modules, "
+                             ".snapshot) or a path below ROOT; repeatable")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="walk folders matching PATTERN even if an --exclude matches them; repeatable")
+    parser.add_argument("-x", "--one-file-system", action="store_true",
+                        help="don't walk into folders on other file systems (mount points)")
+    parser.add_argument("--fd-relative", action="store_true",
+                        help="open each folder once and stat its files relative to it instead of by full path "
+                             "(Linux/POSIX; faster on deep trees and NFS)")
+    parser.add_argument("--throttle", type=float, metavar="OPS",
+                        help="at most OPS directory reads and stat calls per second, to spare shared storage")
+    parser.add_argument("--max-concurrency", type=int, metavar="N",
+                        help="list at most N folders at the same time (across all workers)")
+    parser.add_argument("--target-latency-ms", type=float, metavar="MS",
+                        help="slow down while a stat takes longer than MS milliseconds on average, and speed "
+                             "back up (to --throttle, if given) once it is faster again")
+    parser.add_argument("--watch", nargs="?", type=float, const=2.0, metavar="SECONDS",
+                        help="after the report, keep watching ROOT and print folders that start or stop matching "
+                             "or change size, checking every SECONDS (default: 2); uses inotify on Linux")
+    parser.add_argument("--index", nargs="?", const=scan_index.DEFAULT_INDEX_PATH, default=None,
+                        metavar="DB", help="use the incremental scan index (default location if DB is omitted)")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="drop cached data for ROOT before scanning (implies --index)")
+    parser.add_argument("--checkpoint", nargs="?", const=scan_checkpoint.DEFAULT_CHECKPOINT_PATH, metavar="FILE",
+                        help="save progress to FILE every 30 seconds and on Ctrl+C, so the scan can be resumed "
+                             "(default location if FILE is omitted)")
+    parser.add_argument("--resume", nargs="?", const=scan_checkpoint.DEFAULT_CHECKPOINT_PATH, metavar="FILE",
+                        help="continue the scan saved in checkpoint FILE, with the settings it was started with")
+    parser.add_argument("-o", "--output", help="write results to this file instead of stdout")
+    parser.add_argument("--format", choices=("txt", "csv", "jsonl", "html"),
+                        help="report format (default: from the --output extension, else txt)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write scan metrics as JSON to FILE when done (and on SIGUSR1 while scanning)")
+    parser.add_argument("--snapshot", metavar="FILE",
+                        help="save every folder's exact size and dates to FILE once the scan is complete, "
+                             "to compare with a later scan (python -m scan_snapshot diff OLD NEW)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="don't print skipped folders to stderr")
+    args = parser.parse_args(argv)
+
+    for option in ("throttle", "max_concurrency", "target_latency_ms"):
+        if getattr(args, option) is not None and getattr(args, option) <= 0:
+            parser.error(f"--{option.replace('_', '-')} must be a positive number")
+    for option, supported in (("allocated", ALLOCATED_SUPPORTED), ("dedupe_hardlinks", HARDLINKS_SUPPORTED)):
+        if getattr(args, option) and not supported:
+            print(f"Warning: --{option.replace('_', '-')} isn't supported on this platform and is ignored",
+                  file=sys.stderr)
+            setattr(args, option, False)
+    throttle = ScanThrottle(args.throttle, args.max_concurrency, args.target_latency_ms)
+    if not throttle.active:
+        throttle = None
+
+    checkpoint = None
+    if args.resume and args.watch is not None:
+        parser.error("--watch can't be combined with --resume")
+    if args.snapshot and (args.resume or args.watch is not None or args.outermost):
+        parser.error("--snapshot needs a complete scan and can't be combined with --resume, --watch or --outermost")
+    if args.resume:
+        try:
+            checkpoint = scan_checkpoint.ScanCheckpoint.load(args.resume)
+            scan_args = checkpoint.scan_args()
+            args.size_mb = checkpoint.params["size_mb"]
+            args.date = checkpoint.params["date"]
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"cannot resume from {args.resume}: {e}")
+        args.mode = scan_args["mode"]
+        args.activity = scan_args["activity"]
+        print(f"Resuming the scan of {scan_args['root']}", file=sys.stderr)
+    else:
+        if args.root is None:
+            parser.error("ROOT is required unless --resume is given")
+        if not os.path.isdir(args.root):
+            parser.error(f"not a folder: {args.root}")
+        if args.size_mb is None:
+            args.size_mb = 0 if args.top else 1024
+        if args.size_mb < 0 or (args.size_mb == 0 and not args.top):
+            parser.error("--size-mb must be a positive number")
+        if args.top is not None and args.top <= 0:
+            parser.error("--top must be a positive number")
+        if args.top and args.outermost:
+            parser.error("--top can't be combined with --outermost")
+        if args.activity and args.outermost:
+            parser.error("--activity can't be combined with --outermost")
+        if args.workers <= 0:
+            parser.error("--workers must be a positive number")
+        if args.watch is not None:
+            if args.watch <= 0:
+                parser.error("--watch must be a positive number of seconds")
+            for option in ("outermost", "top", "activity", "dedupe_hardlinks", "checkpoint", "index",
+                           "rebuild_index"):
+                if getattr(args, option):
+                    parser.error(f"--watch can't be combined with --{option.replace('_', '-')}")
+        try:
+            reference_epoch = parse_date(args.date)
+        except ValueError:
+            parser.error("invalid --date, please use dd-mm-yyyy")
+
+        index_path = args.index
+        if args.rebuild_index:
+            index_path = index_path or scan_index.DEFAULT_INDEX_PATH
+            index = scan_index.ScanIndex(index_path)
+            index.invalidate(args.root)
+            index.close()
+
+        scan_args = {"root": args.root, "mode": args.mode, "reference_epoch": reference_epoch,
+                     "limit_bytes": args.size_mb * 1024 * 1024, "workers": args.workers,
+                     "use_processes": args.processes, "index_path": index_path,
+                     "allocated": args.allocated, "dedupe_hardlinks": args.dedupe_hardlinks,
+                     "outermost": args.outermost, "exclude": args.exclude, "include": args.include,
+                     "one_file_system": args.one_file_system, "top_n": args.top, "top_by": args.top_by,
+                     "activity": args.activity}
+        if args.checkpoint:
+            checkpoint = scan_checkpoint.ScanCheckpoint(args.checkpoint)
+            # For the report header of a resumed scan
+            checkpoint.params.update(size_mb=args.size_mb, date=args.date)
+
+    def on_error(error):
+        if not args.quiet:
+            print(f"Skipped: {error}", file=sys.stderr)
+
+    # Imported here so the exporters are only loaded when a report is written
+    import scan_export
+    exporter_cls = scan_export.EXPORTERS[args.format] if args.format else scan_export.exporter_for(args.output)
+    exporter = exporter_cls(args.output or sys.stdout, args.mode, args.size_mb, "Custom", args.date,
+                            activity=args.activity)
+    if args.watch is not None:
+        return _watch(args, scan_args, exporter, on_error, throttle)
+    stop_event = threading.Event()
+    metrics = ScanMetrics()
+    if args.metrics and hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid> writes the metrics so far
+        signal.signal(signal.SIGUSR1, lambda signum, frame: metrics.dump(args.metrics))
+    if checkpoint is not None:
+        # First Ctrl+C stops cleanly and saves the checkpoint, a second one aborts
+        def on_interrupt(signum, frame):
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            print("Stopping, saving checkpoint... (Ctrl+C again to abort)", file=sys.stderr)
+            stop_event.set()
+        signal.signal(signal.SIGINT, on_interrupt)
+    table = ScanTable() if args.snapshot else None
+    started = time.perf_counter()
+    try:
+        for result in scan(stop_event=stop_event, on_error=on_error, metrics=metrics, checkpoint=checkpoint,
+                           fd_relative=args.fd_relative, throttle=throttle, table=table, **scan_args):
+            exporter.write(result)
+        if checkpoint is not None and stop_event.is_set() and os.path.exists(checkpoint.path):
+            print(f"Scan stopped. Continue with: python -m scan_engine --resume {checkpoint.path}", file=sys.stderr)
+            return 130
+    except KeyboardInterrupt:
+        stop_event.set()
+        print("Scan interrupted, partial report kept.", file=sys.stderr)
+        return 130
+    finally:
+        exporter.close()
+        if args.metrics:
+            metrics.dump(args.metrics)
+    print(f"{exporter.count} folder(s) found in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    if table is not None:
+        # Imported here: scan_snapshot is only needed for --snapshot
+        import scan_snapshot
+        try:
+            scan_snapshot.write_snapshot(args.snapshot, table, scan_snapshot.snapshot_meta(scan_args))
+        except OSError as e:
+            print(f"Error: cannot save the snapshot: {e}", file=sys.stderr)
+            return 1
+        print(f"Snapshot of {len(table):,} folders saved to {args.snapshot}", file=sys.stderr)
+    if not args.quiet:
+        print(metrics.status_line(), file=sys.stderr)
+        if throttle is not None:
+            print(f"{throttle.status()} | waited {metrics.throttle_s:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
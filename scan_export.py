@@ -0,0 +1,234 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Streaming report exporters (Text, CSV, JSON Lines, HTML).
+# Each exporter writes its header on open, one row per write() and its
+# footer on close(), so a report can be filled in while the scan is running
+# and an interrupted scan still leaves a usable partial file behind.
+
+import os
+import csv
+import json
+import time
+import html
+from datetime import datetime
+
+import scan_engine
+
+
+class ReportExporter:
+    """Base class: plain text report, one "FOUND!" line per folder."""
+
+    extension = "txt"
+    newline = None
+    # Rows are flushed at most this often, so the file on disk stays current
+    # without paying a write() per row on big result sets.
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, out, mode, size_mb, horizon="Custom", reference_date="", activity=None):
+        """out is a file path or an already open text stream.
+
+        activity is the scan's scan_engine.scan(activity=...) setting, if any.
+        """
+        self._owns_file = isinstance(out, (str, os.PathLike))
+        self.file = open(out, "w", encoding="utf-8", newline=self.newline) if self._owns_file else out
+        self.mode = mode
+        self.size_mb = size_mb
+        self.horizon = horizon
+        self.reference_date = reference_date
+        self.activity = activity
+        self.count = 0
+        self._last_flush = time.monotonic()
+        self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, result):
+        self.write_row(result)
+        self.count += 1
+        now = time.monotonic()
+        if now - self._last_flush >= self.FLUSH_INTERVAL:
+            self.file.flush()
+            self._last_flush = now
+
+    def write_all(self, results):
+        for result in results:
+            self.write(result)
+
+    def close(self):
+        if self.file is None:
+            return
+        self.write_footer()
+        if self._owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+        self.file = None
+
+    # --- Format hooks ---
+
+    def write_header(self):
+        self.file.write(f"Folder Capacity Report - {datetime.now().strftime('%d-%m-%Y %H:%M')}\n")
+        self.file.write(f"Scan Mode: {self.mode.upper()}\n")
+        if self.activity is not None:
+            self.file.write(f"Dated By: newest {self.activity} in each folder\n")
+        self.file.write(f"Time Horizon: {self.horizon} (Reference Date: {self.reference_date})\n")
+        self.file.write(f"Minimum Size: {self.size_mb} MB\n")
+        self.file.write("-" * 50 + "\n")
+
+    def write_row(self, result):
+        self.file.write(scan_engine.format_result_line(result, self.mode, self.size_mb, self.activity) + "\n")
+
+    def write_footer(self):
+        pass
+
+
+class TextExporter(ReportExporter):
+    pass
+
+
+class CsvExporter(ReportExporter):
+    """Machine-readable rows with exact bytes and epoch timestamps."""
+
+    extension = "csv"
+    newline = ""
+
+    def write_header(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["path", "date", "timestamp", "size_bytes", "truncated"])
+
+    def write_row(self, result):
+        self.writer.writerow([result.path, scan_engine.format_date(result), result.timestamp,
+                              result.size, int(result.truncated)])
+
+
+class JsonLinesExporter(ReportExporter):
+    """One JSON object per line, easy to stream into other tools."""
+
+    extension = "jsonl"
+
+    def write_header(self):
+        pass
+
+    def write_row(self, result):
+        self.file.write(json.dumps({
+            "path": result.path,
+            "date": scan_engine.format_date(result),
+            "timestamp": result.timestamp,
+            "size": result.size,
+            "truncated": result.truncated,
+        }, ensure_ascii=False) + "\n")
+
+
+class HtmlExporter(ReportExporter):
+    """Interactive report with "Copy Path" buttons.
+
+    Paths are HTML-escaped and handed to the JavaScript through a data-path
+    attribute, so no path ever has to be escaped as a JS string literal.
+    """
+
+    extension = "html"
+
+    # JavaScript for copyPath function. Defined as a raw string literal to avoid
+    # Python's backslash escaping rules confusing JS regex.
+    JS_SCRIPT_BLOCK = r'''
+            <script>
+                function copyPath(path) {
+                    // Fix slashes for Windows clipboard: replace forward slash with backslash
+                    // The regex /\//g matches all forward slashes.
+                    // The replacement '\\' provides a single backslash.
+                    const windowsPath = path.replace(/\//g, '\\');
+                    navigator.clipboard.writeText(windowsPath).then(() => {
+                        alert("Path copied to clipboard:\n" + windowsPath);
+                    }).catch(err => {
+                        console.error('Failed to copy: ', err);
+                    });
+                }
+            </script>
+        '''
+
+    def write_header(self):
+        # Main HTML content string. Using f-string with triple single quotes.
+        # This allows embedded double quotes in HTML attributes/CSS without escaping.
+        self.file.write(f'''<!DOCTYPE html>
+        <html lang="en">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Folder Capacity Report</title>
+            <style>
+                body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 20px; background-color: #f4f4f9; }}
+                .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }}
+                h1 {{ color: #333; }}
+                .meta {{ margin-bottom: 20px; padding: 10px; background: #e9ecef; border-left: 5px solid #007bff; }}
+                table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
+                th, td {{ padding: 12px 15px; text-align: left; border-bottom: 1px solid #ddd; }}
+                th {{ background-color: #007bff; color: white; }}
+                tr:hover {{ background-color: #f1f1f1; }}
+                .path-cell {{ display: flex; justify-content: space-between; align-items: center; }}
+                .path-text {{ word-break: break-all; margin-right: 10px; font-family: Consolas, monospace; }}
+                .copy-btn {{
+                    background-color: #28a745; color: white; border: none; padding: 5px 10px;
+                    border-radius: 4px; cursor: pointer; font-size: 0.85em;
+                }}
+                .copy-btn:hover {{ background-color: #218838; }}
+                .copy-btn:active {{ transform: scale(0.98); }}
+            </style>
+            {self.JS_SCRIPT_BLOCK}
+        </head>
+        <body>
+            <div class="container">
+                <h1>Folder Capacity Report</h1>
+                <div class="meta">
+                    <p><strong>Generated:</strong> {datetime.now().strftime('%d-%m-%Y %H:%M')}</p>
+                    <p><strong>Mode:</strong> {html.escape(self.mode.upper())}</p>
+                    <p><strong>Criteria:</strong> {html.escape(self.horizon)} | Min Size: {self.size_mb} MB</p>
+                </div>
+                <table>
+                    <thead>
+                        <tr>
+                            <th>Folder Path</th>
+                            <th>Date ({scan_engine.date_label(self.mode, self.activity)})</th>
+                            <th>Size</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+''')
+
+    def write_row(self, result):
+        # Forward slashes in the attribute; copyPath turns them into backslashes
+        clean_path = html.escape(result.path.replace("\\", "/"), quote=True)
+        self.file.write(f'''
+            <tr>
+                <td class="path-cell">
+                    <div class="path-text">{html.escape(result.path)}</div>
+                    <button data-path="{clean_path}" onclick="copyPath(this.dataset.path)" class="copy-btn">Copy Path</button>
+                </td>
+                <td>{scan_engine.format_date(result)}</td>
+                <td>{html.escape(scan_engine.format_size(result, self.size_mb))}</td>
+            </tr>
+''')
+
+    def write_footer(self):
+        self.file.write('''
+                    </tbody>
+                </table>
+            </div>
+        </body>
+        </html>''')
+
+
+EXPORTERS = {cls.extension: cls for cls in (TextExporter, CsvExporter, JsonLinesExporter, HtmlExporter)}
+
+
+def exporter_for(path, default="txt"):
+    """Picks the exporter class from a file name's extension."""
+    ext = os.path.splitext(path)[1].lstrip(".").lower() if path else ""
+    if ext == "htm":
+        ext = "html"
+    return EXPORTERS.get(ext, EXPORTERS[default])
@@ -0,0 +1,143 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Persistent per-directory scan index used for incremental rescans.
+
+import os
+import sqlite3
+import stat
+import threading
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".folder_scanner", "scan_index.sqlite3")
+
+# Directory names can't contain a path separator, so "/" is a safe joiner
+# for the cached child list on every platform.
+_CHILD_SEP = b"/"
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (
+    path BLOB PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    own_bytes INTEGER NOT NULL,
+    subtree_bytes INTEGER NOT NULL,
+    file_count INTEGER NOT NULL,
+    children BLOB NOT NULL
+) WITHOUT ROWID
+'''
+
+
+def _key(path):
+    return os.fsencode(os.path.abspath(path))
+
+
+class ScanIndex:
+    """SQLite cache of per-directory totals, keyed on the directory's mtime.
+
+    A directory whose mtime hasn't changed still has the same entries, so its
+    own file totals and child names can be reused without listing it again.
+    Only the children have to be stat'ed to decide whether to descend.
+
+    Note: editing a file in place does not change its folder's mtime. Use
+    invalidate() (the "Rebuild" action) when exact sizes matter.
+
+    Rows are keyed on absolute paths, so relative and absolute scans of the
+    same folder share them; returned paths keep the caller's form.
+
+    One ScanIndex per thread; use open_for_thread() from worker threads.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH):
+        self.db_path = db_path
+        parent = os.path.dirname(db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+        self._pending = []
+        self._stale_children = {}
+
+    def lookup(self, path, dir_stat):
+        """Returns (own_bytes, file_count, subdirs) if the cached row is still valid, else None."""
+        key = _key(path)
+        row = self.conn.execute(
+            "SELECT mtime_ns, own_bytes, file_count, children FROM dirs WHERE path = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        mtime_ns, own_bytes, file_count, children = row
+        names = children.split(_CHILD_SEP) if children else []
+        if mtime_ns != dir_stat.st_mtime_ns:
+            # Remember the old children so store() can drop the ones that went away
+            self._stale_children[path] = names
+            return None
+
+        subdirs = []
+        for name in names:
+            child_path = os.path.join(path, os.fsdecode(name))
+            try:
+                child_stat = os.lstat(child_path)
+            except (FileNotFoundError, PermissionError):
+                continue
+            if stat.S_ISDIR(child_stat.st_mode):
+                subdirs.append((child_path, child_stat))
+        return own_bytes, file_count, subdirs
+
+    def store(self, path, dir_stat, own_bytes, file_count, subtree_bytes, subdirs):
+        """Queues a finished directory; written in batches."""
+        names = [os.fsencode(os.path.basename(child_path)) for child_path, _ in subdirs]
+        stale = self._stale_children.pop(path, None)
+        if stale:
+            for name in set(stale) - set(names):
+                self.forget(os.path.join(path, os.fsdecode(name)))
+        self._pending.append((_key(path), dir_stat.st_mtime_ns, dir_stat.st_ctime_ns,
+                              own_bytes, subtree_bytes, file_count, _CHILD_SEP.join(names)))
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self.conn.commit()
+            self._pending = []
+
+    def forget(self, path):
+        """Drops a directory and everything cached below it."""
+        key = _key(path)
+        sep = os.fsencode(os.sep)
+        low = key + sep
+        high = key + bytes([sep[0] + 1])
+        self.conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high))
+        self.conn.commit()
+
+    def invalidate(self, path=None):
+        """Clears the cache below path, or the whole cache when path is None."""
+        self._pending = []
+        if path is None:
+            self.conn.execute("DELETE FROM dirs")
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+        else:
+            self.forget(path)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+_thread_indexes = threading.local()
+
+
+def open_for_thread(db_path):
+    """Returns this thread's ScanIndex for db_path, opening it on first use."""
+    index = getattr(_thread_indexes, "index", None)
+    if index is None or index.db_path != db_path:
+        index = ScanIndex(db_path)
+        _thread_indexes.index = index
+    return index
@@ -0,0 +1,459 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Sharded scans: one scan split into independent sub-trees (shards) that
+# several processes or hosts mounting the same share walk at the same
+# time. A plan lists the shards in a shared work folder; each shard's
+# total and matches are written to a partial file of their own, and a merge
+# rolls the shard totals up into the folders above them and yields the
+# same results a single scan would.
+#
+# Work folder layout:
+#   plan.json        the scan settings, the folders above the shards, the shards
+#   todo/<id>        shards not yet claimed from the work queue
+#   claimed/<id>.<host>.<pid>   shards being walked
+#   parts/<id>.json  finished shards
+
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import scan_engine
+import scan_checkpoint
+
+FORMAT_VERSION = 1
+
+
+class _Dates(NamedTuple):
+    """Stands in for a folder's lstat in match_date, from the dates saved in the plan."""
+    st_mtime: float
+    st_ctime: float
+
+
+class ShardPlan:
+    """A sharded scan's work folder.
+
+    root must be mounted at the same path on every host. folders maps each
+    folder above the shards to [mtime, ctime, own_bytes, child paths,
+    newest activity]; shards is a list of [path, mtime, ctime], a shard's id
+    being its index.
+    """
+
+    def __init__(self, workdir, root, params, folders, shards):
+        self.workdir = workdir
+        self.root = root
+        self.params = params
+        self.folders = folders
+        self.shards = shards
+
+    @classmethod
+    def load(cls, workdir):
+        """Reads a work folder's plan; OSError if there is none, ValueError if it is unusable."""
+        with open(os.path.join(workdir, "plan.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported shard plan version: {data.get('version')}")
+        return cls(workdir, data["root"], data["params"], data["folders"], data["shards"])
+
+    @property
+    def criteria(self):
+        return self.params["mode"], self.params["reference_epoch"], self.params["limit_bytes"]
+
+    def part_path(self, shard_id):
+        return os.path.join(self.workdir, "parts", f"{shard_id:06d}.json")
+
+    def done(self, shard_id):
+        return os.path.exists(self.part_path(shard_id))
+
+    def missing(self):
+        """Ids of the shards without a partial file yet."""
+        return [shard_id for shard_id in range(len(self.shards)) if not self.done(shard_id)]
+
+    def claimed(self):
+        """Names of the claim files: shards some host is walking (or was, if it died)."""
+        return sorted(os.listdir(os.path.join(self.workdir, "claimed")))
+
+    def save(self):
+        for name in ("todo", "claimed", "parts"):
+            os.makedirs(os.path.join(self.workdir, name), exist_ok=True)
+        for shard_id in range(len(self.shards)):
+            open(os.path.join(self.workdir, "todo", f"{shard_id:06d}"), "w").close()
+        # Last: a work folder with a plan is ready to run
+        scan_checkpoint._replace_file(os.path.join(self.workdir, "plan.json"), json.dumps({
+            "version": FORMAT_VERSION,
+            "created": time.time(),
+            "root": self.root,
+            "params": self.params,
+            "folders": self.folders,
+            "shards": self.shards,
+        }))
+
+
+# --- Planning ---
+
+def plan(workdir, root, mode, reference_epoch, limit_bytes, min_shards=0, allocated=False, exclude=(),
+         include=(), one_file_system=False, activity=None, on_error=None, extra=None):
+    """Splits the scan of root into shards and writes the plan to workdir (a new or empty folder).
+
+    The shards are root's sub-folders; with min_shards, breadth-first
+    expansion continues until there are at least that many, like
+    parallel_aggregate's frontier. The folders above the shards are
+    listed here, once. extra: more keys for the plan's params (e.g. the
+    report settings). Returns the ShardPlan.
+    """
+    if os.path.exists(os.path.join(workdir, "plan.json")):
+        raise ValueError(f"{workdir} already holds a shard plan")
+    if activity is not None and activity not in scan_engine.ACTIVITY_KEYS:
+        raise ValueError(f"unknown activity: {activity}")
+    params = {"mode": mode, "reference_epoch": reference_epoch, "limit_bytes": limit_bytes,
+              "allocated": allocated, "exclude": list(exclude), "include": list(include),
+              "one_file_system": one_file_system, "activity": activity}
+    params.update(extra or {})
+    shard_plan = ShardPlan(workdir, root, params, {}, [])
+    scan_filter = _scan_filter(shard_plan)
+    accounting = scan_engine.SizeAccounting(allocated) if allocated else None
+    stamp_of = scan_engine.ACTIVITY_KEYS[activity] if activity is not None else None
+
+    queue = deque([(root, os.lstat(root))])
+    while queue and (not shard_plan.folders or len(queue) < min_shards):
+        path, dir_stat = queue.popleft()
+        newest = [stamp_of(dir_stat)] if stamp_of is not None else None
+        try:
+            own_bytes, _, subdirs = scan_engine.scan_directory(path, None, accounting, scan_filter=scan_filter,
+                                                               activity=activity, newest=newest)
+        except OSError as e:
+            if on_error is not None:
+                on_error(e)
+            own_bytes, subdirs, newest = 0, [], None
+        shard_plan.folders[path] = [dir_stat.st_mtime, dir_stat.st_ctime, own_bytes,
+                                    [child_path for child_path, _ in subdirs], newest and newest[0]]
+        queue.extend(subdirs)
+    shard_plan.shards = sorted([path, st.st_mtime, st.st_ctime] for path, st in queue)
+    shard_plan.save()
+    return shard_plan
+
+
+def _scan_filter(shard_plan):
+    params = shard_plan.params
+    if not (params["exclude"] or params["include"] or params["one_file_system"]):
+        return None
+    # Device numbers differ between hosts: each one takes root's from its own mount
+    root_dev = os.stat(shard_plan.root).st_dev if params["one_file_system"] else None
+    return scan_engine.ScanFilter(shard_plan.root, params["exclude"], params["include"], root_dev)
+
+
+# --- Running Shards ---
+
+def run_shard(shard_plan, shard_id, stop_event=None, on_error=None, on_progress=None, metrics=None,
+              scan_filter=None, fd_relative=False, throttle=None):
+    """Walks one shard and writes its partial file; returns False if stopped before the end."""
+    params = shard_plan.params
+    path = shard_plan.shards[shard_id][0]
+    accounting = scan_engine.SizeAccounting(True) if params["allocated"] else None
+    fd_depth = scan_engine._fd_budget() if fd_relative and scan_engine.FD_RELATIVE_SUPPORTED else 0
+    started = time.perf_counter()
+    total, matches, errors, _, _, newest = scan_engine._aggregate_subtree(
+        path, shard_plan.criteria, stop_event or threading.Event(), on_progress, None, accounting, metrics,
+        scan_filter, None, None, params["activity"], fd_depth, throttle)
+    for e in errors:
+        if metrics is not None:
+            metrics.add_error(e)
+        if on_error is not None:
+            on_error(e)
+    if total is None:
+        return False
+    scan_checkpoint._replace_file(shard_plan.part_path(shard_id), json.dumps({
+        "version": FORMAT_VERSION,
+        "shard": path,
+        "total": total,
+        "newest": newest,
+        "matches": [list(result) for result in matches],
+        "errors": len(errors),
+        "host": socket.gethostname(),
+        "seconds": time.perf_counter() - started,
+    }))
+    return True
+
+
+def _claim(shard_plan):
+    # Work queue: moving a shard's file out of todo/ is atomic, so only one host gets it
+    todo = os.path.join(shard_plan.workdir, "todo")
+    for name in sorted(os.listdir(todo)):
+        if shard_plan.done(int(name)):
+            continue  # finished by a static --shard run
+        claim = os.path.join(shard_plan.workdir, "claimed", f"{name}.{socket.gethostname()}.{os.getpid()}")
+        try:
+            os.rename(os.path.join(todo, name), claim)
+        except FileNotFoundError:
+            continue  # another host was faster
+        return int(name), claim
+    return None, None
+
+
+def run(workdir, partition=None, stop_event=None, on_error=None, on_progress=None, on_shard=None, metrics=None,
+        fd_relative=False, throttle=None):
+    """Walks shards of the plan in workdir until there are none left; returns how many this call did.
+
+    partition (index, count) takes the static share of shards whose id
+    modulo count is index, skipping finished ones. Without it, shards are
+    claimed one at a time from the work queue, so any number of processes
+    and hosts can run at once. on_shard(shard_id, path) is called before
+    each one. A stopped shard goes back to the queue.
+    """
+    shard_plan = ShardPlan.load(workdir)
+    if stop_event is None:
+        stop_event = threading.Event()
+    scan_filter = _scan_filter(shard_plan)
+    if partition is not None:
+        index, count = partition
+        shard_ids = iter([shard_id for shard_id in range(index, len(shard_plan.shards), count)
+                          if not shard_plan.done(shard_id)])
+    done = 0
+    while not stop_event.is_set():
+        claim = None
+        if partition is not None:
+            shard_id = next(shard_ids, None)
+        else:
+            shard_id, claim = _claim(shard_plan)
+        if shard_id is None:
+            break
+        if on_shard is not None:
+            on_shard(shard_id, shard_plan.shards[shard_id][0])
+        finished = run_shard(shard_plan, shard_id, stop_event, on_error, on_progress, metrics, scan_filter,
+                             fd_relative, throttle)
+        todo = os.path.join(workdir, "todo", f"{shard_id:06d}")
+        if claim is not None:
+            if finished:
+                os.remove(claim)
+            else:
+                os.rename(claim, todo)
+        elif finished:
+            # Off the queue too
+            try:
+                os.remove(todo)
+            except FileNotFoundError:
+                pass
+        done += finished
+    return done
+
+
+def requeue(workdir):
+    """Puts unfinished claimed shards back on the queue (after a host died); returns how many."""
+    shard_plan = ShardPlan.load(workdir)
+    count = 0
+    for name in shard_plan.claimed():
+        shard_id = int(name.split(".", 1)[0])
+        claim = os.path.join(workdir, "claimed", name)
+        if shard_plan.done(shard_id):
+            os.remove(claim)
+        else:
+            os.rename(claim, os.path.join(workdir, "todo", f"{shard_id:06d}"))
+            count += 1
+    return count
+
+
+# --- Merging ---
+
+def merge(workdir):
+    """Yields the ScanResults of the whole scan, in the order scan_engine.scan() yields them.
+
+    Shard totals are rolled up into the folders above the shards, which are
+    matched here. ValueError if some shards are not finished yet.
+    """
+    shard_plan = ShardPlan.load(workdir)
+    missing = shard_plan.missing()
+    if missing:
+        raise ValueError(f"{len(missing)} of {len(shard_plan.shards)} shards are not finished"
+                         f" (first: {shard_plan.shards[missing[0]][0]})")
+    criteria = shard_plan.criteria
+    shard_dates = {path: _Dates(mtime, ctime) for path, mtime, ctime in shard_plan.shards}
+    shard_ids = {path: shard_id for shard_id, (path, _, _) in enumerate(shard_plan.shards)}
+
+    def load_part(path):
+        with open(shard_plan.part_path(shard_ids[path]), encoding="utf-8") as f:
+            part = json.load(f)
+        return part["total"], [scan_engine.ScanResult(*match) for match in part["matches"]], part["newest"]
+
+    # Post-order, like parallel_aggregate's fold; returns (total, newest activity)
+    def fold(path):
+        _, _, own_bytes, children, newest = shard_plan.folders[path]
+        total = own_bytes
+        for child_path in children:
+            if child_path in shard_plan.folders:
+                child_total, child_newest = yield from fold(child_path)
+                child_stat = _Dates(*shard_plan.folders[child_path][:2])
+            else:
+                child_total, matches, child_newest = load_part(child_path)
+                yield from matches
+                child_stat = shard_dates[child_path]
+            if child_newest is not None:
+                child_stat = scan_engine.Activity(child_newest, child_newest)
+                if newest is not None and child_newest > newest:
+                    newest = child_newest
+            result = scan_engine._check_folder(child_path, child_stat, child_total, criteria)
+            if result is not None:
+                yield result
+            total += child_total
+        return total, newest
+
+    yield from fold(shard_plan.root)
+
+
+# --- Command Line ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m scan_shard",
+        description="Split one scan over several processes or hosts that mount the same share.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    default_date = (datetime.now() - timedelta(days=365)).strftime("%d-%m-%Y")
+    plan_parser = commands.add_parser("plan", help="list the shards of ROOT into the work folder WORKDIR")
+    plan_parser.add_argument("root", help="folder to scan, mounted at the same path on every host")
+    plan_parser.add_argument("workdir", help="new work folder, on storage every host can write to")
+    plan_parser.add_argument("--mode", choices=("dormant", "recent"), default="dormant",
+                             help="dormant: modified before DATE; recent: created after DATE (default: dormant)")
+    plan_parser.add_argument("--date", default=default_date,
+                             help="reference date as dd-mm-yyyy (default: one year ago)")
+    plan_parser.add_argument("--size-mb", type=int, default=1024,
+                             help="report folders larger than this many MB (default: 1024)")
+    plan_parser.add_argument("--min-shards", type=int, default=0, metavar="N",
+                             help="split deeper than the top-level folders until there are at least N shards")
+    plan_parser.add_argument("--allocated", action="store_true",
+                             help="count allocated disk space (st_blocks) instead of apparent file size")
+    plan_parser.add_argument("--activity", nargs="?", const="mtime", choices=tuple(scan_engine.ACTIVITY_KEYS),
+                             metavar="STAMP", help="date each folder by the newest STAMP of anything inside it")
+    plan_parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                             help="don't walk folders matching PATTERN; repeatable")
+    plan_parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                             help="walk folders matching PATTERN even if an --exclude matches them; repeatable")
+    plan_parser.add_argument("-x", "--one-file-system", action="store_true",
+                             help="don't walk into folders on other file systems (mount points)")
+
+    run_parser = commands.add_parser("run", help="walk shards of WORKDIR; start one per host or process")
+    run_parser.add_argument("workdir")
+    run_parser.add_argument("--shard", metavar="I/N",
+                            help="walk the static share I of N (0-based) instead of claiming from the work queue")
+    run_parser.add_argument("--fd-relative", action="store_true",
+                            help="stat files relative to open folders (Linux/POSIX)")
+    run_parser.add_argument("--throttle", type=float, metavar="OPS",
+                            help="at most OPS directory reads and stat calls per second on this host")
+    run_parser.add_argument("--max-concurrency", type=int, metavar="N",
+                            help="list at most N folders at the same time")
+    run_parser.add_argument("--target-latency-ms", type=float, metavar="MS",
+                            help="slow down while a stat takes longer than MS milliseconds on average")
+    run_parser.add_argument("-q", "--quiet", action="store_true", help="don't print skipped folders to stderr")
+
+    status_parser = commands.add_parser("status", help="show how many shards are done, claimed and left")
+    status_parser.add_argument("workdir")
+    requeue_parser = commands.add_parser("requeue", help="put shards claimed by dead hosts back on the queue")
+    requeue_parser.add_argument("workdir")
+
+    merge_parser = commands.add_parser("merge", help="combine the finished shards into one report")
+    merge_parser.add_argument("workdir")
+    merge_parser.add_argument("-o", "--output", help="write results to this file instead of stdout")
+    merge_parser.add_argument("--format", choices=("txt", "csv", "jsonl", "html"),
+                              help="report format (default: from the --output extension, else txt)")
+    args = parser.parse_args(argv)
+
+    def on_error(error):
+        if not getattr(args, "quiet", False):
+            print(f"Skipped: {error}", file=sys.stderr)
+
+    if args.command == "plan":
+        if not os.path.isdir(args.root):
+            parser.error(f"not a folder: {args.root}")
+        if args.size_mb <= 0:
+            parser.error("--size-mb must be a positive number")
+        try:
+            reference_epoch = scan_engine.parse_date(args.date)
+        except ValueError:
+            parser.error("invalid --date, please use dd-mm-yyyy")
+        try:
+            shard_plan = plan(args.workdir, os.path.abspath(args.root), args.mode, reference_epoch,
+                              args.size_mb * 1024 * 1024, args.min_shards, args.allocated, args.exclude,
+                              args.include, args.one_file_system, args.activity, on_error,
+                              extra={"size_mb": args.size_mb, "date": args.date})
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        print(f"{len(shard_plan.shards)} shard(s) below {len(shard_plan.folders)} folder(s) planned in"
+              f" {args.workdir}", file=sys.stderr)
+        return 0
+
+    try:
+        shard_plan = ShardPlan.load(args.workdir)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(f"no usable shard plan in {args.workdir}: {e}")
+
+    if args.command == "status":
+        done = len(shard_plan.shards) - len(shard_plan.missing())
+        claimed = shard_plan.claimed()
+        print(f"{done} of {len(shard_plan.shards)} shard(s) done, {len(claimed)} claimed")
+        for name in claimed:
+            print(f"  claimed: {name}")
+        return 0
+
+    if args.command == "requeue":
+        print(f"{requeue(args.workdir)} shard(s) back on the queue", file=sys.stderr)
+        return 0
+
+    if args.command == "run":
+        partition = None
+        if args.shard:
+            try:
+                index, count = (int(n) for n in args.shard.split("/"))
+                if not 0 <= index < count:
+                    raise ValueError
+            except ValueError:
+                parser.error("--shard must be I/N with 0 <= I < N")
+            partition = (index, count)
+        throttle = scan_engine.ScanThrottle(args.throttle, args.max_concurrency, args.target_latency_ms)
+        metrics = scan_engine.ScanMetrics()
+        started = time.perf_counter()
+        stop_event = threading.Event()
+
+        # First Ctrl+C stops cleanly and puts the current shard back on the queue, a second one aborts
+        def on_interrupt(signum, frame):
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            print("Stopping... (Ctrl+C again to abort, then run 'requeue')", file=sys.stderr)
+            stop_event.set()
+        signal.signal(signal.SIGINT, on_interrupt)
+        try:
+            count = run(args.workdir, partition, stop_event, on_error, metrics=metrics,
+                        on_shard=lambda shard_id, path: print(f"Shard {shard_id}: {path}", file=sys.stderr),
+                        fd_relative=args.fd_relative, throttle=throttle if throttle.active else None)
+        except KeyboardInterrupt:
+            return 130
+        print(f"{count} shard(s) done in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+        print(metrics.status_line(), file=sys.stderr)
+        return 0
+
+    # merge
+    import scan_export
+    params = shard_plan.params
+    exporter_cls = scan_export.EXPORTERS[args.format] if args.format else scan_export.exporter_for(args.output)
+    exporter = exporter_cls(args.output or sys.stdout, params["mode"], params.get("size_mb", 0), "Custom",
+                            params.get("date", ""), activity=params["activity"])
+    try:
+        for result in merge(args.workdir):
+            exporter.write(result)
+    except ValueError as e:
+        print(f"Cannot merge: {e}", file=sys.stderr)
+        return 1
+    finally:
+        exporter.close()
+    print(f"{exporter.count} folder(s) found in {len(shard_plan.shards)} shard(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,454 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Snapshots: every folder of a complete scan, with exact byte counts and
+# dates, in a compact binary file, and a diff of two snapshots to track
+# growth from one scan to the next. Text and HTML reports round sizes and
+# only hold the matches, so they can't be compared reliably.
+#
+# File layout (little-endian, every section starts on an 8-byte boundary):
+#   header    magic, version, folder count, section sizes, creation time
+#   root      the scanned folder, UTF-8
+#   meta      JSON: the scan settings (size accounting, dating, excludes)
+#   offsets   (count + 1) uint64: folder i's key is names[offsets[i]:offsets[i + 1]]
+#   sizes     count int64, subtree bytes
+#   files     count int64, subtree files
+#   mtimes    count float64
+#   ctimes    count float64
+#   names     the keys: paths relative to root, components joined by NUL,
+#             sorted bytewise. NUL sorts before every other byte, so each
+#             folder's subtree directly follows it (pre-order).
+# The columns are read in place from an mmap, so opening a snapshot of any
+# size costs no parsing and no copies.
+
+import os
+import sys
+import json
+import mmap
+import time
+import heapq
+import struct
+import argparse
+from array import array
+from typing import NamedTuple
+
+MAGIC = b"FLOSNAP\0"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sI4xQQQQd8x")  # magic, version, count, names, root, meta bytes, created
+_SEP = b"\0"
+
+
+def _padded(n):
+    return (n + 7) & ~7
+
+
+# --- Writing ---
+
+META_KEYS = ("allocated", "dedupe_hardlinks", "exclude", "include", "one_file_system")
+
+
+def snapshot_meta(scan_args):
+    """The scan_engine.scan() settings that change folder sizes, as snapshot meta."""
+    return {key: scan_args.get(key) for key in META_KEYS}
+
+
+_CHUNK = 65536  # rows per write
+
+
+def _snapshot_order(table):
+    """The rows of a complete ScanTable in snapshot order, and each one's key length.
+
+    Snapshot order is pre-order with sub-folders sorted by name: since NUL
+    sorts first, that is the bytewise order of the keys, found without ever
+    building them. Costs 12 bytes per folder instead of a path each.
+    """
+    starts = table.starts
+    names = table.names
+    name_ends = table.name_ends
+    order = array("i")
+    key_lengths = array("q", bytes(8 * len(table)))
+
+    def name(row):
+        return bytes(names[name_ends[row - 1] if row else 0:name_ends[row]])
+
+    # Post-order: the root is the last row, a folder's last child the row
+    # just before it, and each child's previous sibling the row before its subtree
+    stack = [len(table) - 1]
+    while stack:
+        row = stack.pop()
+        order.append(row)
+        prefix = key_lengths[row] + 1 if key_lengths[row] else 0
+        children = []
+        child = row - 1
+        while child >= starts[row]:
+            children.append(child)
+            key_lengths[child] = prefix + name_ends[child] - (name_ends[child - 1] if child else 0)
+            child = starts[child] - 1
+        if len(children) > 1:
+            children.sort(key=name, reverse=True)
+        stack.extend(children)
+    return order, key_lengths
+
+
+def _keys(table, order):
+    """Yields the keys of the rows in snapshot order, keeping only the current path's."""
+    parents = table.parents
+    names = table.names
+    name_ends = table.name_ends
+    path = []  # (row, key) from the root down to the last row written
+    for row in order:
+        parent = parents[row]
+        if parent < 0:
+            key = b""
+        else:
+            while path[-1][0] != parent:
+                path.pop()
+            parent_key = path[-1][1]
+            name = bytes(names[name_ends[row - 1] if row else 0:name_ends[row]])
+            key = parent_key + _SEP + name if parent_key else name
+        path.append((row, key))
+        yield key
+
+
+def _write_padded(f, written):
+    f.write(b"\0" * (_padded(written) - written))
+
+
+def write_snapshot(path, table, meta=None, created=None):
+    """Writes every folder of a complete scan_engine.ScanTable to path (atomically).
+
+    meta: a JSON-able dict of the scan settings, compared by diff().
+    Columns and keys are streamed in chunks, so the memory needed on top of
+    the table is 12 bytes per folder plus one chunk.
+    """
+    if not table.complete:
+        raise ValueError("the folder table is incomplete (the scan was stopped or resumed)")
+    order, key_lengths = _snapshot_order(table)
+    count = len(order)
+    names_bytes = sum(key_lengths)
+    root = os.fsencode(table.root)
+    meta = json.dumps(meta or {}).encode("utf-8")
+
+    def write_column(f, typecode, values):
+        for start in range(0, len(values), _CHUNK):
+            chunk = array(typecode, values[start:start + _CHUNK])
+            if sys.byteorder != "little":
+                chunk.byteswap()
+            f.write(chunk.tobytes())
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, count, names_bytes, len(root), len(meta),
+                             time.time() if created is None else created))
+        for section in (root, meta):
+            f.write(section)
+            _write_padded(f, len(section))
+        offsets = array("Q", [0])
+        end = 0
+        for start in range(0, count, _CHUNK):
+            for row in order[start:start + _CHUNK]:
+                end += key_lengths[row]
+                offsets.append(end)
+            write_column(f, "Q", offsets)
+            offsets = array("Q")
+        for typecode, column in (("q", table.totals), ("q", table.files), ("d", table.mtimes),
+                                 ("d", table.ctimes)):
+            for start in range(0, count, _CHUNK):
+                write_column(f, typecode, [column[row] for row in order[start:start + _CHUNK]])
+        buffer = bytearray()
+        for key in _keys(table, order):
+            buffer += key
+            if len(buffer) >= _CHUNK * 16:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
+        _write_padded(f, names_bytes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+# --- Reading ---
+
+class Snapshot:
+    """A snapshot file, mapped read-only. Columns are indexed by folder, in key order.
+
+    sizes / files (int) and mtimes / ctimes (float) are memoryviews into the
+    file (copies on big-endian machines). Use it as a context manager, or
+    close() it: the file stays mapped until then.
+    """
+
+    def __init__(self, path):
+        self.filename = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"not a snapshot: {path} is empty")
+        try:
+            self._load()
+        except Exception:
+            self.close()
+            raise
+
+    def _load(self):
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f"not a snapshot: {self.filename}")
+        magic, version, count, names_bytes, root_bytes, meta_bytes, self.created = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"not a snapshot: {self.filename}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot version: {version}")
+        self.count = count
+        expected = (_HEADER.size + _padded(root_bytes) + _padded(meta_bytes) + 8 * (count + 1) + 4 * 8 * count
+                    + _padded(names_bytes))
+        if len(self._map) < expected:
+            raise ValueError(f"snapshot is truncated: {self.filename}")
+        self._views = []
+        view = memoryview(self._map)
+        self._views.append(view)
+        offset = _HEADER.size
+
+        def section(nbytes):
+            nonlocal offset
+            part = view[offset:offset + nbytes]
+            self._views.append(part)
+            offset += _padded(nbytes)
+            return part
+
+        def column(typecode, items):
+            part = section(8 * items)
+            if sys.byteorder == "little":
+                part = part.cast(typecode)
+                self._views.append(part)
+                return part
+            values = array(typecode, part.tobytes())
+            values.byteswap()
+            return values
+
+        self.root = os.fsdecode(section(root_bytes).tobytes())
+        self.meta = json.loads(section(meta_bytes).tobytes().decode("utf-8"))
+        self._offsets = column("Q", count + 1)
+        self.sizes = column("q", count)
+        self.files = column("q", count)
+        self.mtimes = column("d", count)
+        self.ctimes = column("d", count)
+        self._names = section(names_bytes)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # Views first: a mapping with live exports can't be closed
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        self._map.close()
+
+    def key(self, i):
+        return self._names[self._offsets[i]:self._offsets[i + 1]].tobytes()
+
+    def path(self, i, root=None):
+        """Folder i's path, below root (default: the snapshot's own)."""
+        key = self.key(i)
+        root = self.root if root is None else root
+        return os.path.join(root, *os.fsdecode(key).split("\0")) if key else root
+
+    def find(self, path):
+        """Index of path, or None (binary search)."""
+        relative = os.path.relpath(path, self.root)
+        key = b"" if relative == os.curdir else os.fsencode(relative).replace(os.sep.encode(), _SEP)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.count and self.key(lo) == key else None
+
+    @property
+    def total(self):
+        """The root's size (key b"" sorts first)."""
+        return self.sizes[0] if self.count and not self.key(0) else 0
+
+
+# --- Diff ---
+
+class FolderChange(NamedTuple):
+    """A folder's size in the old and the new snapshot (0 where it doesn't exist)."""
+    path: str
+    old_size: int
+    new_size: int
+
+    @property
+    def delta(self):
+        return self.new_size - self.old_size
+
+
+class SnapshotDiff(NamedTuple):
+    old_total: int
+    new_total: int
+    growers: list         # FolderChanges of folders in both, largest growth first
+    shrinkers: list       # ... largest shrinkage first
+    added: list           # new folders (outermost only), largest first
+    removed: list         # deleted folders (outermost only), largest first
+    added_count: int
+    removed_count: int
+    added_bytes: int      # in the outermost new folders
+    reclaimed_bytes: int  # in the outermost deleted folders
+
+
+def _push(heap, top, item):
+    # Keeps the top largest items
+    if len(heap) < top:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def diff(old, new, top=20):
+    """Compares two Snapshots in one streaming merge-join over their sorted keys.
+
+    Only the top largest changes of each kind are kept, so memory doesn't
+    grow with the snapshots. Folders are matched by their path below each
+    snapshot's root, and reported under the new root. New and deleted
+    folders count once per outermost one: a deleted tree is one entry.
+    """
+    growers, shrinkers, added, removed = [], [], [], []
+    added_count = removed_count = added_bytes = reclaimed_bytes = 0
+    added_below = removed_below = None  # key prefix of the last outermost new / deleted folder
+    old_count, new_count = len(old), len(new)
+    i = j = 0
+    old_key = old.key(0) if old_count else None
+    new_key = new.key(0) if new_count else None
+    while old_key is not None or new_key is not None:
+        if new_key is None or (old_key is not None and old_key < new_key):
+            if removed_below is None or not old_key.startswith(removed_below):
+                size = old.sizes[i]
+                removed_count += 1
+                reclaimed_bytes += size
+                _push(removed, top, (size, -i))
+                removed_below = old_key + _SEP if old_key else b""
+            i += 1
+            old_key = old.key(i) if i < old_count else None
+        elif old_key is None or new_key < old_key:
+            if added_below is None or not new_key.startswith(added_below):
+                size = new.sizes[j]
+                added_count += 1
+                added_bytes += size
+                _push(added, top, (size, -j))
+                added_below = new_key + _SEP if new_key else b""
+            j += 1
+            new_key = new.key(j) if j < new_count else None
+        else:
+            delta = new.sizes[j] - old.sizes[i]
+            if new_key:  # the root's change is the net growth
+                if delta > 0:
+                    _push(growers, top, (delta, -j, i))
+                elif delta < 0:
+                    _push(shrinkers, top, (-delta, -j, i))
+            i += 1
+            j += 1
+            old_key = old.key(i) if i < old_count else None
+            new_key = new.key(j) if j < new_count else None
+
+    def changes(heap, both):
+        ordered = sorted(heap, reverse=True)
+        if both:
+            return [FolderChange(new.path(-item[1]), old.sizes[item[2]], new.sizes[-item[1]]) for item in ordered]
+        return ordered
+
+    return SnapshotDiff(
+        old.total, new.total, changes(growers, True), changes(shrinkers, True),
+        [FolderChange(new.path(-j), 0, size) for size, j in sorted(added, reverse=True)],
+        [FolderChange(old.path(-i, new.root), size, 0) for size, i in sorted(removed, reverse=True)],
+        added_count, removed_count, added_bytes, reclaimed_bytes)
+
+
+# --- Command Line ---
+
+def _mb(nbytes, sign=""):
+    return f"{nbytes / (1024*1024):{sign},.2f} MB"
+
+
+def format_diff(result, old, new):
+    """The diff as report lines."""
+    def stamp(snapshot):
+        return time.strftime("%d-%m-%Y %H:%M", time.localtime(snapshot.created))
+
+    lines = [f"Snapshot Diff - {new.root}",
+             f"Old: {stamp(old)} ({len(old):,} folders, {_mb(result.old_total)})",
+             f"New: {stamp(new)} ({len(new):,} folders, {_mb(result.new_total)})",
+             f"Net Growth: {_mb(result.new_total - result.old_total, '+')}",
+             f"New Folders: {result.added_count:,} ({_mb(result.added_bytes, '+')})",
+             f"Deleted Folders: {result.removed_count:,} ({_mb(result.reclaimed_bytes)} reclaimed)"]
+    if old.meta != new.meta:
+        lines.append(f"Warning: the scans used different settings ({old.meta} vs {new.meta})")
+    sections = [("Top Growers", result.growers, True), ("Top Shrinkers", result.shrinkers, True),
+                ("Largest New Folders", result.added, False), ("Largest Deleted Folders", result.removed, False)]
+    for title, changes, both in sections:
+        if not changes:
+            continue
+        lines += ["", title + ":"]
+        for change in changes:
+            line = f"  {_mb(change.delta, '+'):>16}  {change.path}"
+            if both:
+                line += f"  ({_mb(change.old_size)} -> {_mb(change.new_size)})"
+            lines.append(line)
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m scan_snapshot",
+        description="Compare folder snapshots (python -m scan_engine ROOT --snapshot FILE) to track growth.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    diff_parser = commands.add_parser("diff", help="what grew, shrank, appeared and disappeared from OLD to NEW")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--top", type=int, default=20, help="changes listed per section (default: 20)")
+    diff_parser.add_argument("-o", "--output", help="write the report to this file instead of stdout")
+    info_parser = commands.add_parser("info", help="show what a snapshot holds")
+    info_parser.add_argument("snapshot")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "info":
+            with Snapshot(args.snapshot) as snapshot:
+                print(f"Root: {snapshot.root}")
+                print(f"Created: {time.strftime('%d-%m-%Y %H:%M', time.localtime(snapshot.created))}")
+                print(f"Folders: {len(snapshot):,}")
+                print(f"Total: {_mb(snapshot.total)}")
+                print(f"Settings: {json.dumps(snapshot.meta)}")
+            return 0
+
+        if args.top <= 0:
+            parser.error("--top must be a positive number")
+        with Snapshot(args.old) as old, Snapshot(args.new) as new:
+            started = time.perf_counter()
+            lines = format_diff(diff(old, new, args.top), old, new)
+            elapsed = time.perf_counter() - started
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    text = "\n".join(lines) + "\n"
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    print(f"Compared in {elapsed:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
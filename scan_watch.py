@@ -0,0 +1,371 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# Watch mode: the tree is summed once, then kept current from file system
+# change events instead of being scanned again. Each changed folder is
+# listed again on its own and the difference in its size is carried up to
+# the root, so a refresh costs work in proportion to what changed.
+# Linux inotify is used through ctypes; elsewhere, and for folders beyond
+# the inotify watch limit, folder timestamps are polled.
+
+import os
+import sys
+import errno
+import struct
+import ctypes
+import ctypes.util
+from typing import NamedTuple
+
+import scan_engine
+
+
+class WatchChanges(NamedTuple):
+    """What one refresh changed in the set of matching folders."""
+    added: list    # ScanResults that match now and didn't before
+    removed: list  # paths that no longer match (or no longer exist)
+    changed: list  # ScanResults that still match, with a new size or date
+
+
+# --- inotify ---
+# Constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+
+# Anything that can change a folder's own files, sub-folders or dates
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len; the name follows
+
+
+class Inotify:
+    """Minimal ctypes binding of Linux inotify, non-blocking.
+
+    Raises OSError when inotify is not available (other systems, or the
+    per-user instance limit is reached).
+    """
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """Watch descriptor for path; OSError(ENOSPC) once fs.inotify.max_user_watches is used up."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        return wd
+
+    def rm_watch(self, wd):
+        # Fails harmlessly if the kernel already dropped the watch (folder deleted)
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Pending events as (wd, mask, cookie, name) tuples; [] if there are none."""
+        events = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, cookie, name))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+# --- Folder Watcher ---
+
+class _Folder:
+    """One folder of the watched tree."""
+
+    __slots__ = ("parent", "stat", "own_bytes", "total", "children", "wd")
+
+    def __init__(self, parent, dir_stat, own_bytes, children):
+        self.parent = parent          # parent's path, None for the root
+        self.stat = dir_stat          # lstat, dates the folder for matching
+        self.own_bytes = own_bytes    # files directly in the folder
+        self.total = own_bytes        # whole subtree
+        self.children = children     # set of sub-folder paths
+        self.wd = None                # inotify watch, None if polled
+
+
+class FolderWatcher:
+    """Keeps the matches of one scan current as the tree under root changes.
+
+    mode / reference_epoch / limit_bytes are scan_engine.scan()'s criteria;
+    allocated and exclude / include / one_file_system work as there too
+    (hard-link dedupe and activity dating need a full walk and aren't
+    supported). throttle is an optional scan_engine.ScanThrottle that paces
+    the listings. start() sums the tree once; every refresh() then lists only
+    the folders that changed since the previous one and returns the
+    WatchChanges. use_inotify=False (or a system without inotify) polls
+    every folder's timestamps instead, which finds added, removed and
+    renamed entries but not files edited in place.
+    """
+
+    def __init__(self, root, mode, reference_epoch, limit_bytes, on_error=None, allocated=False,
+                 exclude=(), include=(), one_file_system=False, use_inotify=True, throttle=None):
+        self.root = root
+        self.criteria = (mode, reference_epoch, limit_bytes)
+        self.on_error = on_error
+        self.accounting = scan_engine.SizeAccounting(allocated) if allocated else None
+        self.scan_filter = None
+        self.throttle = throttle
+        self._filter_args = (exclude, include, one_file_system)
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify()
+            except OSError:
+                pass  # polled
+        self.watch_limit_reached = False
+        self._folders = {}   # path -> _Folder
+        self._wds = {}       # inotify watch -> path
+        self._polled = {}    # path -> (st_mtime_ns, st_ctime_ns) of folders without a watch
+        self._found = {}     # path -> ScanResult of the current matches
+        self._dirty = set()
+
+    @property
+    def backend(self):
+        if self.inotify is None:
+            return "polling"
+        return "inotify + polling" if self._polled else "inotify"
+
+    @property
+    def folder_count(self):
+        return len(self._folders)
+
+    @property
+    def polled_count(self):
+        return len(self._polled)
+
+    def start(self, stop_event=None):
+        """Sums the tree (as long as a serial scan); returns the matches, or None if stopped."""
+        exclude, include, one_file_system = self._filter_args
+        if exclude or include or one_file_system:
+            root_dev = os.stat(self.root).st_dev if one_file_system else None
+            self.scan_filter = scan_engine.ScanFilter(self.root, exclude, include, root_dev)
+        touched = set()
+        self._load(self.root, os.lstat(self.root), None, touched, stop_event)
+        if stop_event is not None and stop_event.is_set():
+            return None
+        self._match(touched)
+        return self.results()
+
+    def results(self):
+        """The current matches, by path."""
+        return [self._found[path] for path in sorted(self._found)]
+
+    def refresh(self):
+        """Applies what changed since the last refresh; returns the WatchChanges."""
+        if self.inotify is not None:
+            for wd, mask, cookie, name in self.inotify.read_events():
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: every folder has to be checked again
+                    self._dirty.update(self._folders)
+                    continue
+                path = self._wds.get(wd)
+                if path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # The kernel dropped the watch (folder gone); the number may be reused
+                    del self._wds[wd]
+                    folder = self._folders.get(path)
+                    if folder is not None and folder.wd == wd:
+                        folder.wd = None
+                    continue
+                self._dirty.add(path)
+        for path, stamps in list(self._polled.items()):
+            try:
+                st = os.lstat(path)
+            except OSError:
+                self._dirty.add(self._folders[path].parent or path)
+                continue
+            if (st.st_mtime_ns, st.st_ctime_ns) != stamps:
+                self._dirty.add(path)
+
+        touched = set()
+        removed = []
+        # Parents first: a folder a parent no longer has needs no listing of its own
+        for path in sorted(self._dirty, key=lambda p: p.count(os.sep)):
+            if path in self._folders:
+                self._relist(path, touched, removed)
+        self._dirty.clear()
+        return self._match(touched, removed)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def changes(self, stop_event, interval=2.0):
+        """Yields the WatchChanges of a refresh every interval seconds, when there are any, until stop_event."""
+        while not stop_event.wait(interval):
+            changes = self.refresh()
+            if changes.added or changes.removed or changes.changed:
+                yield changes
+
+    # --- Tree Updates ---
+
+    def _watch(self, path, folder):
+        if self.inotify is not None and not self.watch_limit_reached:
+            try:
+                folder.wd = self.inotify.add_watch(path)
+                self._wds[folder.wd] = path
+                return
+            except OSError as e:
+                if e.errno != errno.ENOSPC:
+                    raise
+                # Out of watches: the rest of the tree is polled
+                self.watch_limit_reached = True
+                if self.on_error is not None:
+                    self.on_error(OSError(e.errno, "inotify watch limit reached (fs.inotify.max_user_watches),"
+                                          " polling the remaining folders", path))
+        st = folder.stat
+        self._polled[path] = (st.st_mtime_ns, st.st_ctime_ns)
+
+    def _unwatch(self, path, folder):
+        # A folder moved elsewhere in the tree keeps its watch: loading it at
+        # the new path got the same wd back and re-pointed it there
+        if folder.wd is not None and self._wds.get(folder.wd) == path:
+            del self._wds[folder.wd]
+            if self.inotify is not None:
+                self.inotify.rm_watch(folder.wd)
+        self._polled.pop(path, None)
+
+    def _load(self, path, dir_stat, parent, touched, stop_event=None):
+        """Sums a new subtree into the tree; returns its total (0 if it can't be read)."""
+        order = []
+        stack = [(path, dir_stat, parent)]
+        while stack:
+            if stop_event is not None and stop_event.is_set():
+                break
+            dir_path, dir_stat, parent_path = stack.pop()
+            folder = _Folder(parent_path, dir_stat, 0, set())
+            try:
+                # Watched before it is listed, so nothing changed in between is missed
+                self._watch(dir_path, folder)
+                own_bytes, _, subdirs = scan_engine.scan_directory(dir_path, stop_event, self.accounting,
+                                                                   scan_filter=self.scan_filter,
+                                                                   throttle=self.throttle)
+            except OSError as e:
+                self._unwatch(dir_path, folder)
+                if self.on_error is not None:
+                    self.on_error(e)
+                continue
+            folder.own_bytes = folder.total = own_bytes
+            self._folders[dir_path] = folder
+            if parent_path is not None and parent_path in self._folders:
+                self._folders[parent_path].children.add(dir_path)
+            order.append(dir_path)
+            touched.add(dir_path)
+            stack.extend((child_path, child_stat, dir_path) for child_path, child_stat in reversed(subdirs))
+        # Pre-order reversed: every folder comes after all of its sub-folders
+        for dir_path in reversed(order):
+            folder = self._folders[dir_path]
+            if folder.parent is not None and dir_path != path:
+                self._folders[folder.parent].total += folder.total
+        return self._folders[path].total if path in self._folders else 0
+
+    def _drop(self, path, touched, removed):
+        """Removes a subtree from the tree; returns its total."""
+        total = self._folders[path].total
+        stack = [path]
+        while stack:
+            dir_path = stack.pop()
+            folder = self._folders.pop(dir_path)
+            self._unwatch(dir_path, folder)
+            touched.discard(dir_path)
+            if dir_path in self._found:
+                removed.append(dir_path)
+                del self._found[dir_path]
+            stack.extend(folder.children)
+        return total
+
+    def _relist(self, path, touched, removed):
+        folder = self._folders[path]
+        try:
+            dir_stat = os.lstat(path)
+            own_bytes, _, subdirs = scan_engine.scan_directory(path, None, self.accounting,
+                                                               scan_filter=self.scan_filter, throttle=self.throttle)
+        except OSError as e:
+            if folder.parent is not None:
+                if not isinstance(e, FileNotFoundError) and self.on_error is not None:
+                    # Still there but unreadable: it keeps its last totals
+                    self.on_error(e)
+                # Gone or moved away: the parent's listing drops it
+                self._dirty.discard(path)
+                self._relist(folder.parent, touched, removed)
+                return
+            if self.on_error is not None:
+                self.on_error(e)
+            dir_stat, own_bytes, subdirs = folder.stat, 0, []
+        delta = own_bytes - folder.own_bytes
+        listed = dict(subdirs)
+        for child_path in folder.children - listed.keys():
+            delta -= self._drop(child_path, touched, removed)
+        folder.children &= listed.keys()
+        for child_path in listed.keys() - folder.children:
+            delta += self._load(child_path, listed[child_path], path, touched)
+        folder.stat = dir_stat
+        folder.own_bytes = own_bytes
+        if path in self._polled:
+            self._polled[path] = (dir_stat.st_mtime_ns, dir_stat.st_ctime_ns)
+        # Up the ancestor chain: only these totals change
+        while path is not None:
+            folder = self._folders[path]
+            folder.total += delta
+            touched.add(path)
+            path = folder.parent
+
+    def _match(self, touched, removed=None):
+        added = []
+        changed = []
+        removed = [] if removed is None else removed
+        for path in touched:
+            folder = self._folders.get(path)
+            if folder is None:
+                continue
+            result = None
+            if path != self.root:
+                result = scan_engine._check_folder(path, folder.stat, folder.total, self.criteria)
+            old = self._found.get(path)
+            if result is None:
+                if old is not None:
+                    del self._found[path]
+                    removed.append(path)
+            elif old is None:
+                self._found[path] = result
+                added.append(result)
+            elif old != result:
+                self._found[path] = result
+                changed.append(result)
+        return WatchChanges(sorted(added), sorted(removed), sorted(changed))
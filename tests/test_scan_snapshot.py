@@ -0,0 +1,57 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# write_snapshot streams folders in pre-order: the keys must still come out
+# sorted bytewise, so Snapshot.find's binary search works.
+# Run with: python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan_engine
+import scan_snapshot
+
+
+class SnapshotOrderTest(unittest.TestCase):
+
+    def test_keys_sorted(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        # "a/x" must sort before "a b" and "a-b" although "/" > " " and "-"
+        for path in ("a/x/y", "a/x b", "a b", "a-b/z", "ab", "B", "a/x/y2"):
+            os.makedirs(os.path.join(root, path))
+        # The walk sorts by str: a name that isn't UTF-8 (b"\xff" decodes to
+        # "\udcff") sorts before "\uffff" there, but after it as bytes
+        for name in (b"\xff", "\uffff".encode("utf-8")):
+            try:
+                os.mkdir(os.path.join(os.fsencode(root), name))
+            except (OSError, UnicodeError):
+                pass
+        with open(os.path.join(root, "a/x/y/f"), "wb") as f:
+            f.write(b"\0" * 100)
+        table = scan_engine.ScanTable()
+        for _ in scan_engine.scan(root, "recent", 0, 1, stop_event=threading.Event(), table=table):
+            pass
+        snapshot_path = os.path.join(root, "snap")
+        scan_snapshot.write_snapshot(snapshot_path, table)
+
+        with scan_snapshot.Snapshot(snapshot_path) as snapshot:
+            keys = [snapshot.key(i) for i in range(len(snapshot))]
+            self.assertEqual(keys, sorted(keys))
+            self.assertEqual(len(keys), len(set(keys)))
+            self.assertEqual(len(snapshot), len(table))
+            for i in range(len(snapshot)):
+                self.assertEqual(snapshot.find(snapshot.path(i)), i)
+            self.assertEqual(snapshot.sizes[snapshot.find(os.path.join(root, "a", "x", "y"))], 100)
+            self.assertEqual(snapshot.total, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+# Copyright (c) [2023] [Bora Noyan]
+# This file is part of [Find_Large_Old_Folders_Python].
+# Licensed under the GNU General Public License v3.0
+#
+# FolderWatcher must keep its totals equal to a fresh scan as the tree changes.
+# Run with: python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan_engine
+import scan_watch
+
+
+def _write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+
+
+def _scanned_total(root):
+    table = scan_engine.ScanTable()
+    for _ in scan_engine.scan(root, "recent", 0, 1, stop_event=threading.Event(), table=table):
+        pass
+    return table.totals[len(table) - 1]
+
+
+class CrossDirectoryMoveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for path in ("a/x/sub/deep", "b", "c"):
+            os.makedirs(os.path.join(self.root, path))
+        _write(os.path.join(self.root, "a/x/sub/f"), 2000000)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def check_moves(self, use_inotify):
+        watcher = scan_watch.FolderWatcher(self.root, "recent", 0, 1, use_inotify=use_inotify)
+        self.addCleanup(watcher.close)
+        if use_inotify and watcher.inotify is None:
+            self.skipTest("inotify is not available")
+        watcher.start()
+
+        def total():
+            return watcher._folders[self.root].total
+
+        # The destination's parent is shallower, so it is relisted before the source
+        os.rename(os.path.join(self.root, "a/x/sub"), os.path.join(self.root, "b/sub"))
+        watcher.refresh()
+        _write(os.path.join(self.root, "b/sub/g"), 3000000)
+        _write(os.path.join(self.root, "b/sub/deep/h"), 1000)
+        watcher.refresh()
+        self.assertEqual(total(), 5001000)
+        self.assertEqual(total(), _scanned_total(self.root))
+
+        # Same depth both sides
+        os.rename(os.path.join(self.root, "b/sub"), os.path.join(self.root, "c/sub"))
+        watcher.refresh()
+        _write(os.path.join(self.root, "c/sub/deep/i"), 7)
+        watcher.refresh()
+        self.assertEqual(total(), _scanned_total(self.root))
+        if watcher.inotify is not None:
+            self.assertEqual(set(watcher._wds.values()), set(watcher._folders))
+
+    def test_inotify(self):
+        self.check_moves(True)
+
+    def test_polling(self):
+        self.check_moves(False)
+
+
+class UnreadableFolderTest(unittest.TestCase):
+
+    def test_reported(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        os.makedirs(os.path.join(root, "a/b"))
+        errors = []
+        watcher = scan_watch.FolderWatcher(root, "recent", 0, 1, errors.append, use_inotify=False)
+        watcher.start()
+        scan_directory = scan_engine.scan_directory
+
+        def deny(path, *args, **kwargs):
+            if path == os.path.join(root, "a", "b"):
+                raise PermissionError(13, "Permission denied", path)
+            return scan_directory(path, *args, **kwargs)
+
+        _write(os.path.join(root, "a/b/f"), 10)
+        os.utime(os.path.join(root, "a/b"), ns=(0, 0))
+        with mock.patch.object(scan_engine, "scan_directory", deny):
+            watcher.refresh()
+        self.assertTrue(any(isinstance(e, PermissionError) for e in errors))
+
+
+if __name__ == "__main__":
+    unittest.main()